@@ -1,14 +1,22 @@
-from pydantic import Field
+from typing import Literal
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from dota2_notify.config import check_storage_settings
 from functools import cache
 
 class Settings(BaseSettings):
     telegram_bot_token: str = Field(..., alias='TELEGRAM__BOTTOKEN')
-    cosmosdb_endpoint_uri: str = Field(..., alias='COSMOSDB__ENDPOINTURI')
-    cosmosdb_primary_key: str = Field(..., alias='COSMOSDB__PRIMARYKEY')
-    cosmosdb_database_name: str = Field(..., alias='COSMOSDB__DATABASENAME')
-    cosmosdb_container_name: str = Field(..., alias='COSMOSDB__CONTAINERNAME')
-    cosmosdb_token_container_name: str = Field(..., alias='COSMOSDB__TOKENCONTAINERNAME')
+    # memory is only for local-stack, which runs all services in one process on a shared in-memory Cosmos DB
+    storage_backend: Literal["cosmos", "sqlite", "memory"] = Field("cosmos", alias="STORAGE__BACKEND")
+    sqlite_path: str = Field("dota2_notify.db", alias="STORAGE__SQLITEPATH")
+    cosmosdb_endpoint_uri: str = Field("", alias='COSMOSDB__ENDPOINTURI')
+    cosmosdb_primary_key: str = Field("", alias='COSMOSDB__PRIMARYKEY')
+    cosmosdb_database_name: str = Field("", alias='COSMOSDB__DATABASENAME')
+    cosmosdb_container_name: str = Field("", alias='COSMOSDB__CONTAINERNAME')
+    cosmosdb_token_container_name: str = Field("", alias='COSMOSDB__TOKENCONTAINERNAME')
+    # Named without the cosmosdb_ prefix, which marks settings required by the cosmos backend
+    cosmos_throttle_enabled: bool = Field(True, alias="COSMOSDB__THROTTLE__ENABLED")
+    cosmos_throttle_max_concurrency: int = Field(64, alias="COSMOSDB__THROTTLE__MAXCONCURRENCY")
     matchcheck_interval_minutes: int = Field(..., alias='MATCHCHECK__INTERVALMINUTES')
     matchcheck_enabled: bool = Field(..., alias='MATCHCHECK__ENABLED')
     steam_api_key: str = Field(..., alias='STEAM__APIKEY')
@@ -16,6 +24,17 @@ class Settings(BaseSettings):
     openapi_path: str = Field("/openapi.json", alias='OPENAPI__PATH')
     redis_host: str = Field(..., alias="REDIS__HOST")
     redis_port: int = Field(..., alias="REDIS__PORT")
+    user_cache_ttl_seconds: int = Field(3600, alias="USERCACHE__TTLSECONDS")
+    steam_rate_limit_capacity: int = Field(30, alias="STEAM__RATELIMIT__CAPACITY")
+    steam_rate_limit_refill_per_second: float = Field(1.0, alias="STEAM__RATELIMIT__REFILLPERSECOND")
+    http2_enabled: bool = Field(False, alias="HTTP__HTTP2ENABLED")
+    steam_max_connections: int = Field(20, alias="HTTP__STEAM__MAXCONNECTIONS")
+    cache_compression_threshold: int = Field(1024, alias="CACHE__COMPRESSIONTHRESHOLD")
+    cache_warmer_enabled: bool = Field(True, alias="CACHEWARMER__ENABLED")
+    cache_warmer_interval_seconds: float = Field(60.0, alias="CACHEWARMER__INTERVALSECONDS")
+    cache_warmer_max_refreshes_per_cycle: int = Field(20, alias="CACHEWARMER__MAXREFRESHESPERCYCLE")
+    friend_import_enabled: bool = Field(False, alias="FRIENDIMPORT__ENABLED")
+    friend_import_max_request_charge: float = Field(5000.0, alias="FRIENDIMPORT__MAXREQUESTCHARGE")
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -24,6 +43,10 @@ class Settings(BaseSettings):
         extra="ignore",
     )
 
+    @model_validator(mode="after")
+    def require_cosmosdb_settings(self):
+        return check_storage_settings(self)
+
 @cache
 def get_settings():
     return Settings()
\ No newline at end of file
@@ -1,15 +1,27 @@
 import redis.asyncio as redis
 from dota2_notify.app.config import get_settings
+from dota2_notify.config import MEMORY_BACKEND_ERROR
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from dota2_notify.web import auth, health, friends, static, notifications
 from azure.cosmos.aio import CosmosClient
+import asyncio
 import logging
 
 import httpx
 from dota2_notify.clients.cosmosdb_client import CosmosDbUserService 
+from dota2_notify.clients.cosmos_throttle import AdaptiveConcurrencyLimiter
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.clients.sqlite_user_store import SqliteUserStore
+from dota2_notify.clients.user_store import UserStore
 from dota2_notify.clients.telegram_client import TelegramClient
+from dota2_notify.clients.cache_codec import CompactCacheCodec
+from dota2_notify.clients.http_pools import UpstreamPools
 from dota2_notify.clients.steam_client import SteamClient
+from dota2_notify.clients.steam_cache_warmer import SteamCacheWarmer
+from dota2_notify.clients.steam_rate_limiter import SteamRateLimiter
+from dota2_notify.clients.telegram_token_store import RedisTelegramTokenStore
+from dota2_notify.clients.user_cache import RedisUserCache
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 logging.basicConfig(
@@ -22,18 +34,48 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 settings = get_settings()
 
+async def log_upstream_stats(steam_client: SteamClient, http_pools: UpstreamPools, db_client: UserStore, interval_seconds: float = 300.0):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        logging.info(f"Storage request stats: {db_client.request_stats()}")
+        logging.info(f"Steam request stats: {steam_client.request_stats()}")
+        logging.info(f"HTTP pool stats: {http_pools.stats()}")
+        logging.info(f"Steam cache codec stats: {steam_client.cache_codec.stats()}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     
-    cosmosdb_client = CosmosClient(settings.cosmosdb_endpoint_uri, settings.cosmosdb_primary_key)
-    db_client = CosmosDbUserService(
-        cosmosdb_client=cosmosdb_client,
-        database_name=settings.cosmosdb_database_name,
-        user_container_name=settings.cosmosdb_container_name,
-        telegram_verify_token_container_name=settings.cosmosdb_token_container_name
-    )    
+    redis_client = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    cache_codec = CompactCacheCodec(compression_threshold=settings.cache_compression_threshold)
+
+    if settings.storage_backend == "sqlite":
+        db_client = SqliteUserStore(settings.sqlite_path)
+    else:
+        concurrency_limiter = None
+        client_options = {}
+        if settings.cosmos_throttle_enabled:
+            concurrency_limiter = AdaptiveConcurrencyLimiter(max_limit=settings.cosmos_throttle_max_concurrency)
+            # Let the limiter handle 429s instead of the SDK retrying each request on its own
+            client_options["retry_throttle_total"] = 1
+        if settings.storage_backend == "memory":
+            # Set by local-stack before startup, shared with match-notify and data-sync
+            cosmosdb_client = getattr(app.state, "cosmosdb_client", None)
+            if cosmosdb_client is None:
+                raise RuntimeError(MEMORY_BACKEND_ERROR)
+        else:
+            cosmosdb_client = CosmosClient(settings.cosmosdb_endpoint_uri, settings.cosmosdb_primary_key, **client_options)
+        db_client = CosmosDbUserService(
+            cosmosdb_client=cosmosdb_client,
+            database_name=settings.cosmosdb_database_name,
+            user_container_name=settings.cosmosdb_container_name,
+            telegram_verify_token_container_name=settings.cosmosdb_token_container_name,
+            user_cache=RedisUserCache(redis_client, codec=cache_codec, ttl_seconds=settings.user_cache_ttl_seconds),
+            concurrency_limiter=concurrency_limiter
+        )    
     await db_client.connect()
     app.state.user_service = db_client
+    app.state.telegram_token_store = RedisTelegramTokenStore(redis_client)
+    app.state.follower_index = FollowerIndex(redis_client)
 
 
      # Create httpx client with event hooks to redact sensitive data from logs
@@ -46,19 +88,52 @@ async def lifespan(app: FastAPI):
     async def log_response(response):
         logging.info(f"HTTP Response: {response.status_code}")
     
-    http_client = httpx.AsyncClient(
+    http_pools = UpstreamPools(
+        limits={
+            UpstreamPools.STEAM_API: httpx.Limits(max_connections=settings.steam_max_connections, max_keepalive_connections=settings.steam_max_connections),
+            UpstreamPools.STEAM_OPENID: httpx.Limits(max_connections=5, max_keepalive_connections=2),
+        },
+        http2=settings.http2_enabled,
         event_hooks={'request': [log_request], 'response': [log_response]}
     )
-    redis_client = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
-    steam_client = SteamClient(api_key=settings.steam_api_key,client=http_client,redis_client=redis_client)
+    app.state.http_pools = http_pools
+    rate_limiter = SteamRateLimiter(
+        redis_client,
+        capacity=settings.steam_rate_limit_capacity,
+        refill_per_second=settings.steam_rate_limit_refill_per_second
+    )
+    steam_client = SteamClient(
+        api_key=settings.steam_api_key,
+        client=http_pools[UpstreamPools.STEAM_API],
+        openid_client=http_pools[UpstreamPools.STEAM_OPENID],
+        redis_client=redis_client,
+        rate_limiter=rate_limiter,
+        cache_codec=cache_codec
+    )
     app.state.steam_client = steam_client
 
+    warmer_task = None
+    if settings.cache_warmer_enabled:
+        cache_warmer = SteamCacheWarmer(
+            steam_client,
+            interval_seconds=settings.cache_warmer_interval_seconds,
+            max_refreshes_per_cycle=settings.cache_warmer_max_refreshes_per_cycle
+        )
+        app.state.steam_cache_warmer = cache_warmer
+        warmer_task = asyncio.create_task(cache_warmer.run())
+
+    await http_pools.prewarm()
+    stats_task = asyncio.create_task(log_upstream_stats(steam_client, http_pools, db_client))
+
     # pass control to the application
     yield
 
     # cleanup
+    if warmer_task:
+        warmer_task.cancel()
+    stats_task.cancel()
     await db_client.close()
-    await http_client.aclose()
+    await http_pools.aclose()
     await redis_client.aclose()
 
 app = FastAPI(lifespan=lifespan, openapi_url=settings.openapi_path)
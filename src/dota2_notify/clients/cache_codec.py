@@ -0,0 +1,132 @@
+import json
+from abc import ABC, abstractmethod
+import struct
+import time
+import zlib
+from typing import Any
+
+
+class CacheCodec(ABC):
+    """Converts cached values to and from the bytes stored in Redis."""
+
+    def __init__(self):
+        self._stats = {
+            "encoded": 0,
+            "decoded": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "encode_seconds": 0.0,
+            "decode_seconds": 0.0,
+        }
+
+    def encode(self, value: Any) -> bytes:
+        started = time.perf_counter()
+        raw_size, data = self._encode(value)
+        self._stats["encoded"] += 1
+        self._stats["bytes_in"] += raw_size
+        self._stats["bytes_out"] += len(data)
+        self._stats["encode_seconds"] += time.perf_counter() - started
+        return data
+
+    def decode(self, data: bytes | str) -> Any:
+        started = time.perf_counter()
+        value = self._decode(data.encode() if isinstance(data, str) else data)
+        self._stats["decoded"] += 1
+        self._stats["decode_seconds"] += time.perf_counter() - started
+        return value
+
+    def stats(self) -> dict:
+        """Encode/decode counters, including the bytes saved compared to plain JSON."""
+        stats = dict(self._stats)
+        stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+        return stats
+
+    @abstractmethod
+    def _encode(self, value: Any) -> tuple[int, bytes]:
+        """Encoded bytes of the value, with the size of the same value as plain JSON text."""
+        ...
+
+    @abstractmethod
+    def _decode(self, data: bytes) -> Any:
+        ...
+
+
+class JsonCacheCodec(CacheCodec):
+    """Plain JSON text, the format the caches used originally."""
+
+    def _encode(self, value: Any) -> tuple[int, bytes]:
+        data = json.dumps(value).encode()
+        return len(data), data
+
+    def _decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class CompactCacheCodec(CacheCodec):
+    """
+    Compact binary encoding with optional zlib compression.
+
+    Lists of Steam IDs are packed as unsigned 64-bit integers, everything else
+    as compact JSON. Payloads above the compression threshold are deflated when
+    that makes them smaller. Values written by JsonCacheCodec are still decoded,
+    so existing cache entries stay readable after a deploy.
+    """
+    MAGIC = b"\xd2"
+    FLAG_COMPRESSED = 0x01
+    TYPE_JSON = 0x00
+    TYPE_UINT64_STRINGS = 0x02
+
+    def __init__(self, compression_threshold: int = 1024, compression_level: int = 1):
+        """
+        Initialize the codec.
+
+        Args:
+            compression_threshold: Minimum payload size in bytes before compression is attempted
+            compression_level: zlib compression level
+        """
+        super().__init__()
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+        self._stats["compressed"] = 0
+
+    def _encode(self, value: Any) -> tuple[int, bytes]:
+        if self._is_uint64_strings(value):
+            value_type = self.TYPE_UINT64_STRINGS
+            payload = struct.pack(f"<{len(value)}Q", *(int(item) for item in value))
+            # Size of the same list as JSON text: quotes plus ", " separators and brackets
+            raw_size = sum(len(item) + 4 for item in value) if value else 2
+        else:
+            value_type = self.TYPE_JSON
+            payload = json.dumps(value, separators=(",", ":")).encode()
+            # Measured against the text JsonCacheCodec writes, not the compact one
+            raw_size = len(json.dumps(value).encode())
+
+        flags = value_type
+        if len(payload) >= self._compression_threshold:
+            compressed = zlib.compress(payload, self._compression_level)
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags |= self.FLAG_COMPRESSED
+                self._stats["compressed"] += 1
+
+        return raw_size, self.MAGIC + bytes([flags]) + payload
+
+    def _decode(self, data: bytes) -> Any:
+        if not data.startswith(self.MAGIC):
+            return json.loads(data)
+
+        flags = data[1]
+        payload = data[2:]
+        if flags & self.FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+
+        if flags & ~self.FLAG_COMPRESSED == self.TYPE_UINT64_STRINGS:
+            return [str(item) for item in struct.unpack(f"<{len(payload) // 8}Q", payload)]
+        return json.loads(payload)
+
+    @staticmethod
+    def _is_uint64_strings(value: Any) -> bool:
+        return isinstance(value, list) and all(
+            isinstance(item, str) and item.isascii() and item.isdigit() and int(item) < 2**64 and str(int(item)) == item
+            for item in value
+        )
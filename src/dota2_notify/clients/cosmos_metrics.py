@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, Mapping
+
+
+class RequestChargeHook:
+    """Cosmos response hook adding up the request charge of every response it sees."""
+
+    def __init__(self):
+        self.request_charge = 0.0
+        self.responses = 0
+
+    def __call__(self, headers: Mapping[str, str], body=None):
+        self.request_charge += float(headers.get("x-ms-request-charge", 0) or 0)
+        self.responses += 1
+
+
+class CosmosRequestStats:
+    """Request charge (RU) and latency per service method."""
+
+    def __init__(self):
+        self._methods: dict[str, dict] = {}
+
+    @contextmanager
+    def track(self, method: str) -> Iterator[RequestChargeHook]:
+        """Time the block and record the RU reported to the yielded response hook."""
+        hook = RequestChargeHook()
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield hook
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record(method, hook.request_charge, time.perf_counter() - started, failed)
+
+    def record(self, method: str, request_charge: float, seconds: float, failed: bool = False):
+        stats = self._methods.setdefault(
+            method, {"calls": 0, "errors": 0, "request_charge": 0.0, "seconds": 0.0, "max_seconds": 0.0}
+        )
+        stats["calls"] += 1
+        stats["errors"] += int(failed)
+        stats["request_charge"] += request_charge
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def report(self) -> dict[str, dict]:
+        """Per-method totals and averages, most expensive methods (by total RU) first."""
+        report = {}
+        for method, stats in sorted(self._methods.items(), key=lambda item: item[1]["request_charge"], reverse=True):
+            report[method] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "request_charge": round(stats["request_charge"], 2),
+                "avg_request_charge": round(stats["request_charge"] / stats["calls"], 2),
+                "avg_latency_ms": round(stats["seconds"] / stats["calls"] * 1000, 1),
+                "max_latency_ms": round(stats["max_seconds"] * 1000, 1),
+            }
+        return report
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+from azure.cosmos import exceptions
+
+T = TypeVar("T")
+
+# A throttled operation fails its whole batch with CosmosBatchOperationError, which is no CosmosHttpResponseError
+THROTTLED_ERRORS = (exceptions.CosmosHttpResponseError, exceptions.CosmosBatchOperationError)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on the number of Cosmos DB requests in flight.
+
+    Every successful request raises the limit by 1/limit, so it grows by about
+    one per round of requests until the container's provisioned RU are used up.
+    A 429 (Too Many Requests) halves the limit and pauses every caller for the
+    x-ms-retry-after-ms the service asked for, then the request is retried.
+    Concurrent 429s from the same burst shrink the limit only once.
+    """
+    DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease_factor: float = 0.5,
+        max_retries: int = 5
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            initial_limit: Requests allowed in flight before any feedback
+            min_limit: Lower bound of the limit
+            max_limit: Upper bound of the limit
+            decrease_factor: Factor applied to the limit on a 429
+            max_retries: Retries of a throttled request before its 429 is raised
+        """
+        self._limit = float(initial_limit)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._decrease_factor = decrease_factor
+        self._max_retries = max_retries
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._condition = asyncio.Condition()
+        self._stats = {"requests": 0, "throttled": 0, "retries": 0, "gave_up": 0, "decreases": 0, "retry_after_seconds": 0.0, "wait_seconds": 0.0}
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def limit(self) -> int:
+        return max(self._min_limit, int(self._limit))
+
+    async def run(self, operation: Callable[[], Awaitable[T]]) -> T:
+        """Run a request once a slot is free, retrying it after the retry-after interval when throttled."""
+        for attempt in range(self._max_retries + 1):
+            await self._acquire()
+            try:
+                result = await operation()
+            except THROTTLED_ERRORS as ex:
+                await self._release()
+                if ex.status_code != 429:
+                    raise
+                self._on_throttled(self._retry_after_seconds(ex))
+                if attempt == self._max_retries:
+                    self._stats["gave_up"] += 1
+                    raise
+                self._stats["retries"] += 1
+                continue
+            except BaseException:
+                await self._release()
+                raise
+            await self._release()
+            self._on_success()
+            return result
+
+    async def _acquire(self):
+        started = time.monotonic()
+        async with self._condition:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout=pause)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self._in_flight < self.limit:
+                    break
+                await self._condition.wait()
+            self._in_flight += 1
+        self._stats["requests"] += 1
+        self._stats["wait_seconds"] += time.monotonic() - started
+
+    async def _release(self):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _on_success(self):
+        self._limit = min(self._max_limit, self._limit + 1 / self._limit)
+
+    def _on_throttled(self, retry_after: float):
+        now = time.monotonic()
+        self._stats["throttled"] += 1
+        self._stats["retry_after_seconds"] += retry_after
+        # 429s arriving while already paused belong to the burst that caused the pause
+        if now >= self._paused_until:
+            self._limit = max(self._min_limit, self._limit * self._decrease_factor)
+            self._stats["decreases"] += 1
+            self._logger.warning(f"Cosmos DB throttled, concurrency limit lowered to {self.limit}, pausing {retry_after:.3f}s")
+        self._paused_until = max(self._paused_until, now + retry_after)
+
+    def _retry_after_seconds(self, ex: exceptions.CosmosHttpResponseError | exceptions.CosmosBatchOperationError) -> float:
+        headers = getattr(ex, "headers", None) or {}
+        retry_after_ms = headers.get("x-ms-retry-after-ms")
+        try:
+            return int(retry_after_ms) / 1000
+        except (TypeError, ValueError):
+            return self.DEFAULT_RETRY_AFTER_SECONDS
+
+    def stats(self) -> dict:
+        """Current limit and throttling totals since startup."""
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            **self._stats,
+            "retry_after_seconds": round(self._stats["retry_after_seconds"], 3),
+            "wait_seconds": round(self._stats["wait_seconds"], 3),
+        }
+
+
+class ThrottledContainer:
+    """Cosmos DB container proxy sending point operations and batches through an AdaptiveConcurrencyLimiter."""
+    THROTTLED_METHODS = frozenset({
+        "create_item", "read_item", "upsert_item", "replace_item", "patch_item", "delete_item", "execute_item_batch"
+    })
+
+    def __init__(self, container: Any, limiter: AdaptiveConcurrencyLimiter):
+        self._container = container
+        self._limiter = limiter
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._container, name)
+        if name not in self.THROTTLED_METHODS:
+            return attribute
+
+        async def throttled(*args, **kwargs):
+            return await self._limiter.run(lambda: attribute(*args, **kwargs))
+
+        return throttled
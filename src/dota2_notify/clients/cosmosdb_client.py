@@ -2,16 +2,35 @@ import asyncio
 import logging
 import random
 import string
-from typing import Optional, List
+import time
+from typing import Any, AsyncIterator, Dict, Optional, List, Sequence
+from azure.core import MatchConditions
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import exceptions
-from dota2_notify.models.user import User, Friend, UserTelegramVerifyToken, steam_id_to_account_id
+from dota2_notify.clients.cosmos_metrics import CosmosRequestStats, RequestChargeHook
+from dota2_notify.clients.cosmos_throttle import AdaptiveConcurrencyLimiter, ThrottledContainer
+from dota2_notify.clients.user_cache import RedisUserCache
+from dota2_notify.clients.user_store import PreconditionFailedError, QueryPage, UserStore
+from dota2_notify.models.user import User, Friend, UserTelegramVerifyToken
 
-
-class CosmosDbUserService:
+class CosmosDbUserService(UserStore):
     """Service for managing users in Cosmos DB."""
+    MAX_READ_CONCURRENCY = 16
+    MAX_IDS_PER_QUERY = 100
+    # Cosmos DB limit on the number of operations in one transactional batch
+    MAX_BATCH_OPERATIONS = 100
+    # Batches of an import retried after a conflict with a friend written meanwhile
+    MAX_IMPORT_ATTEMPTS = 3
     
-    def __init__(self, cosmosdb_client: CosmosClient, database_name: str, user_container_name: str, telegram_verify_token_container_name: str):
+    def __init__(
+        self,
+        cosmosdb_client: CosmosClient,
+        database_name: str,
+        user_container_name: str,
+        telegram_verify_token_container_name: str,
+        user_cache: Optional[RedisUserCache] = None,
+        concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None
+    ):
         """
         Initialize the Cosmos DB user service.
         
@@ -20,6 +39,8 @@ class CosmosDbUserService:
             database_name: Name of the database
             user_container_name: Name of the user container
             telegram_verify_token_container_name: Name of the Telegram verify token container
+            user_cache: Optional read-through/write-through cache for user documents
+            concurrency_limiter: Optional limit on point operations and batches in flight, adapted to 429s
         """
         self._client = cosmosdb_client
         self._database_name = database_name
@@ -30,17 +51,17 @@ class CosmosDbUserService:
         self._telegram_verify_token_container_name = telegram_verify_token_container_name
         self._telegram_verify_token_container = None
         
-
+        self._user_cache = user_cache
+        self._concurrency_limiter = concurrency_limiter
+        self._request_stats = CosmosRequestStats()
         self._logger = logging.getLogger(__name__)
-    
-    async def __aenter__(self):
-        """Async context manager entry."""
-        await self.connect()
-        return self
-    
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Async context manager exit."""
-        await self.close()
+
+    def request_stats(self) -> dict:
+        """Request charge (RU) and latency per method, most expensive first, plus throttling if limited."""
+        report = self._request_stats.report()
+        if self._concurrency_limiter:
+            report["throttling"] = self._concurrency_limiter.stats()
+        return report
     
     async def connect(self):
         """Establish connection to Cosmos DB."""
@@ -48,6 +69,9 @@ class CosmosDbUserService:
             database = self._client.get_database_client(self._database_name)
             self._user_container = database.get_container_client(self._user_container_name)
             self._telegram_verify_token_container = database.get_container_client(self._telegram_verify_token_container_name)
+            if self._concurrency_limiter:
+                self._user_container = ThrottledContainer(self._user_container, self._concurrency_limiter)
+                self._telegram_verify_token_container = ThrottledContainer(self._telegram_verify_token_container, self._concurrency_limiter)
             self._logger.info(f"Connected to Cosmos DB: {self._database_name}/{self._user_container_name} and {self._telegram_verify_token_container_name}")
     
     async def close(self):
@@ -71,8 +95,11 @@ class CosmosDbUserService:
         )
         try:
             self._logger.info(f"Creating user with Account ID {account_id}")
-            await self._user_container.create_item(user.model_dump(by_alias=True))
+            with self._request_stats.track("create_user_async") as hook:
+                response = await self._user_container.create_item(user.model_dump(by_alias=True), response_hook=hook)
             self._logger.info(f"Successfully created user {account_id}")
+            if self._user_cache:
+                await self._user_cache.put(response)
             return user
         except exceptions.CosmosResourceExistsError:
             self._logger.warning(f"User with Account ID {account_id} already exists")
@@ -81,20 +108,26 @@ class CosmosDbUserService:
             self._logger.error(f"Error creating user with Account ID {account_id}: {ex}")
             raise
     
-    async def create_user_with_steam_id_async(self, steam_id: int, name: str, telegram_token: str) -> User:
-        account_id = steam_id_to_account_id(steam_id)
-        return await self.create_user_async(account_id, name, telegram_token)
-    
     async def get_user_async(self, account_id: int) -> Optional[User]:
         try:
             self._logger.info(f"Getting user with ID {account_id}")
+
+            if self._user_cache:
+                cached = await self._user_cache.get(account_id)
+                if cached:
+                    self._logger.info(f"Retrieved user {account_id} from cache")
+                    return User.model_validate(cached)
             
-            response = await self._user_container.read_item(
-                item=str(account_id),
-                partition_key=account_id
-            )
+            with self._request_stats.track("get_user_async") as hook:
+                response = await self._user_container.read_item(
+                    item=str(account_id),
+                    partition_key=account_id,
+                    response_hook=hook
+                )
             
             self._logger.info(f"Successfully retrieved user {account_id}")
+            if self._user_cache:
+                await self._user_cache.put(response)
             return User.model_validate(response)
             
         except exceptions.CosmosResourceNotFoundError:
@@ -104,10 +137,49 @@ class CosmosDbUserService:
             self._logger.error(f"Error getting user {account_id}: {ex}")
             raise
     
-    async def get_user_with_steam_id_async(self, steam_id: int) -> Optional[User]:
-        account_id = steam_id_to_account_id(steam_id)
-        return await self.get_user_async(account_id)
-    
+    async def get_users_async(self, account_ids: List[int]) -> Dict[int, User]:
+        """
+        Read several users at once.
+
+        Every user lives in its own partition, so this issues concurrent point
+        reads bounded by MAX_READ_CONCURRENCY. Users that do not exist are
+        left out of the result.
+        """
+        unique_ids = list(dict.fromkeys(account_ids))
+        if not unique_ids:
+            return {}
+
+        self._logger.info(f"Getting {len(unique_ids)} users")
+        users = {}
+        if self._user_cache:
+            cached = await self._user_cache.get_many(unique_ids)
+            users = {account_id: User.model_validate(doc) for account_id, doc in cached.items()}
+            unique_ids = [account_id for account_id in unique_ids if account_id not in users]
+        semaphore = asyncio.Semaphore(self.MAX_READ_CONCURRENCY)
+
+        async def read_user(account_id: int) -> Optional[dict]:
+            async with semaphore:
+                try:
+                    with self._request_stats.track("get_users_async") as hook:
+                        return await self._user_container.read_item(item=str(account_id), partition_key=account_id, response_hook=hook)
+                except exceptions.CosmosResourceNotFoundError:
+                    self._logger.warning(f"User {account_id} not found")
+                    return None
+
+        try:
+            responses = await asyncio.gather(*(read_user(account_id) for account_id in unique_ids))
+        except Exception as ex:
+            self._logger.error(f"Error getting users {unique_ids}: {ex}")
+            raise
+
+        for account_id, response in zip(unique_ids, responses):
+            if response is not None:
+                users[account_id] = User.model_validate(response)
+                if self._user_cache:
+                    await self._user_cache.put(response)
+        self._logger.info(f"Retrieved {len(users)} users, {len(unique_ids)} read from Cosmos DB")
+        return users
+
     async def get_all_users_async(self) -> List[User]:
         try:
             self._logger.info("Getting all users")
@@ -115,10 +187,12 @@ class CosmosDbUserService:
             query = "SELECT * FROM c WHERE c.type = 'user'"
             users = []
             
-            async for item in self._user_container.query_items(
-                query=query
-            ):
-                users.append(User.model_validate(item))
+            with self._request_stats.track("get_all_users_async") as hook:
+                async for item in self._user_container.query_items(
+                    query=query,
+                    response_hook=hook
+                ):
+                    users.append(User.model_validate(item))
             
             self._logger.info(f"Retrieved {len(users)} users")
             return users
@@ -143,12 +217,14 @@ class CosmosDbUserService:
             
             friends = []
             
-            async for item in self._user_container.query_items(
-                query=query,
-                parameters=parameters,
-                partition_key=account_id
-            ):
-                friends.append(Friend.model_validate(item))
+            with self._request_stats.track("get_friends_async") as hook:
+                async for item in self._user_container.query_items(
+                    query=query,
+                    parameters=parameters,
+                    partition_key=account_id,
+                    response_hook=hook
+                ):
+                    friends.append(Friend.model_validate(item))
             
             self._logger.info(f"Retrieved {len(friends)} friends for user {account_id}")
             return friends
@@ -157,54 +233,334 @@ class CosmosDbUserService:
             self._logger.error(f"Error getting friends for user {account_id}: {ex}")
             raise
     
+    async def iter_users_async(
+        self,
+        max_item_count: int = UserStore.DEFAULT_PAGE_SIZE,
+        continuation: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[QueryPage[User]]:
+        """
+        Stream all users page by page instead of loading them into one list.
+
+        Args:
+            max_item_count: Maximum number of users per page
+            continuation: Continuation token of a previous page to resume after
+            fields: User field names to project (e.g. ["id", "following"]); fields
+                that are left out keep their model defaults
+
+        Yields:
+            Pages of users with the continuation token to resume after each page
+        """
+        query = f"SELECT {self._projection(User, fields)} FROM c WHERE c.type = 'user'"
+        async for page in self._query_pages("iter_users_async", User, query, [], None, max_item_count, continuation):
+            yield page
+
+    async def iter_friends_async(
+        self,
+        account_id: int,
+        following: Optional[bool] = None,
+        max_item_count: int = UserStore.DEFAULT_PAGE_SIZE,
+        continuation: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[QueryPage[Friend]]:
+        """
+        Stream the friends of a user page by page, see iter_users_async.
+
+        Args:
+            account_id: Account ID of the user
+            following: If given, only friends with this following flag
+            max_item_count: Maximum number of friends per page
+            continuation: Continuation token of a previous page to resume after
+            fields: Friend field names to project
+
+        Yields:
+            Pages of friends with the continuation token to resume after each page
+        """
+        query = f"SELECT {self._projection(Friend, fields)} FROM c WHERE c.type = 'friend' AND c.userId = @userId"
+        parameters = [{"name": "@userId", "value": account_id}]
+        if following is not None:
+            query += " AND c.following = @following"
+            parameters.append({"name": "@following", "value": following})
+        async for page in self._query_pages("iter_friends_async", Friend, query, parameters, account_id, max_item_count, continuation):
+            yield page
+
+    @staticmethod
+    def _projection(model: type, fields: Optional[Sequence[str]]) -> str:
+        if not fields:
+            return "*"
+        return ", ".join(f"c.{model.model_fields[name].alias or name}" for name in fields)
+
+    async def _query_pages(
+        self,
+        method: str,
+        model: type,
+        query: str,
+        parameters: list,
+        partition_key: Optional[int],
+        max_item_count: int,
+        continuation: Optional[str]
+    ) -> AsyncIterator[QueryPage]:
+        kwargs = {"partition_key": partition_key} if partition_key is not None else {}
+        hook = RequestChargeHook()
+        items = self._user_container.query_items(
+            query=query,
+            parameters=parameters,
+            max_item_count=max_item_count,
+            response_hook=hook,
+            **kwargs
+        )
+        pages = items.by_page(continuation)
+        while True:
+            # Each page is recorded on its own so the time the caller spends on a page is not counted
+            request_charge = hook.request_charge
+            started = time.perf_counter()
+            try:
+                page = await anext(pages, None)
+                page_items = [model.model_validate(item) async for item in page] if page is not None else []
+            except Exception:
+                self._request_stats.record(method, hook.request_charge - request_charge, time.perf_counter() - started, failed=True)
+                raise
+            if page is None:
+                return
+            self._request_stats.record(method, hook.request_charge - request_charge, time.perf_counter() - started)
+            yield QueryPage(items=page_items, continuation=pages.continuation_token)
+
     async def get_friend_async(self, account_id: int, followed_player_id: int) -> Optional[Friend]:
         try:
             self._logger.info(f"Getting friend {followed_player_id} for user {account_id}")
             
-            query = "SELECT * FROM c WHERE c.type = 'friend' AND c.userId = @userId AND c.id = @friendId"
-            parameters = [
-                {"name": "@userId", "value": account_id},
-                {"name": "@friendId", "value": str(followed_player_id)}
-            ]
+            # Friends are stored in the user's partition with the followed account ID as id, so this is a point read
+            with self._request_stats.track("get_friend_async") as hook:
+                response = await self._user_container.read_item(
+                    item=str(followed_player_id),
+                    partition_key=account_id,
+                    response_hook=hook
+                )
             
-            async for item in self._user_container.query_items(
-                query=query,
-                parameters=parameters,
-                partition_key=account_id
-            ):
-                self._logger.info(f"Successfully retrieved friend {followed_player_id} for user {account_id}")
-                return Friend.model_validate(item)
+            # The user's own document shares the partition and uses the account ID as id
+            if response.get("type") != "friend":
+                self._logger.warning(f"Friend {followed_player_id} not found for user {account_id}")
+                return None
+
+            self._logger.info(f"Successfully retrieved friend {followed_player_id} for user {account_id}")
+            return Friend.model_validate(response)
             
+        except exceptions.CosmosResourceNotFoundError:
             self._logger.warning(f"Friend {followed_player_id} not found for user {account_id}")
             return None
-            
         except Exception as ex:
             self._logger.error(f"Error getting friend {followed_player_id} for user {account_id}: {ex}")
             raise
 
-    async def get_friend_by_steam_id_async(self, steam_id: int, friend_steam_id: int) -> Optional[Friend]:
-        account_id = steam_id_to_account_id(steam_id)
-        friend_account_id = steam_id_to_account_id(friend_steam_id)
-        return await self.get_friend_async(account_id, friend_account_id)
+    async def get_friends_by_ids_async(self, account_id: int, followed_player_ids: List[int]) -> Dict[int, Friend]:
+        """
+        Read several friends of one user at once.
+
+        All friends share the user's partition, so they are fetched with one
+        single-partition query per MAX_IDS_PER_QUERY ids, run concurrently.
+        """
+        unique_ids = list(dict.fromkeys(str(followed_player_id) for followed_player_id in followed_player_ids))
+        if not unique_ids:
+            return {}
+
+        self._logger.info(f"Getting {len(unique_ids)} friends for user {account_id}")
+        query = "SELECT * FROM c WHERE c.type = 'friend' AND c.userId = @userId AND ARRAY_CONTAINS(@friendIds, c.id)"
+        semaphore = asyncio.Semaphore(self.MAX_READ_CONCURRENCY)
+
+        async def query_chunk(friend_ids: List[str]) -> List[dict]:
+            async with semaphore:
+                parameters = [
+                    {"name": "@userId", "value": account_id},
+                    {"name": "@friendIds", "value": friend_ids}
+                ]
+                with self._request_stats.track("get_friends_by_ids_async") as hook:
+                    return [
+                        item async for item in self._user_container.query_items(
+                            query=query,
+                            parameters=parameters,
+                            partition_key=account_id,
+                            response_hook=hook
+                        )
+                    ]
+
+        chunks = [unique_ids[i:i + self.MAX_IDS_PER_QUERY] for i in range(0, len(unique_ids), self.MAX_IDS_PER_QUERY)]
+        try:
+            results = await asyncio.gather(*(query_chunk(chunk) for chunk in chunks))
+        except Exception as ex:
+            self._logger.error(f"Error getting friends {unique_ids} for user {account_id}: {ex}")
+            raise
+
+        friends = {}
+        for items in results:
+            for item in items:
+                friend = Friend.model_validate(item)
+                friends[int(friend.id)] = friend
+        self._logger.info(f"Retrieved {len(friends)} of {len(unique_ids)} friends for user {account_id}")
+        return friends
 
-    async def update_friend_async(self, friend: Friend):
+    async def update_friend_async(self, friend: Friend) -> Friend:
         try:
             self._logger.info(f"Updating friend {friend.id} for user {friend.user_id}")
-            await self._user_container.upsert_item(friend.model_dump(by_alias=True))
+            with self._request_stats.track("update_friend_async") as hook:
+                response = await self._user_container.upsert_item(friend.model_dump(by_alias=True), response_hook=hook)
             self._logger.info(f"Successfully updated friend {friend.id} for user {friend.user_id}")
+            return Friend.model_validate(response)
         except Exception as ex:
             self._logger.error(f"Error updating friend {friend.id} for user {friend.user_id}: {ex}")
             raise
 
+    async def import_friends_async(self, account_id: int, friends: List[Friend], max_request_charge: Optional[float] = None) -> int:
+        """
+        Write many friends of one user with transactional batches, leaving friends that are already stored alone.
+
+        All friends share the user's partition, so each batch of up to
+        MAX_BATCH_OPERATIONS creates is a single request that either fully
+        applies or not at all. Friends already stored are skipped, and the
+        rest are created rather than upserted, so a follow written while the
+        import runs is never overwritten: it fails the batch with a conflict,
+        and the batch is retried without it.
+
+        Args:
+            account_id: Account ID of the user owning the friends
+            friends: Friends to write
+            max_request_charge: Stop before the next batch once this many RU were spent
+
+        Returns:
+            Number of friends written
+        """
+        written = 0
+        request_charge = 0.0
+        try:
+            self._logger.info(f"Importing {len(friends)} friends for user {account_id}")
+            for start in range(0, len(friends), self.MAX_BATCH_OPERATIONS):
+                if max_request_charge is not None and request_charge >= max_request_charge:
+                    self._logger.warning(f"Stopped friend import for user {account_id} after {written} friends, {request_charge:.1f} RU spent")
+                    break
+                batch = friends[start:start + self.MAX_BATCH_OPERATIONS]
+                for attempt in range(1, self.MAX_IMPORT_ATTEMPTS + 1):
+                    with self._request_stats.track("import_friends_async") as hook:
+                        stored = await self._stored_friend_ids(account_id, [friend.id for friend in batch], hook)
+                    request_charge += hook.request_charge
+                    missing = [friend for friend in batch if friend.id not in stored]
+                    if not missing:
+                        break
+                    try:
+                        with self._request_stats.track("import_friends_async") as hook:
+                            await self._user_container.execute_item_batch(
+                                batch_operations=[("create", (friend.model_dump(by_alias=True),)) for friend in missing],
+                                partition_key=account_id,
+                                response_hook=hook
+                            )
+                    except exceptions.CosmosBatchOperationError as ex:
+                        request_charge += hook.request_charge
+                        if ex.status_code != 409 or attempt == self.MAX_IMPORT_ATTEMPTS:
+                            raise
+                        self._logger.info(f"Friend of user {account_id} written during the import, retrying the batch")
+                        continue
+                    request_charge += hook.request_charge
+                    written += len(missing)
+                    break
+            self._logger.info(f"Imported {written} friends for user {account_id} ({request_charge:.1f} RU)")
+            return written
+        except Exception as ex:
+            self._logger.error(f"Error importing friends for user {account_id} after {written} friends: {ex}")
+            raise
+
+    async def _stored_friend_ids(self, account_id: int, friend_ids: List[str], hook: RequestChargeHook) -> set:
+        query = "SELECT c.id FROM c WHERE c.type = 'friend' AND c.userId = @userId AND ARRAY_CONTAINS(@friendIds, c.id)"
+        parameters = [{"name": "@userId", "value": account_id}, {"name": "@friendIds", "value": friend_ids}]
+        return {
+            item["id"] async for item in self._user_container.query_items(
+                query=query, parameters=parameters, partition_key=account_id, response_hook=hook
+            )
+        }
+
     async def update_user_async(self, user: User):
         try:
             self._logger.info(f"Updating user {user.user_id}")
-            await self._user_container.upsert_item(user.model_dump(by_alias=True))
+            with self._request_stats.track("update_user_async") as hook:
+                response = await self._user_container.upsert_item(user.model_dump(by_alias=True), response_hook=hook)
+            if self._user_cache:
+                await self._user_cache.put(response)
             self._logger.info(f"Successfully updated user {user.user_id}")
         except Exception as ex:
             self._logger.error(f"Error updating user {user.user_id}: {ex}")
             raise
     
+    async def patch_user_async(self, account_id: int, fields: Dict[str, Any], etag: Optional[str] = None) -> Optional[User]:
+        """
+        Set only the given User fields instead of replacing the whole document.
+
+        Args:
+            account_id: Account ID of the user
+            fields: New values keyed by User field name
+            etag: If given, the patch only applies when the document still has this ETag
+
+        Returns:
+            The patched user, or None if the user does not exist
+        """
+        try:
+            self._logger.info(f"Patching user {account_id}: {sorted(fields)}")
+            response = await self._patch_item_async("patch_user_async", str(account_id), account_id, User, fields, etag)
+            self._logger.info(f"Successfully patched user {account_id}")
+            if self._user_cache:
+                await self._user_cache.put(response)
+            return User.model_validate(response)
+        except exceptions.CosmosResourceNotFoundError:
+            self._logger.warning(f"User {account_id} not found for patch")
+            return None
+        except Exception as ex:
+            self._logger.error(f"Error patching user {account_id}: {ex}")
+            raise
+
+    async def patch_friend_async(self, account_id: int, followed_player_id: int, fields: Dict[str, Any], etag: Optional[str] = None) -> Optional[Friend]:
+        """
+        Set only the given Friend fields instead of replacing the whole document.
+
+        Args:
+            account_id: Account ID of the user owning the friend
+            followed_player_id: Account ID of the friend
+            fields: New values keyed by Friend field name
+            etag: If given, the patch only applies when the document still has this ETag
+
+        Returns:
+            The patched friend, or None if the friend does not exist
+        """
+        # The user's own document shares the partition and uses the account ID as id
+        if followed_player_id == account_id:
+            return None
+        try:
+            self._logger.info(f"Patching friend {followed_player_id} for user {account_id}: {sorted(fields)}")
+            response = await self._patch_item_async("patch_friend_async", str(followed_player_id), account_id, Friend, fields, etag)
+            self._logger.info(f"Successfully patched friend {followed_player_id} for user {account_id}")
+            return Friend.model_validate(response)
+        except exceptions.CosmosResourceNotFoundError:
+            self._logger.warning(f"Friend {followed_player_id} not found for user {account_id} for patch")
+            return None
+        except Exception as ex:
+            self._logger.error(f"Error patching friend {followed_player_id} for user {account_id}: {ex}")
+            raise
+
+    async def _patch_item_async(self, method: str, item_id: str, partition_key: int, model: type, fields: Dict[str, Any], etag: Optional[str]) -> dict:
+        kwargs = {}
+        patch_operations = [
+            {"op": "set", "path": f"/{model.model_fields[name].alias or name}", "value": value}
+            for name, value in fields.items()
+        ]
+        if etag:
+            kwargs.update(etag=etag, match_condition=MatchConditions.IfNotModified)
+        try:
+            with self._request_stats.track(method) as hook:
+                return await self._user_container.patch_item(
+                    item=item_id,
+                    partition_key=partition_key,
+                    patch_operations=patch_operations,
+                    response_hook=hook,
+                    **kwargs
+                )
+        except exceptions.CosmosAccessConditionFailedError as ex:
+            raise PreconditionFailedError(f"Document {item_id} changed since ETag {etag}") from ex
+
     ##
     ## Telegram verification token management
     ##
@@ -220,7 +576,8 @@ class CosmosDbUserService:
                     user_id=account_id,
                     token=token
                 )
-                await self._telegram_verify_token_container.create_item(item.model_dump(by_alias=True))
+                with self._request_stats.track("create_telegram_verify_token_async") as hook:
+                    await self._telegram_verify_token_container.create_item(item.model_dump(by_alias=True), response_hook=hook)
                 self._logger.info(f"Successfully created Telegram verification token for user {account_id}")
                 return token
             except exceptions.CosmosResourceExistsError:
@@ -235,10 +592,12 @@ class CosmosDbUserService:
     async def get_user_id_by_telegram_token_async(self, token: str) -> Optional[int]:
         try:
             self._logger.info(f"Getting user ID by Telegram token {token}")
-            response = await self._telegram_verify_token_container.read_item(
-                item=token,
-                partition_key=token
-            )
+            with self._request_stats.track("get_user_id_by_telegram_token_async") as hook:
+                response = await self._telegram_verify_token_container.read_item(
+                    item=token,
+                    partition_key=token,
+                    response_hook=hook
+                )
             user_id = response.get("userId")
             self._logger.info(f"Successfully retrieved user ID {user_id} for Telegram token {token}")
             return user_id
@@ -252,10 +611,12 @@ class CosmosDbUserService:
     async def delete_telegram_verify_token_async(self, token: str):
         try:
             self._logger.info(f"Deleting Telegram verification token {token}")
-            await self._telegram_verify_token_container.delete_item(
-                item=token,
-                partition_key=token
-            )
+            with self._request_stats.track("delete_telegram_verify_token_async") as hook:
+                await self._telegram_verify_token_container.delete_item(
+                    item=token,
+                    partition_key=token,
+                    response_hook=hook
+                )
             self._logger.info(f"Successfully deleted Telegram verification token {token}")
         except exceptions.CosmosResourceNotFoundError:
             self._logger.warning(f"Telegram token {token} not found for deletion")
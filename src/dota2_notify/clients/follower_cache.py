@@ -0,0 +1,196 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Set
+
+import redis.asyncio as redis
+
+from .follower_index import FollowerIndex
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+
+class CachedFollowerIndex(FollowerIndex):
+    """
+    Follower index that keeps recently read followers sets in process memory,
+    invalidated by Redis client-side caching (CLIENT TRACKING).
+
+    Tracking runs in broadcasting mode on the followers key prefix, so Redis
+    reports every change of a followers set, whoever wrote it. The async
+    client has no RESP3 push support, so invalidations are redirected to a
+    second connection subscribed to `__redis__:invalidate`, the RESP2 way.
+    Both are dedicated RESP2 connections outside the pool, whatever protocol
+    the pool negotiates: if either drops, Redis stops tracking or reporting
+    without telling the other, so the cache is cleared and bypassed until
+    `run` has set up tracking again.
+
+    A read that overlaps an invalidation of its key is returned but not
+    cached. Entries also expire after `max_age_seconds`, which bounds how long
+    a change can go unseen when the tracking connection drops between two
+    checks.
+    """
+    CHECK_INTERVAL_SECONDS = 5.0
+    RETRY_SECONDS = 5.0
+
+    def __init__(self, redis_client: redis.Redis, max_entries: int = 100_000, max_age_seconds: float = 300.0, **kwargs):
+        """
+        Initialize the index.
+
+        Args:
+            redis_client: Redis client holding the index, whose pool settings the tracking connections use
+            max_entries: Followers sets kept in memory, least recently used ones are evicted first
+            max_age_seconds: Time a followers set is served from memory without being read again
+        """
+        super().__init__(redis_client, **kwargs)
+        self._max_entries = max_entries
+        self._max_age_seconds = max_age_seconds
+        self._entries: OrderedDict[int, tuple[float, Set[int]]] = OrderedDict()
+        # Account IDs invalidated while each read in flight was waiting for Redis
+        self._reads_in_flight: list[set[int]] = []
+        # Bumped when the whole cache is dropped, so reads in flight are not cached either
+        self._generation = 0
+        self._tracking = False
+        self._subscriber = None
+        self._tracker = None
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "flushes": 0, "resets": 0}
+
+    @property
+    def tracking(self) -> bool:
+        return self._tracking
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "tracking": self._tracking,
+        }
+
+    async def get_followers_many(self, account_ids: List[int]) -> Dict[int, Set[int]]:
+        """Notifiable followers of each account, from memory where tracked, the rest in one round-trip."""
+        if not self._tracking:
+            return await super().get_followers_many(account_ids)
+        if not self.ready:
+            # Reads of an earlier layout are not tracked
+            followers = await self._get_fallback_followers(account_ids)
+            if followers is not None:
+                return followers
+
+        now = time.monotonic()
+        followers = {}
+        misses = []
+        for account_id in account_ids:
+            entry = self._entries.get(account_id)
+            if entry and now - entry[0] < self._max_age_seconds:
+                self._entries.move_to_end(account_id)
+                followers[account_id] = set(entry[1])
+            else:
+                misses.append(account_id)
+        self._stats["hits"] += len(account_ids) - len(misses)
+        self._stats["misses"] += len(misses)
+        if not misses:
+            return followers
+
+        invalidated = set()
+        generation = self._generation
+        self._reads_in_flight.append(invalidated)
+        try:
+            read = await super().get_followers_many(misses)
+        finally:
+            self._reads_in_flight.remove(invalidated)
+
+        if self._tracking and generation == self._generation:
+            for account_id, members in read.items():
+                if account_id not in invalidated:
+                    self._entries[account_id] = (now, set(members))
+                    self._entries.move_to_end(account_id)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        followers.update(read)
+        return followers
+
+    def invalidate(self, keys: list | None):
+        """Drop the followers sets of the keys in an invalidation message, or everything if there are none."""
+        if keys is None:
+            self._flush()
+            self._stats["flushes"] += 1
+            return
+        prefix = self.followers_key("")
+        for key in keys:
+            key = key.decode() if isinstance(key, bytes) else key
+            if not key.startswith(prefix):
+                continue
+            account_id = int(key[len(prefix):])
+            self._entries.pop(account_id, None)
+            for invalidated in self._reads_in_flight:
+                invalidated.add(account_id)
+            self._stats["invalidations"] += 1
+
+    async def run(self):
+        """Track the followers sets and apply invalidations until cancelled, setting up tracking again after errors."""
+        while True:
+            try:
+                await self._start_tracking()
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                self._logger.warning(f"Follower cache tracking lost, reading followers from Redis: {ex}")
+            finally:
+                await self._stop_tracking()
+            await asyncio.sleep(self.RETRY_SECONDS)
+
+    async def _start_tracking(self):
+        self._subscriber = self._make_connection()
+        self._tracker = self._make_connection()
+        await self._subscriber.connect()
+        await self._tracker.connect()
+
+        subscriber_id = await self._command(self._subscriber, "CLIENT", "ID")
+        await self._subscriber.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+        await self._subscriber.read_response(timeout=math.inf)
+        await self._command(
+            self._tracker, "CLIENT", "TRACKING", "ON", "REDIRECT", subscriber_id, "BCAST", "PREFIX", self.followers_key("")
+        )
+        # Anything read before tracking started may have changed unseen
+        self._flush()
+        self._tracking = True
+        self._logger.info(f"Follower cache tracking {self.followers_key('')}* via client {subscriber_id}")
+
+    async def _listen(self):
+        while True:
+            message = await self._subscriber.read_response(timeout=self.CHECK_INTERVAL_SECONDS)
+            if message is None:
+                # Tracking is lost silently with the tracking connection
+                await self._command(self._tracker, "PING")
+                continue
+            kind, channel, payload = message[:3]
+            if kind in (b"message", "message") and channel in (INVALIDATE_CHANNEL.encode(), INVALIDATE_CHANNEL):
+                self.invalidate(payload)
+
+    def _make_connection(self):
+        # Under RESP3 the subscription and its messages arrive as pushes, which read_response skips
+        pool = self.redis_client.connection_pool
+        return pool.connection_class(**{**pool.connection_kwargs, "protocol": 2})
+
+    async def _stop_tracking(self):
+        was_tracking = self._tracking
+        self._tracking = False
+        self._flush()
+        for connection in (self._subscriber, self._tracker):
+            if connection is not None:
+                await connection.disconnect(nowait=True)
+        self._subscriber = self._tracker = None
+        if was_tracking:
+            self._stats["resets"] += 1
+
+    def _flush(self):
+        self._entries.clear()
+        self._generation += 1
+
+    @staticmethod
+    async def _command(connection, *args):
+        await connection.send_command(*args)
+        return await connection.read_response()
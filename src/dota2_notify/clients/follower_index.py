@@ -0,0 +1,456 @@
+import logging
+from collections import Counter
+from typing import AsyncIterator, Dict, Iterable, List, Set, Tuple
+
+import redis.asyncio as redis
+
+from dota2_notify.models.user import User
+
+# Adds or removes the follow edge of ARGV[1] (user) to ARGV[2] (account),
+# unless the user's edge versions KEYS[4] hold a newer version than ARGV[4].
+# The reverse set KEYS[2] always holds the edge, the account's followers
+# KEYS[1] only while the user is in the notifiable set KEYS[3].
+_EDGE_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[4], ARGV[2]))
+if current ~= nil and current > tonumber(ARGV[4]) then
+    return -1
+end
+redis.call('HSET', KEYS[4], ARGV[2], ARGV[4])
+if ARGV[3] == '1' then
+    redis.call('SADD', KEYS[2], ARGV[2])
+    if redis.call('SISMEMBER', KEYS[3], ARGV[1]) == 1 then
+        redis.call('SADD', KEYS[1], ARGV[1])
+    end
+    return 1
+end
+redis.call('SREM', KEYS[2], ARGV[2])
+redis.call('SREM', KEYS[1], ARGV[1])
+return 0
+"""
+
+# Marks ARGV[1] (user) as notifiable or not in KEYS[1], and on a change adds it
+# to or removes it from the followers set of every account in its reverse set
+# KEYS[2]. The followers keys are built from the prefix in ARGV[3], which is
+# fine on a single Redis but would need hash tags on a cluster.
+_NOTIFIABLE_SCRIPT = """
+local command = 'SREM'
+if ARGV[2] == '1' then
+    command = 'SADD'
+end
+if redis.call(command, KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+for _, account_id in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    redis.call(command, ARGV[3] .. account_id, ARGV[1])
+end
+return 1
+"""
+
+# Deletes the versions in KEYS[1] older than ARGV[1] of edges that were removed,
+# i.e. whose account is not in the user's reverse set KEYS[2].
+_PRUNE_SCRIPT = """
+local pruned = 0
+local versions = redis.call('HGETALL', KEYS[1])
+for i = 1, #versions, 2 do
+    if tonumber(versions[i + 1]) < tonumber(ARGV[1]) and redis.call('SISMEMBER', KEYS[2], versions[i]) == 0 then
+        redis.call('HDEL', KEYS[1], versions[i])
+        pruned = pruned + 1
+    end
+end
+return pruned
+"""
+
+
+class FollowerIndex:
+    """
+    Follow edges in Redis, as sets of integer account IDs.
+
+    `following:<user ID>` holds every account a user follows, and
+    `followers:<account ID>` the followers of an account that can be
+    notified, i.e. have a Telegram chat. The `notifiable` set holds those
+    users; when a user connects or disconnects Telegram their edges are moved
+    in or out of the followers sets, so the notifier never fans out to users
+    it cannot reach.
+
+    Members are plain integers, so Redis keeps sets of up to
+    set-max-intset-entries members in the compact intset encoding. All keys
+    share a versioned prefix, so a new layout can be built next to the old one
+    and the old one dropped after.
+
+    Edges are written by the web app right after the follow is stored and by
+    data-sync from the change feed, whichever comes first. `versions:<user ID>`
+    keeps the `_ts` of the document each edge was last written from (also for
+    removed edges), so a late write of an older version is ignored. Equal
+    versions are applied because `_ts` only has second resolution; the change
+    feed delivers the final state of a document after the writes that raced.
+    The versions of removed edges are only needed while an older write may
+    still arrive, and are pruned by the reconciler after that.
+
+    Until data-sync has built a new layout and set its sentinel, readers keep
+    reading the followers sets of the newest earlier layout that is ready (or
+    of the unversioned index), which stops being updated but is complete.
+    """
+    NAMESPACE = "followers"
+    VERSION = 3
+    # Oldest versioned layout, dropped with the later ones once this one is ready
+    FIRST_VERSION = 2
+    # Layout written by data-sync before the index was versioned: a set of
+    # follower IDs under the bare followed account ID, next to every other key
+    LEGACY_SENTINEL_KEY = "dota2_notify_sync_sentinel"
+    SCAN_COUNT = 1000
+    BATCH_SIZE = 500
+
+    def __init__(self, redis_client: redis.Redis, version: int = VERSION, namespace: str = NAMESPACE):
+        """
+        Initialize the index.
+
+        Args:
+            redis_client: Redis client holding the index
+            version: Layout version, part of every key
+            namespace: First part of every key, another one holds an index being rebuilt
+        """
+        self.redis_client = redis_client
+        self.version = version
+        self.namespace = namespace
+        self.prefix = f"{namespace}:v{version}:"
+        self._ready = False
+        # Followers key prefix read until this layout is ready, found on the first read
+        self._fallback_prefix: str | None = None
+        self._edge_script = redis_client.register_script(_EDGE_SCRIPT)
+        self._notifiable_script = redis_client.register_script(_NOTIFIABLE_SCRIPT)
+        self._prune_script = redis_client.register_script(_PRUNE_SCRIPT)
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def sentinel_key(self) -> str:
+        """Set by data-sync once the index holds every follow edge."""
+        return f"{self.prefix}ready"
+
+    @property
+    def ready(self) -> bool:
+        """Whether a read has seen the sentinel of this layout; readers fall back to an earlier layout until then."""
+        return self._ready
+
+    @property
+    def notifiable_key(self) -> str:
+        return f"{self.prefix}notifiable"
+
+    def followers_key(self, account_id: int | str) -> str:
+        return f"{self.prefix}followers:{account_id}"
+
+    def following_key(self, user_id: int | str) -> str:
+        return f"{self.prefix}following:{user_id}"
+
+    def versions_key(self, user_id: int | str) -> str:
+        return f"{self.prefix}versions:{user_id}"
+
+    async def set_following(self, user_id: int, account_id: int, following: bool, version: int, client: redis.client.Pipeline | None = None) -> int:
+        """
+        Add or remove a follow edge, queued on `client` if it is a pipeline.
+
+        Args:
+            user_id: Account ID of the following user
+            account_id: Account ID of the followed player
+            following: Whether the edge exists
+            version: `_ts` of the document the edge comes from
+
+        Returns:
+            Unless queued, 1 if the edge was added, 0 if removed, -1 if a newer version was already applied
+        """
+        return await self._edge_script(
+            keys=[self.followers_key(account_id), self.following_key(user_id), self.notifiable_key, self.versions_key(user_id)],
+            args=[int(user_id), int(account_id), int(following), int(version)],
+            client=client
+        )
+
+    async def set_notifiable(self, user_id: int, notifiable: bool, client: redis.client.Pipeline | None = None):
+        """Move the edges of a user in or out of the followers sets, queued on `client` if it is a pipeline."""
+        await self._notifiable_script(
+            keys=[self.notifiable_key, self.following_key(user_id)],
+            args=[int(user_id), int(notifiable), self.followers_key("")],
+            client=client
+        )
+
+    async def prune_versions(self, older_than: int) -> int:
+        """
+        Delete the versions of removed edges written before `older_than`.
+
+        Versions of existing edges are kept, and a user's versions key goes
+        away with its last field.
+
+        Returns:
+            Number of versions deleted
+        """
+        pruned = 0
+        keys = []
+        async for key in self.redis_client.scan_iter(match=f"{self.versions_key('')}*", count=self.SCAN_COUNT, _type="HASH"):
+            keys.append(key.decode() if isinstance(key, bytes) else key)
+            if len(keys) >= self.BATCH_SIZE:
+                pruned += await self._prune_versions(keys, older_than)
+                keys = []
+        pruned += await self._prune_versions(keys, older_than)
+        return pruned
+
+    async def _prune_versions(self, keys: List[str], older_than: int) -> int:
+        if not keys:
+            return 0
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            user_id = key[len(self.versions_key("")):]
+            await self._prune_script(keys=[key, self.following_key(user_id)], args=[int(older_than)], client=pipe)
+        return sum(await pipe.execute())
+
+    async def apply(self, pipe: redis.client.Pipeline, doc: dict):
+        """Queue the changes of a changed User or Friend document on a pipeline."""
+        if doc.get("type") == "user":
+            # Before the user's own edge, so that lands in the right sets
+            notifiable = User.model_validate(doc).is_telegram_verified
+            await self.set_notifiable(doc["userId"], notifiable, client=pipe)
+        await self.set_following(doc["userId"], doc["id"], bool(doc.get("following")), doc.get("_ts", 0), client=pipe)
+
+    async def get_followers_many(self, account_ids: List[int]) -> Dict[int, Set[int]]:
+        """Notifiable followers of each account, in one round-trip."""
+        if not account_ids:
+            return {}
+        if not self._ready:
+            followers = await self._get_fallback_followers(account_ids)
+            if followers is not None:
+                return followers
+        pipe = self.redis_client.pipeline(transaction=False)
+        for account_id in account_ids:
+            pipe.smembers(self.followers_key(account_id))
+        results = await pipe.execute()
+        return {account_id: {int(member) for member in members} for account_id, members in zip(account_ids, results)}
+
+    async def _get_fallback_followers(self, account_ids: List[int]) -> Dict[int, Set[int]] | None:
+        """
+        Followers of each account from the earlier layout while this one is
+        not ready, or None once it is.
+
+        The sentinel is checked in the same transaction as the reads, so they
+        never see the earlier layout after it was dropped.
+        """
+        if self._fallback_prefix is None:
+            self._fallback_prefix = await self._find_fallback_prefix()
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.exists(self.sentinel_key)
+            for account_id in account_ids:
+                pipe.smembers(f"{self._fallback_prefix}{account_id}")
+            ready, *results = await pipe.execute()
+        if ready:
+            self._ready = True
+            if self._fallback_prefix != self.followers_key(""):
+                self._logger.info(f"Follower index {self.prefix} is ready, no longer reading {self._fallback_prefix}*")
+            return None
+        return {account_id: {int(member) for member in members} for account_id, members in zip(account_ids, results)}
+
+    async def _find_fallback_prefix(self) -> str:
+        for version in range(self.version - 1, self.FIRST_VERSION - 1, -1):
+            previous = f"{self.namespace}:v{version}:"
+            if await self.redis_client.exists(f"{previous}ready"):
+                prefix = f"{previous}followers:"
+                break
+        else:
+            # The unversioned index keeps followers under the bare account ID
+            prefix = "" if await self.redis_client.exists(self.LEGACY_SENTINEL_KEY) else self.followers_key("")
+        if prefix != self.followers_key(""):
+            self._logger.warning(f"Follower index {self.prefix} is not ready yet, reading followers from {prefix or 'the unversioned index'}")
+        return prefix
+
+    async def get_followers(self, account_id: int) -> Set[int]:
+        return (await self.get_followers_many([account_id]))[account_id]
+
+    async def get_following(self, user_id: int) -> Set[int]:
+        """Every account the user follows, notifiable or not."""
+        return {int(member) for member in await self.redis_client.smembers(self.following_key(user_id))}
+
+    async def get_notifiable(self) -> Set[int]:
+        return {int(member) for member in await self.redis_client.smembers(self.notifiable_key)}
+
+    async def iter_followers(self) -> AsyncIterator[Tuple[int, List[int]]]:
+        """(account ID, notifiable follower IDs) of every followed account, read in pipelined batches."""
+        async for item in self._iter_sets(self.followers_key("")):
+            yield item
+
+    async def iter_following(self) -> AsyncIterator[Tuple[int, List[int]]]:
+        """(user ID, followed account IDs) of every user following someone, read in pipelined batches."""
+        async for item in self._iter_sets(self.following_key("")):
+            yield item
+
+    async def _iter_sets(self, prefix: str) -> AsyncIterator[Tuple[int, List[int]]]:
+        keys = []
+        async for key in self.redis_client.scan_iter(match=f"{prefix}*", count=self.SCAN_COUNT):
+            keys.append(key.decode() if isinstance(key, bytes) else key)
+            if len(keys) >= self.BATCH_SIZE:
+                async for item in self._read_sets(prefix, keys):
+                    yield item
+                keys = []
+        async for item in self._read_sets(prefix, keys):
+            yield item
+
+    async def _read_sets(self, prefix: str, keys: List[str]) -> AsyncIterator[Tuple[int, List[int]]]:
+        if not keys:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.smembers(key)
+        for key, members in zip(keys, await pipe.execute()):
+            if members:
+                yield int(key[len(prefix):]), sorted(int(member) for member in members)
+
+    async def load(self, following: Dict[int | str, Iterable[int]], notifiable: Iterable[int | str]):
+        """
+        Overwrite the followed accounts of the given users in one transaction,
+        adding the followers edges of the notifiable ones.
+
+        Meant for filling an empty layout: followers edges of accounts that are
+        no longer followed are left in place.
+        """
+        notifiable = {int(user_id) for user_id in notifiable}
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            if notifiable:
+                pipe.sadd(self.notifiable_key, *notifiable)
+            for user_id, account_ids in following.items():
+                account_ids = [int(account_id) for account_id in account_ids]
+                pipe.delete(self.following_key(user_id))
+                if not account_ids:
+                    continue
+                pipe.sadd(self.following_key(user_id), *account_ids)
+                if int(user_id) in notifiable:
+                    for account_id in account_ids:
+                        pipe.sadd(self.followers_key(account_id), int(user_id))
+            await pipe.execute()
+
+    async def drop(self) -> int:
+        """Delete every key of this layout version. Returns the number of keys deleted."""
+        deleted = 0
+        keys = []
+        async for key in self.redis_client.scan_iter(match=f"{self.prefix}*", count=self.SCAN_COUNT):
+            keys.append(key)
+            if len(keys) >= self.BATCH_SIZE:
+                deleted += await self.redis_client.delete(*keys)
+                keys = []
+        if keys:
+            deleted += await self.redis_client.delete(*keys)
+        return deleted
+
+    async def replace_with(self, other: "FollowerIndex") -> int:
+        """
+        Atomically replace this index with another one, e.g. built in a shadow namespace.
+
+        Every key of the other index is renamed into this one and keys it does
+        not have are deleted, in one MULTI/EXEC. Readers see either index
+        completely, but the EXEC blocks Redis for a time proportional to the
+        number of keys.
+
+        Returns:
+            Number of keys moved
+        """
+        own_keys = set()
+        async for key in self.redis_client.scan_iter(match=f"{self.prefix}*", count=self.SCAN_COUNT):
+            own_keys.add(key.decode() if isinstance(key, bytes) else key)
+        other_keys = []
+        async for key in self.redis_client.scan_iter(match=f"{other.prefix}*", count=self.SCAN_COUNT):
+            other_keys.append(key.decode() if isinstance(key, bytes) else key)
+        renamed = {self.prefix + key[len(other.prefix):]: key for key in other_keys}
+
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            stale = sorted(own_keys - renamed.keys())
+            for start in range(0, len(stale), self.BATCH_SIZE):
+                pipe.delete(*stale[start:start + self.BATCH_SIZE])
+            for key, other_key in renamed.items():
+                pipe.rename(other_key, key)
+            await pipe.execute()
+        self._logger.info(f"Replaced {self.prefix} with {len(renamed)} keys of {other.prefix}, deleted {len(stale)} stale keys")
+        return len(renamed)
+
+    async def drop_previous_layouts(self) -> int:
+        """
+        Delete the keys of older layout versions and of the unversioned index.
+
+        Older layouts lack the notifiable set, so they are rebuilt from the
+        change feed rather than migrated, and only dropped once this layout is
+        ready; readers use them until then.
+
+        Returns:
+            Number of keys deleted
+        """
+        deleted = 0
+        for version in range(self.FIRST_VERSION, self.version):
+            deleted += await FollowerIndex(self.redis_client, version).drop()
+
+        if await self.redis_client.exists(self.LEGACY_SENTINEL_KEY):
+            keys = []
+            async for key in self.redis_client.scan_iter(match="[0-9]*", count=self.SCAN_COUNT, _type="SET"):
+                key = key.decode() if isinstance(key, bytes) else key
+                if key.isdigit():
+                    keys.append(key)
+            for start in range(0, len(keys), self.BATCH_SIZE):
+                deleted += await self.redis_client.delete(*keys[start:start + self.BATCH_SIZE])
+            deleted += await self.redis_client.delete(self.LEGACY_SENTINEL_KEY)
+
+        if deleted:
+            self._logger.info(f"Dropped {deleted} keys of previous follower index layouts")
+        return deleted
+
+    async def memory_report(self, sample_size: int = 200) -> dict:
+        """
+        Memory used by the index, extrapolated from MEMORY USAGE of a sample of
+        the sets and of the edge versions hashes each.
+
+        Returns:
+            Key, edge and version counts, encodings of the sampled keys,
+            estimated bytes and bytes per million follow edges
+        """
+        sizes = {}
+        for key_type, size_command in (("SET", "scard"), ("HASH", "hlen")):
+            keys = []
+            async for key in self.redis_client.scan_iter(match=f"{self.prefix}*", count=self.SCAN_COUNT, _type=key_type):
+                keys.append(key.decode() if isinstance(key, bytes) else key)
+            lengths = []
+            for start in range(0, len(keys), self.BATCH_SIZE):
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key in keys[start:start + self.BATCH_SIZE]:
+                    getattr(pipe, size_command)(key)
+                lengths.extend(await pipe.execute())
+            sizes[key_type] = dict(zip(keys, lengths))
+
+        set_sizes = sizes["SET"]
+        # Every edge is in a following set, only those of notifiable users also in a followers set
+        edges = sum(size for key, size in set_sizes.items() if key.startswith(self.following_key("")))
+        notifiable_edges = sum(size for key, size in set_sizes.items() if key.startswith(self.followers_key("")))
+        # Versions of existing edges and of removed ones not pruned yet
+        versions = sum(size for key, size in sizes["HASH"].items() if key.startswith(self.versions_key("")))
+
+        # Sets and hashes differ a lot in size, so each type is extrapolated from its own sample
+        estimated_bytes = 0
+        sampled_keys = 0
+        encodings = Counter()
+        for type_sizes in sizes.values():
+            keys = list(type_sizes)
+            step = max(1, len(keys) // sample_size)
+            sample = keys[::step][:sample_size]
+            if not sample:
+                continue
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in sample:
+                pipe.memory_usage(key)
+                pipe.object("encoding", key)
+            results = await pipe.execute()
+            sampled_bytes = sum(usage or 0 for usage in results[0::2])
+            encodings.update(encoding.decode() if isinstance(encoding, bytes) else str(encoding) for encoding in results[1::2])
+            estimated_bytes += int(sampled_bytes / len(sample) * len(keys))
+            sampled_keys += len(sample)
+
+        return {
+            "version": self.version,
+            "keys": sum(len(type_sizes) for type_sizes in sizes.values()),
+            "edges": edges,
+            "notifiable_edges": notifiable_edges,
+            "notifiable_users": set_sizes.get(self.notifiable_key, 0),
+            "versions": versions,
+            "sampled_keys": sampled_keys,
+            "encodings": dict(encodings),
+            "estimated_bytes": estimated_bytes,
+            "bytes_per_million_edges": int(estimated_bytes / edges * 1_000_000) if edges else 0,
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import httpx
+
+
+class LatencyTracker:
+    """Sliding window of recent response times for one endpoint."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._min_samples = min_samples
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> float | None:
+        """Observed latency percentile, or None until enough samples were collected."""
+        if len(self._samples) < self._min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class HedgedRequester:
+    """
+    Issues HTTP requests with a per-endpoint deadline.
+
+    GET requests are idempotent, so when the first attempt has not answered
+    after the endpoint's observed p95 latency a duplicate is sent. The first
+    successful response wins and the other attempt is cancelled. Callers
+    with a request budget pass `acquire_hedge`, which must not block: the
+    duplicate is only sent if it grants one more request.
+    """
+    HEDGE_PERCENTILE = 0.95
+    MIN_HEDGE_DELAY_SECONDS = 0.05
+
+    def __init__(self, client: httpx.AsyncClient, deadlines: dict[str, float], default_deadline: float = 10.0, hedging: bool = True):
+        """
+        Initialize the requester.
+
+        Args:
+            client: HTTP client used for every attempt
+            deadlines: Deadline in seconds per endpoint name
+            default_deadline: Deadline for endpoints missing from deadlines
+            hedging: Whether GET requests may be hedged
+        """
+        self.client = client
+        self._deadlines = deadlines
+        self._default_deadline = default_deadline
+        self._hedging = hedging
+        self._latencies: dict[str, LatencyTracker] = {}
+        self._stats: dict[str, dict] = {}
+        self._logger = logging.getLogger(__name__)
+
+    def _endpoint_stats(self, endpoint: str) -> dict:
+        if endpoint not in self._stats:
+            self._stats[endpoint] = {"requests": 0, "hedged": 0, "hedge_wins": 0, "hedges_skipped": 0, "deadline_exceeded": 0}
+            self._latencies[endpoint] = LatencyTracker()
+        return self._stats[endpoint]
+
+    def stats(self) -> dict[str, dict]:
+        """Per-endpoint request, hedge and deadline counters with the current p95 latency."""
+        return {
+            endpoint: {
+                **stats,
+                "hedge_rate": stats["hedged"] / stats["requests"] if stats["requests"] else 0.0,
+                "p95_seconds": self._latencies[endpoint].percentile(self.HEDGE_PERCENTILE),
+            }
+            for endpoint, stats in self._stats.items()
+        }
+
+    async def get(
+        self,
+        endpoint: str,
+        url: str,
+        hedge: bool = True,
+        acquire_hedge: Callable[[], Awaitable[bool]] | None = None,
+        **kwargs
+    ) -> httpx.Response:
+        return await self._request(endpoint, "GET", url, self._hedging and hedge, acquire_hedge, **kwargs)
+
+    async def post(self, endpoint: str, url: str, **kwargs) -> httpx.Response:
+        return await self._request(endpoint, "POST", url, False, None, **kwargs)
+
+    async def _request(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        hedge: bool,
+        acquire_hedge: Callable[[], Awaitable[bool]] | None,
+        **kwargs
+    ) -> httpx.Response:
+        stats = self._endpoint_stats(endpoint)
+        stats["requests"] += 1
+        deadline = self._deadlines.get(endpoint, self._default_deadline)
+        kwargs.setdefault("timeout", deadline)
+
+        try:
+            async with asyncio.timeout(deadline):
+                return await self._attempt(endpoint, stats, method, url, hedge, acquire_hedge, **kwargs)
+        except TimeoutError:
+            stats["deadline_exceeded"] += 1
+            raise httpx.TimeoutException(f"{endpoint} exceeded its {deadline}s deadline")
+
+    async def _attempt(
+        self,
+        endpoint: str,
+        stats: dict,
+        method: str,
+        url: str,
+        hedge: bool,
+        acquire_hedge: Callable[[], Awaitable[bool]] | None,
+        **kwargs
+    ) -> httpx.Response:
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self.client.request(method, url, **kwargs))
+        hedge_delay = self._latencies[endpoint].percentile(self.HEDGE_PERCENTILE) if hedge else None
+
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=max(hedge_delay, self.MIN_HEDGE_DELAY_SECONDS))
+                if not done and acquire_hedge and not await acquire_hedge():
+                    stats["hedges_skipped"] += 1
+                elif not done:
+                    stats["hedged"] += 1
+                    secondary = asyncio.ensure_future(self.client.request(method, url, **kwargs))
+                    response, winner = await self._first_success(primary, secondary)
+                    if winner is secondary:
+                        stats["hedge_wins"] += 1
+                    self._latencies[endpoint].record(time.monotonic() - started)
+                    return response
+
+            response = await primary
+            self._latencies[endpoint].record(time.monotonic() - started)
+            return response
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    @staticmethod
+    async def _first_success(*attempts: asyncio.Future) -> tuple[httpx.Response, asyncio.Future]:
+        pending = set(attempts)
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result(), attempt
+                if not pending:
+                    # Every attempt failed, surface the first one's error
+                    return attempts[0].result(), attempts[0]
+        finally:
+            for attempt in pending:
+                attempt.cancel()
@@ -0,0 +1,93 @@
+import asyncio
+import importlib.util
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Connection pool transport that keeps track of how close the pool is to saturation."""
+
+    def __init__(self, limits: httpx.Limits, **kwargs):
+        super().__init__(limits=limits, **kwargs)
+        self._max_connections = limits.max_connections
+        self._stats = {"requests": 0, "in_flight": 0, "peak_in_flight": 0, "saturated_requests": 0}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self._stats
+        stats["requests"] += 1
+        if self._max_connections is not None and stats["in_flight"] >= self._max_connections:
+            # Every connection is busy, so this request queues for one
+            stats["saturated_requests"] += 1
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            stats["in_flight"] -= 1
+
+    def stats(self) -> dict:
+        return {**self._stats, "max_connections": self._max_connections}
+
+
+class UpstreamPools:
+    """One HTTP client per upstream, each with its own connection pool and settings."""
+    STEAM_API = "steam_api"
+    STEAM_OPENID = "steam_openid"
+    TELEGRAM = "telegram"
+
+    WARMUP_URLS = {
+        STEAM_API: "https://api.steampowered.com/",
+        STEAM_OPENID: "https://steamcommunity.com/openid/login",
+        TELEGRAM: "https://api.telegram.org/",
+    }
+
+    def __init__(self, limits: dict[str, httpx.Limits], http2: bool = False, event_hooks: dict | None = None):
+        """
+        Create the clients.
+
+        Args:
+            limits: Pool limits per upstream name, only these upstreams get a client
+            http2: Whether to negotiate HTTP/2 (needs the optional h2 package)
+            event_hooks: httpx event hooks shared by all clients
+        """
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+
+        self._transports: dict[str, InstrumentedTransport] = {}
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        for name, upstream_limits in limits.items():
+            transport = InstrumentedTransport(limits=upstream_limits, http2=http2)
+            self._transports[name] = transport
+            self._clients[name] = httpx.AsyncClient(transport=transport, event_hooks=event_hooks)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    def __getitem__(self, name: str) -> httpx.AsyncClient:
+        return self._clients[name]
+
+    async def prewarm(self, timeout: float = 5.0):
+        """Open a connection to every upstream so the first real request skips the TLS handshake."""
+        async def warm(name: str, client: httpx.AsyncClient):
+            try:
+                await client.head(self.WARMUP_URLS[name], timeout=timeout)
+                logger.info(f"Pre-warmed connection to {name}")
+            except httpx.HTTPError as ex:
+                logger.warning(f"Could not pre-warm connection to {name}: {ex}")
+
+        await asyncio.gather(*(warm(name, client) for name, client in self._clients.items()))
+
+    def stats(self) -> dict[str, dict]:
+        """Request counts, in-flight requests and saturation per upstream pool."""
+        return {name: transport.stats() for name, transport in self._transports.items()}
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
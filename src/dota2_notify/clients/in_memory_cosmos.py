@@ -0,0 +1,563 @@
+import asyncio
+import copy
+import json
+import operator
+import random
+import re
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+# Request charges are rough approximations of what Cosmos DB bills for small documents
+READ_REQUEST_CHARGE = 1.0
+WRITE_REQUEST_CHARGE = 6.0
+QUERY_REQUEST_CHARGE = 2.5
+QUERY_ITEM_REQUEST_CHARGE = 0.1
+
+_SELECT = re.compile(
+    r"^\s*SELECT\s+(?P<projection>.+?)\s+FROM\s+c(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+GROUP\s+BY\s+(?P<group_by>.+?))?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+_COMPARISON = re.compile(r"^c\.(?P<field>\w+)\s*=\s*(?P<value>@\w+|'[^']*'|true|false|-?\d+)$", re.IGNORECASE)
+_ARRAY_CONTAINS = re.compile(r"^ARRAY_CONTAINS\(\s*(?P<array>@\w+)\s*,\s*(?P<expression>.+)\)$", re.IGNORECASE | re.DOTALL)
+_PROJECTION = re.compile(r"^(?P<expression>.+?)(?:\s+AS\s+(?P<alias>\w+))?$", re.IGNORECASE | re.DOTALL)
+_AGGREGATE = re.compile(r"^(?P<function>COUNT|SUM)\s*\((?P<argument>.+)\)$", re.IGNORECASE | re.DOTALL)
+_EXPRESSION_TOKEN = re.compile(r"\s*(c\.\w+|@\w+|\d+|StringToNumber|[-+*%()])", re.IGNORECASE)
+_OPERATORS = {"+": operator.add, "-": operator.sub, "*": operator.mul, "%": operator.mod}
+
+
+def _string_to_number(value: Any) -> Any:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def _compile_expression(text: str, literal: Callable[[str], Any]) -> Callable[[dict], Any]:
+    """
+    Compile arithmetic (+, -, *, %) of numbers, parameters, c.<field> and
+    StringToNumber(...). Like in Cosmos SQL, an undefined operand makes the
+    result undefined (None).
+    """
+    tokens = []
+    position = 0
+    while text[position:].strip():
+        token = _EXPRESSION_TOKEN.match(text, position)
+        if not token:
+            raise ValueError(f"Unsupported expression: {text}")
+        tokens.append(token[1])
+        position = token.end()
+    tokens.append(None)
+
+    def expect(index: int, token: Optional[str]) -> int:
+        if tokens[index] != token:
+            raise ValueError(f"Unsupported expression: {text}")
+        return index + 1
+
+    def parse_operand(index: int) -> Tuple[Callable[[dict], Any], int]:
+        token = tokens[index]
+        if token == "(":
+            value, index = parse_sum(index + 1)
+            return value, expect(index, ")")
+        if token and token.lower() == "stringtonumber":
+            argument, index = parse_sum(expect(index + 1, "("))
+            return (lambda doc: _string_to_number(argument(doc))), expect(index, ")")
+        if token and token.startswith("c."):
+            return (lambda doc, field=token[2:]: doc.get(field)), index + 1
+        if token and (token.startswith("@") or token.isdigit()):
+            return (lambda doc, value=literal(token): value), index + 1
+        raise ValueError(f"Unsupported expression: {text}")
+
+    def parse_operations(index: int, parse: Callable, operators: str) -> Tuple[Callable[[dict], Any], int]:
+        left, index = parse(index)
+        while tokens[index] is not None and tokens[index] in operators:
+            apply = _OPERATORS[tokens[index]]
+            right, index = parse(index + 1)
+            left = lambda doc, left=left, right=right, apply=apply: (
+                None if (a := left(doc)) is None or (b := right(doc)) is None else apply(a, b)
+            )
+        return left, index
+
+    def parse_product(index: int) -> Tuple[Callable[[dict], Any], int]:
+        return parse_operations(index, parse_operand, "*%")
+
+    def parse_sum(index: int) -> Tuple[Callable[[dict], Any], int]:
+        return parse_operations(index, parse_product, "+-")
+
+    expression, index = parse_sum(0)
+    expect(index, None)
+    return expression
+
+
+def _split_projection(projection: str) -> List[str]:
+    """Split a projection at the commas outside parentheses."""
+    items = []
+    depth = start = 0
+    for index, char in enumerate(projection):
+        depth += (char == "(") - (char == ")")
+        if char == "," and not depth:
+            items.append(projection[start:index].strip())
+            start = index + 1
+    return items + [projection[start:].strip()]
+
+
+def _compile_group_by(projection: str, group_by: str, literal: Callable[[str], Any]) -> Callable[[List[dict]], List[dict]]:
+    """Compile a projection of the grouped expression and COUNT/SUM aggregates into a function from documents to result rows."""
+    group_key = _compile_expression(group_by, literal)
+    items = []
+    for position, item in enumerate(_split_projection(projection), start=1):
+        parsed = _PROJECTION.match(item)
+        alias = parsed["alias"] or f"${position}"
+        if aggregate := _AGGREGATE.match(parsed["expression"].strip()):
+            items.append((alias, aggregate["function"].upper(), _compile_expression(aggregate["argument"], literal)))
+        else:
+            items.append((alias, None, _compile_expression(parsed["expression"], literal)))
+
+    def aggregate(docs: List[dict]) -> List[dict]:
+        groups: Dict[Any, List[dict]] = {}
+        for doc in docs:
+            groups.setdefault(group_key(doc), []).append(doc)
+        rows = []
+        for group in groups.values():
+            row = {}
+            for alias, function, expression in items:
+                values = [value for value in map(expression, group) if value is not None]
+                if function == "COUNT":
+                    row[alias] = len(values)
+                elif function == "SUM":
+                    row[alias] = sum(values)
+                else:
+                    row[alias] = expression(group[0])
+            rows.append(row)
+        return rows
+    return aggregate
+
+
+def _compile_query(
+    query: str,
+    parameters: Optional[List[dict]]
+) -> Tuple[Callable[[dict], bool], Optional[List[str]], Optional[Callable[[List[dict]], List[dict]]]]:
+    """
+    Compile the subset of Cosmos SQL the services use: SELECT * or c.<field>
+    projections FROM c, with a WHERE clause of AND-ed equality comparisons and
+    ARRAY_CONTAINS(@param, <expression>), optionally with COUNT and SUM
+    aggregates GROUP BY an expression.
+
+    Returns:
+        Predicate of matching documents, projected fields (None for all), and
+        for GROUP BY queries a function from the matching documents to the result rows
+    """
+    match = _SELECT.match(query)
+    if not match:
+        raise ValueError(f"Unsupported query: {query}")
+    values = {parameter["name"]: parameter["value"] for parameter in parameters or []}
+
+    def literal(token: str) -> Any:
+        if token.startswith("@"):
+            return values[token]
+        if token.startswith("'"):
+            return token[1:-1]
+        if token.lower() in ("true", "false"):
+            return token.lower() == "true"
+        return int(token)
+
+    predicates = []
+    for condition in re.split(r"\s+AND\s+", match["where"], flags=re.IGNORECASE) if match["where"] else []:
+        condition = condition.strip()
+        if comparison := _COMPARISON.match(condition):
+            field, expected = comparison["field"], literal(comparison["value"])
+            predicates.append(lambda doc, field=field, expected=expected: field in doc and doc[field] == expected)
+        elif contains := _ARRAY_CONTAINS.match(condition):
+            expression, array = _compile_expression(contains["expression"], literal), literal(contains["array"])
+            predicates.append(lambda doc, expression=expression, array=array: expression(doc) in array)
+        else:
+            raise ValueError(f"Unsupported condition: {condition}")
+    matches = lambda doc: all(predicate(doc) for predicate in predicates)
+
+    projection = match["projection"].strip()
+    if match["group_by"]:
+        return matches, None, _compile_group_by(projection, match["group_by"], literal)
+    fields = None if projection == "*" else [field.strip().removeprefix("c.") for field in projection.split(",")]
+    return matches, fields, None
+
+
+class _ClientConnection:
+    """Stands in for the SDK's client connection, which exposes the headers of the last response."""
+
+    def __init__(self):
+        self.last_response_headers: Dict[str, str] = {}
+
+
+class InMemoryPager:
+    """Page iterator returned by InMemoryItemPaged.by_page, with the SDK's continuation_token attribute."""
+
+    def __init__(self, fetch_page: Callable[[Optional[str]], Awaitable[Tuple[List[dict], Optional[str], bool]]], continuation_token: Optional[str]):
+        self._fetch_page = fetch_page
+        self.continuation_token = continuation_token
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        items, self.continuation_token, has_more = await self._fetch_page(self.continuation_token)
+        self._done = not has_more
+        if not items and self._done:
+            raise StopAsyncIteration
+
+        async def page():
+            for item in items:
+                yield item
+        return page()
+
+
+class InMemoryItemPaged:
+    """Result of query_items and query_items_change_feed: iterate items directly or page by page."""
+
+    def __init__(self, fetch_page: Callable[[Optional[str]], Awaitable[Tuple[List[dict], Optional[str], bool]]], continuation: Optional[str] = None):
+        self._fetch_page = fetch_page
+        self._continuation = continuation
+
+    def by_page(self, continuation_token: Optional[str] = None) -> InMemoryPager:
+        return InMemoryPager(self._fetch_page, continuation_token or self._continuation)
+
+    async def __aiter__(self):
+        async for page in self.by_page():
+            async for item in page:
+                yield item
+
+
+class InMemoryContainer:
+    """
+    In-memory stand-in for an azure.cosmos.aio ContainerProxy.
+
+    Supports the container methods the services use, with the SDK's exception
+    types, system properties (_etag, _ts, _lsn), request charge headers and a
+    latest-version change feed split into feed ranges. Every request can be
+    delayed and randomly throttled with a 429 to load-test callers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        partition_key_path: str = "/id",
+        latency_seconds: float = 0.0,
+        latency_jitter_seconds: float = 0.0,
+        throttle_probability: float = 0.0,
+        retry_after_ms: int = 100,
+        feed_range_count: int = 1,
+        seed: Optional[int] = None
+    ):
+        """
+        Initialize the container.
+
+        Args:
+            name: Container name
+            partition_key_path: Path of the partition key property, e.g. "/userId"
+            latency_seconds: Delay added to every request
+            latency_jitter_seconds: Random extra delay of up to this much per request
+            throttle_probability: Probability that a request fails with 429 (Too Many Requests)
+            retry_after_ms: Value of the x-ms-retry-after-ms header on throttled requests
+            feed_range_count: Number of feed ranges the partitions are spread over
+            seed: Seed for the latency jitter and throttling decisions
+        """
+        self.id = name
+        self._partition_key_field = partition_key_path.lstrip("/")
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.throttle_probability = throttle_probability
+        self.retry_after_ms = retry_after_ms
+        self._feed_range_count = feed_range_count
+        self._random = random.Random(seed)
+        self._items: Dict[Tuple[Any, str], dict] = {}
+        self._lsn = 0
+        self.client_connection = _ClientConnection()
+        self.stats = {"requests": 0, "throttled": 0, "request_charge": 0.0}
+
+    def _partition_key(self, doc: dict) -> Any:
+        return doc.get(self._partition_key_field)
+
+    def _feed_range_of(self, partition_key: Any) -> int:
+        return zlib.crc32(json.dumps(partition_key).encode()) % self._feed_range_count
+
+    async def _request(self, request_charge: float, response_hook: Optional[Callable] = None, body: Any = None, **headers: str):
+        """Simulate the round trip of one request and report its headers."""
+        self.stats["requests"] += 1
+        delay = self.latency_seconds + self._random.uniform(0, self.latency_jitter_seconds)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.throttle_probability and self._random.random() < self.throttle_probability:
+            self.stats["throttled"] += 1
+            error = exceptions.CosmosHttpResponseError(status_code=429, message="Request rate is large")
+            error.headers = {"x-ms-retry-after-ms": str(self.retry_after_ms)}
+            raise error
+        self.stats["request_charge"] += request_charge
+        response_headers = {"x-ms-request-charge": str(request_charge), **headers}
+        self.client_connection.last_response_headers = response_headers
+        if response_hook:
+            response_hook(response_headers, body)
+
+    def _store(self, doc: dict) -> dict:
+        self._lsn += 1
+        stored = {**copy.deepcopy(doc), "_etag": f'"{self._lsn:08x}"', "_ts": int(time.time()), "_lsn": self._lsn}
+        self._items[(self._partition_key(doc), doc["id"])] = stored
+        return copy.deepcopy(stored)
+
+    def _get(self, item: str, partition_key: Any) -> dict:
+        try:
+            return self._items[(partition_key, item)]
+        except KeyError:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"Item {item} not found") from None
+
+    ##
+    ## Point operations
+    ##
+
+    async def read_item(self, item: str, partition_key: Any, response_hook: Optional[Callable] = None, **kwargs) -> dict:
+        await self._request(READ_REQUEST_CHARGE)
+        doc = copy.deepcopy(self._get(item, partition_key))
+        if response_hook:
+            response_hook(self.client_connection.last_response_headers, doc)
+        return doc
+
+    async def create_item(self, body: dict, response_hook: Optional[Callable] = None, **kwargs) -> dict:
+        await self._request(WRITE_REQUEST_CHARGE)
+        if (self._partition_key(body), body["id"]) in self._items:
+            raise exceptions.CosmosResourceExistsError(status_code=409, message=f"Item {body['id']} already exists")
+        doc = self._store(body)
+        if response_hook:
+            response_hook(self.client_connection.last_response_headers, doc)
+        return doc
+
+    async def upsert_item(self, body: dict, response_hook: Optional[Callable] = None, **kwargs) -> dict:
+        await self._request(WRITE_REQUEST_CHARGE)
+        doc = self._store(body)
+        if response_hook:
+            response_hook(self.client_connection.last_response_headers, doc)
+        return doc
+
+    async def delete_item(self, item: str, partition_key: Any, response_hook: Optional[Callable] = None, **kwargs):
+        await self._request(WRITE_REQUEST_CHARGE, response_hook)
+        self._get(item, partition_key)
+        del self._items[(partition_key, item)]
+
+    async def patch_item(
+        self,
+        item: str,
+        partition_key: Any,
+        patch_operations: List[dict],
+        etag: Optional[str] = None,
+        match_condition: Optional[MatchConditions] = None,
+        response_hook: Optional[Callable] = None,
+        **kwargs
+    ) -> dict:
+        await self._request(WRITE_REQUEST_CHARGE)
+        doc = copy.deepcopy(self._get(item, partition_key))
+        if match_condition == MatchConditions.IfNotModified and doc["_etag"] != etag:
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message=f"Item {item} was modified")
+        for operation in patch_operations:
+            field = operation["path"].lstrip("/")
+            if operation["op"] in ("set", "replace", "add"):
+                doc[field] = operation["value"]
+            elif operation["op"] == "remove":
+                doc.pop(field, None)
+            elif operation["op"] == "incr":
+                doc[field] = doc.get(field, 0) + operation["value"]
+            else:
+                raise ValueError(f"Unsupported patch operation: {operation['op']}")
+        stored = self._store(doc)
+        if response_hook:
+            response_hook(self.client_connection.last_response_headers, stored)
+        return stored
+
+    async def execute_item_batch(self, batch_operations: List[tuple], partition_key: Any, response_hook: Optional[Callable] = None, **kwargs) -> List[dict]:
+        """Apply all operations of one partition or none of them."""
+        await self._request(WRITE_REQUEST_CHARGE * len(batch_operations), response_hook)
+        staged = dict(self._items)
+        results = []
+        for index, (operation, args, *_) in enumerate(batch_operations):
+            if operation in ("create", "upsert", "replace"):
+                body = args[-1]
+                key = (self._partition_key(body), body["id"])
+                if key[0] != partition_key or (operation == "replace" and key not in staged):
+                    raise exceptions.CosmosBatchOperationError(error_index=index, headers={}, status_code=400, operation_responses=[], message=f"{operation} of {body['id']} failed")
+                if operation == "create" and key in staged:
+                    raise exceptions.CosmosBatchOperationError(error_index=index, headers={}, status_code=409, operation_responses=[], message=f"{body['id']} already exists")
+                staged[key] = body
+                results.append({"statusCode": 201 if operation == "create" else 200})
+            elif operation in ("delete", "read"):
+                key = (partition_key, args[0])
+                if key not in staged:
+                    raise exceptions.CosmosBatchOperationError(error_index=index, headers={}, status_code=404, operation_responses=[], message=f"{operation} of {args[0]} failed")
+                if operation == "delete":
+                    del staged[key]
+                results.append({"statusCode": 200, "resourceBody": copy.deepcopy(staged.get(key))})
+            else:
+                raise ValueError(f"Unsupported batch operation: {operation}")
+
+        for key in set(self._items) - set(staged):
+            del self._items[key]
+        for key, body in staged.items():
+            if self._items.get(key) is not body:
+                self._store(body)
+        return results
+
+    ##
+    ## Queries and change feed
+    ##
+
+    def query_items(
+        self,
+        query: str,
+        parameters: Optional[List[dict]] = None,
+        partition_key: Any = None,
+        max_item_count: Optional[int] = None,
+        response_hook: Optional[Callable] = None,
+        feed_range: Optional[dict] = None,
+        **kwargs
+    ) -> InMemoryItemPaged:
+        matches, fields, aggregate = _compile_query(query, parameters)
+        page_size = max_item_count or 100
+
+        async def fetch_page(continuation: Optional[str]) -> Tuple[List[dict], Optional[str], bool]:
+            offset = int(continuation or 0)
+            docs = [
+                doc for (doc_partition_key, _), doc in self._items.items()
+                if (partition_key is None or doc_partition_key == partition_key)
+                and (feed_range is None or self._feed_range_of(doc_partition_key) == feed_range["inMemoryFeedRange"])
+                and matches(doc)
+            ]
+            if aggregate:
+                docs = aggregate(docs)
+            page = docs[offset:offset + page_size]
+            if fields is not None:
+                page = [{field: doc[field] for field in fields if field in doc} for doc in page]
+            elif not aggregate:
+                page = copy.deepcopy(page)
+            await self._request(QUERY_REQUEST_CHARGE + QUERY_ITEM_REQUEST_CHARGE * len(page), response_hook, page)
+            has_more = offset + page_size < len(docs)
+            return page, str(offset + page_size) if has_more else None, has_more
+
+        return InMemoryItemPaged(fetch_page)
+
+    def read_feed_ranges(self, **kwargs):
+        """Opaque feed ranges; every partition key belongs to exactly one of them."""
+        async def feed_ranges():
+            for index in range(self._feed_range_count):
+                yield {"inMemoryFeedRange": index, "count": self._feed_range_count}
+        return feed_ranges()
+
+    def query_items_change_feed(
+        self,
+        continuation: Optional[str] = None,
+        start_time: Any = None,
+        feed_range: Optional[dict] = None,
+        max_item_count: Optional[int] = None,
+        response_hook: Optional[Callable] = None,
+        **kwargs
+    ) -> InMemoryItemPaged:
+        """
+        Latest version of every item changed after the continuation, in write order.
+
+        Like Cosmos DB the continuation token is returned in the etag response
+        header; it remembers the feed range it was created for. As with the
+        SDK, a response hook is called with the raw LSN etag and the headers
+        it got are updated to the continuation after it returned. Without a
+        continuation the feed starts at the beginning (start_time="Beginning"),
+        after a point in time (a datetime) or at the current position.
+        """
+        if continuation:
+            state = json.loads(continuation)
+        else:
+            if start_time == "Beginning":
+                lsn = 0
+            elif isinstance(start_time, datetime):
+                lsn = max((doc["_lsn"] for doc in self._items.values() if doc["_ts"] < start_time.timestamp()), default=0)
+            else:
+                lsn = self._lsn
+            state = {"range": feed_range["inMemoryFeedRange"] if feed_range else None, "lsn": lsn}
+        page_size = max_item_count or 100
+
+        async def fetch_page(token: Optional[str]) -> Tuple[List[dict], Optional[str], bool]:
+            position = json.loads(token)["lsn"] if token else state["lsn"]
+            changed = sorted(
+                (
+                    doc for (partition_key, _), doc in self._items.items()
+                    if doc["_lsn"] > position and (state["range"] is None or self._feed_range_of(partition_key) == state["range"])
+                ),
+                key=lambda doc: doc["_lsn"]
+            )
+            page = copy.deepcopy(changed[:page_size])
+            lsn = page[-1]["_lsn"] if page else position
+            next_token = json.dumps({"range": state["range"], "lsn": lsn})
+            # The hook sees the server's raw LSN etag, the SDK swaps in its continuation after
+            await self._request(QUERY_REQUEST_CHARGE + QUERY_ITEM_REQUEST_CHARGE * len(page), response_hook, page, etag=f'"{lsn}"')
+            self.client_connection.last_response_headers["etag"] = next_token
+            return page, next_token, len(changed) > page_size
+
+        return InMemoryItemPaged(fetch_page, json.dumps(state))
+
+
+class InMemoryDatabase:
+    def __init__(self, client: "InMemoryCosmosClient", name: str):
+        self.id = name
+        self._client = client
+        self._containers: Dict[str, InMemoryContainer] = {}
+
+    def get_container_client(self, container: str) -> InMemoryContainer:
+        if container not in self._containers:
+            self._containers[container] = InMemoryContainer(
+                container,
+                partition_key_path=self._client.partition_key_paths.get(container, "/id"),
+                **{**self._client.container_options, **self._client.options_by_container.get(container, {})}
+            )
+        return self._containers[container]
+
+
+class InMemoryCosmosClient:
+    """
+    In-memory stand-in for azure.cosmos.aio.CosmosClient.
+
+    local-stack hands the same instance to the web app, match-notify and
+    data-sync to load-test them end-to-end without a Cosmos DB account.
+    """
+
+    def __init__(
+        self,
+        partition_key_paths: Optional[Dict[str, str]] = None,
+        options_by_container: Optional[Dict[str, dict]] = None,
+        **container_options
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            partition_key_paths: Partition key path per container name, "/id" if missing
+            options_by_container: Options of single containers by name, applied over `container_options`
+            container_options: Passed to every InMemoryContainer (latency, throttling, feed ranges, seed)
+        """
+        self.partition_key_paths = partition_key_paths or {}
+        self.options_by_container = options_by_container or {}
+        self.container_options = container_options
+        self._databases: Dict[str, InMemoryDatabase] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def get_database_client(self, database: str) -> InMemoryDatabase:
+        if database not in self._databases:
+            self._databases[database] = InMemoryDatabase(self, database)
+        return self._databases[database]
+
+    async def close(self):
+        pass
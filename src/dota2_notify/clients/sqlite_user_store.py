@@ -0,0 +1,374 @@
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import string
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dota2_notify.clients.user_store import PreconditionFailedError, QueryPage, UserStore
+from dota2_notify.models.user import Friend, User
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    user_id INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    following INTEGER NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS documents_type ON documents (type, user_id, id);
+
+-- Follow edges are only read from the Redis follower index, which data-sync builds from the change log
+DROP TABLE IF EXISTS following_index;
+
+-- Every written document, in write order; tailed by data-sync instead of the Cosmos DB change feed
+CREATE TABLE IF NOT EXISTS change_log (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS telegram_verify_tokens (
+    token TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS metadata (
+    id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+"""
+
+
+class SqliteMetadataContainer:
+    """The read_item/upsert_item/delete_item subset of a Cosmos container, for the small metadata documents the workers keep."""
+
+    def __init__(self, store: "SqliteUserStore"):
+        self._store = store
+
+    async def read_item(self, item: str, partition_key: str = None) -> dict:
+        doc = await self._store._run(lambda conn: conn.execute("SELECT doc FROM metadata WHERE id = ?", (item,)).fetchone())
+        if doc is None:
+            raise KeyError(item)
+        return json.loads(doc[0])
+
+    async def upsert_item(self, body: dict) -> dict:
+        await self._store._run(
+            lambda conn: conn.execute("INSERT OR REPLACE INTO metadata (id, doc) VALUES (?, ?)", (body["id"], json.dumps(body)))
+        )
+        return body
+
+    async def delete_item(self, item: str, partition_key: str = None):
+        await self._store._run(lambda conn: conn.execute("DELETE FROM metadata WHERE id = ?", (item,)))
+
+
+class SqliteUserStore(UserStore):
+    """
+    Users in a local SQLite database, for self-hosted and small deployments.
+
+    All statements run on one dedicated thread that owns the connection, so
+    the event loop never blocks on disk I/O. The database runs in WAL mode so
+    the web app, match-notify and data-sync processes can share the file.
+    """
+    TELEGRAM_TOKEN_TTL_SECONDS = 7 * 24 * 60 * 60
+
+    def __init__(self, path: str, busy_timeout_seconds: float = 5.0):
+        """
+        Initialize the store.
+
+        Args:
+            path: Path of the database file, created if missing
+            busy_timeout_seconds: How long a write waits for another process holding the write lock
+        """
+        self._path = path
+        self._busy_timeout_seconds = busy_timeout_seconds
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.metadata_container = SqliteMetadataContainer(self)
+        self._logger = logging.getLogger(__name__)
+
+    async def connect(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-user-store")
+        self._connection = await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+        self._logger.info(f"Opened SQLite user store {self._path}")
+
+    def _open(self) -> sqlite3.Connection:
+        # Autocommit mode, transactions are explicit (see _transaction)
+        conn = sqlite3.connect(self._path, timeout=self._busy_timeout_seconds, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    async def close(self):
+        if self._connection:
+            await self._run(lambda conn: conn.close())
+            self._connection = None
+            self._executor.shutdown()
+            self._executor = None
+            self._logger.info("Closed SQLite user store")
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, self._connection)
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE takes the write lock up front, so read-modify-write cannot interleave with another process
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, doc: dict) -> dict:
+        """Upsert a document and append it to the change log."""
+        doc = {**doc, "_ts": int(time.time()), "_etag": f'"{uuid.uuid4()}"'}
+        data = json.dumps(doc)
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (user_id, id, type, following, doc) VALUES (?, ?, ?, ?, ?)",
+            (doc["userId"], doc["id"], doc["type"], int(bool(doc.get("following"))), data)
+        )
+        conn.execute("INSERT INTO change_log (doc) VALUES (?)", (data,))
+        return doc
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, account_id: int, item_id: str, doc_type: str) -> Optional[dict]:
+        row = conn.execute(
+            "SELECT doc FROM documents WHERE user_id = ? AND id = ? AND type = ?", (account_id, item_id, doc_type)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _upsert(self, model: User | Friend) -> Callable[[sqlite3.Connection], dict]:
+        def upsert(conn: sqlite3.Connection) -> dict:
+            with self._transaction(conn):
+                return self._write(conn, model.model_dump(by_alias=True))
+        return upsert
+
+    ##
+    ## Users
+    ##
+
+    async def create_user_async(self, account_id: int, name: str, telegram_token: str) -> User:
+        user = User(
+            id=str(account_id),
+            user_id=account_id,
+            name=name,
+            telegram_chat_id="",
+            telegram_verify_token=telegram_token,
+            following=True,
+            type="user"
+        )
+
+        def create(conn: sqlite3.Connection) -> Optional[dict]:
+            with self._transaction(conn):
+                existing = self._read(conn, account_id, str(account_id), "user")
+                if existing:
+                    return existing
+                self._write(conn, user.model_dump(by_alias=True))
+                return None
+
+        existing = await self._run(create)
+        if existing:
+            self._logger.warning(f"User with Account ID {account_id} already exists")
+            return User.model_validate(existing)
+        self._logger.info(f"Created user {account_id}")
+        return user
+
+    async def get_user_async(self, account_id: int) -> Optional[User]:
+        doc = await self._run(lambda conn: self._read(conn, account_id, str(account_id), "user"))
+        return User.model_validate(doc) if doc else None
+
+    async def get_users_async(self, account_ids: List[int]) -> Dict[int, User]:
+        def read(conn: sqlite3.Connection) -> Dict[int, dict]:
+            docs = {account_id: self._read(conn, account_id, str(account_id), "user") for account_id in dict.fromkeys(account_ids)}
+            return {account_id: doc for account_id, doc in docs.items() if doc}
+
+        return {account_id: User.model_validate(doc) for account_id, doc in (await self._run(read)).items()}
+
+    async def get_all_users_async(self) -> List[User]:
+        rows = await self._run(lambda conn: conn.execute("SELECT doc FROM documents WHERE type = 'user' ORDER BY user_id").fetchall())
+        return [User.model_validate_json(row[0]) for row in rows]
+
+    async def iter_users_async(
+        self,
+        max_item_count: int = UserStore.DEFAULT_PAGE_SIZE,
+        continuation: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[QueryPage[User]]:
+        async for page in self._query_pages(User, "type = 'user'", (), max_item_count, continuation, fields):
+            yield page
+
+    async def update_user_async(self, user: User):
+        await self._run(self._upsert(user))
+
+    async def patch_user_async(self, account_id: int, fields: Dict[str, Any], etag: Optional[str] = None) -> Optional[User]:
+        doc = await self._run(self._patch(account_id, str(account_id), User, fields, etag))
+        return User.model_validate(doc) if doc else None
+
+    def _patch(self, account_id: int, item_id: str, model: type, fields: Dict[str, Any], etag: Optional[str]) -> Callable[[sqlite3.Connection], Optional[dict]]:
+        def patch(conn: sqlite3.Connection) -> Optional[dict]:
+            with self._transaction(conn):
+                doc = self._read(conn, account_id, item_id, model.model_fields["type"].default)
+                if doc is None:
+                    return None
+                if etag and doc.get("_etag") != etag:
+                    raise PreconditionFailedError(f"Document {item_id} changed since ETag {etag}")
+                doc.update({model.model_fields[name].alias or name: value for name, value in fields.items()})
+                return self._write(conn, doc)
+        return patch
+
+    ##
+    ## Friends
+    ##
+
+    async def get_friends_async(self, account_id: int, following: Optional[bool] = None) -> List[Friend]:
+        query = "SELECT doc FROM documents WHERE user_id = ? AND type = 'friend'"
+        parameters: Tuple = (account_id,)
+        if following is not None:
+            query += " AND following = ?"
+            parameters += (int(following),)
+        rows = await self._run(lambda conn: conn.execute(query, parameters).fetchall())
+        return [Friend.model_validate_json(row[0]) for row in rows]
+
+    async def iter_friends_async(
+        self,
+        account_id: int,
+        following: Optional[bool] = None,
+        max_item_count: int = UserStore.DEFAULT_PAGE_SIZE,
+        continuation: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[QueryPage[Friend]]:
+        condition = "user_id = ? AND type = 'friend'"
+        parameters: Tuple = (account_id,)
+        if following is not None:
+            condition += " AND following = ?"
+            parameters += (int(following),)
+        async for page in self._query_pages(Friend, condition, parameters, max_item_count, continuation, fields):
+            yield page
+
+    async def _query_pages(
+        self,
+        model: type,
+        condition: str,
+        parameters: Tuple,
+        max_item_count: int,
+        continuation: Optional[str],
+        fields: Optional[Sequence[str]]
+    ) -> AsyncIterator[QueryPage]:
+        # Keyset pagination on the primary key; the continuation is the last (user_id, id) returned
+        after = json.loads(continuation) if continuation else [-1, ""]
+        names = [model.model_fields[name].alias or name for name in fields] if fields else None
+        query = f"SELECT user_id, id, doc FROM documents WHERE {condition} AND (user_id, id) > (?, ?) ORDER BY user_id, id LIMIT ?"
+        while True:
+            rows = await self._run(lambda conn: conn.execute(query, (*parameters, *after, max_item_count)).fetchall())
+            if not rows:
+                return
+            docs = [json.loads(row[2]) for row in rows]
+            if names:
+                docs = [{name: doc[name] for name in names if name in doc} for doc in docs]
+            after = [rows[-1][0], rows[-1][1]]
+            continuation = json.dumps(after) if len(rows) == max_item_count else None
+            yield QueryPage(items=[model.model_validate(doc) for doc in docs], continuation=continuation)
+            if continuation is None:
+                return
+
+    async def get_friend_async(self, account_id: int, followed_player_id: int) -> Optional[Friend]:
+        doc = await self._run(lambda conn: self._read(conn, account_id, str(followed_player_id), "friend"))
+        return Friend.model_validate(doc) if doc else None
+
+    async def get_friends_by_ids_async(self, account_id: int, followed_player_ids: List[int]) -> Dict[int, Friend]:
+        def read(conn: sqlite3.Connection) -> Dict[int, dict]:
+            docs = {friend_id: self._read(conn, account_id, str(friend_id), "friend") for friend_id in dict.fromkeys(followed_player_ids)}
+            return {friend_id: doc for friend_id, doc in docs.items() if doc}
+
+        return {friend_id: Friend.model_validate(doc) for friend_id, doc in (await self._run(read)).items()}
+
+    async def update_friend_async(self, friend: Friend) -> Friend:
+        return Friend.model_validate(await self._run(self._upsert(friend)))
+
+    async def import_friends_async(self, account_id: int, friends: List[Friend], max_request_charge: Optional[float] = None) -> int:
+        # Local writes have no request charge, so the whole import is one
+        # transaction, which also keeps friends followed meanwhile as they are
+        def write(conn: sqlite3.Connection) -> int:
+            written = 0
+            with self._transaction(conn):
+                for friend in friends:
+                    if not self._read(conn, account_id, friend.id, "friend"):
+                        self._write(conn, friend.model_dump(by_alias=True))
+                        written += 1
+            return written
+
+        written = await self._run(write)
+        self._logger.info(f"Imported {written} friends for user {account_id}")
+        return written
+
+    async def patch_friend_async(self, account_id: int, followed_player_id: int, fields: Dict[str, Any], etag: Optional[str] = None) -> Optional[Friend]:
+        doc = await self._run(self._patch(account_id, str(followed_player_id), Friend, fields, etag))
+        return Friend.model_validate(doc) if doc else None
+
+    ##
+    ## Change log
+    ##
+
+    async def read_change_log_async(self, after_position: int = 0, limit: int = 1000) -> Tuple[List[dict], int]:
+        """
+        Documents written after a change log position, oldest first.
+
+        Returns:
+            The documents and the position to continue after them
+        """
+        rows = await self._run(
+            lambda conn: conn.execute(
+                "SELECT position, doc FROM change_log WHERE position > ? ORDER BY position LIMIT ?", (after_position, limit)
+            ).fetchall()
+        )
+        if not rows:
+            return [], after_position
+        return [json.loads(row[1]) for row in rows], rows[-1][0]
+
+    ##
+    ## Telegram verification token management
+    ##
+
+    async def create_telegram_verify_token_async(self, account_id: int) -> str:
+        def create(conn: sqlite3.Connection) -> Optional[str]:
+            token = ''.join(random.choices(string.ascii_letters, k=6))
+            now = time.time()
+            try:
+                conn.execute("DELETE FROM telegram_verify_tokens WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "INSERT INTO telegram_verify_tokens (token, user_id, expires_at) VALUES (?, ?, ?)",
+                    (token, account_id, now + self.TELEGRAM_TOKEN_TTL_SECONDS)
+                )
+                return token
+            except sqlite3.IntegrityError:
+                return None
+
+        max_attempts = 5
+        for attempt in range(1, max_attempts + 1):
+            token = await self._run(create)
+            if token:
+                return token
+            self._logger.warning(f"Telegram verification token collision for user {account_id} (attempt {attempt}/{max_attempts})")
+        raise RuntimeError(f"Failed to create unique Telegram verification token for user {account_id} after {max_attempts} attempts")
+
+    async def get_user_id_by_telegram_token_async(self, token: str) -> Optional[int]:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT user_id FROM telegram_verify_tokens WHERE token = ? AND expires_at > ?", (token, time.time())
+            ).fetchone()
+        )
+        return row[0] if row else None
+
+    async def delete_telegram_verify_token_async(self, token: str):
+        await self._run(lambda conn: conn.execute("DELETE FROM telegram_verify_tokens WHERE token = ?", (token,)))
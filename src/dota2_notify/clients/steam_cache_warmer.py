@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+
+from .steam_client import SteamClient
+from .steam_rate_limiter import SteamBudgetExceededError, SteamCallPriority
+
+
+class SteamCacheWarmer:
+    """Refreshes the cached friend lists and summaries of recently active users before they expire."""
+
+    def __init__(
+        self,
+        steam_client: SteamClient,
+        interval_seconds: float = 60.0,
+        active_window_seconds: float = 2 * 3600,
+        refresh_ahead_seconds: float = 300.0,
+        max_refreshes_per_cycle: int = 20,
+    ):
+        """
+        Initialize the cache warmer.
+
+        Args:
+            steam_client: Steam client whose Redis caches are kept warm
+            interval_seconds: Time between refresh cycles
+            active_window_seconds: How long a user stays active after their last request
+            refresh_ahead_seconds: Refresh cache entries whose remaining TTL is below this
+            max_refreshes_per_cycle: Maximum number of users refreshed per cycle (each costs two Steam calls)
+        """
+        self._steam_client = steam_client
+        self._interval_seconds = interval_seconds
+        self._active_window_seconds = active_window_seconds
+        self._refresh_ahead_seconds = refresh_ahead_seconds
+        self._max_refreshes_per_cycle = max_refreshes_per_cycle
+        self._active_users: dict[str, float] = {}
+        self._stats = {"cycles": 0, "refreshed": 0, "failed": 0, "budget_exhausted": 0}
+        self._logger = logging.getLogger(__name__)
+
+    def touch(self, steam_id: str):
+        """Mark a user as active."""
+        self._active_users[steam_id] = time.monotonic()
+
+    def stats(self) -> dict:
+        return {**self._stats, "active_users": len(self._active_users)}
+
+    async def run(self):
+        """Run refresh cycles until cancelled."""
+        while True:
+            await asyncio.sleep(self._interval_seconds)
+            try:
+                await self.refresh_cycle()
+            except Exception as ex:
+                self._logger.error(f"Error refreshing Steam caches: {ex}")
+
+    async def refresh_cycle(self):
+        """Refresh the caches of active users that are about to expire, most recently active first."""
+        self._stats["cycles"] += 1
+        now = time.monotonic()
+        self._active_users = {
+            steam_id: last_seen
+            for steam_id, last_seen in self._active_users.items()
+            if now - last_seen <= self._active_window_seconds
+        }
+        if not self._active_users:
+            return
+
+        active = sorted(self._active_users, key=self._active_users.get, reverse=True)
+        expiring = await self._find_expiring(active)
+
+        refreshed = 0
+        for steam_id in expiring[:self._max_refreshes_per_cycle]:
+            try:
+                friend_ids = await self._steam_client.get_friend_list(
+                    steam_id, refresh=True, priority=SteamCallPriority.BACKGROUND
+                )
+                await self._steam_client.get_player_summaries(
+                    steam_id, friend_ids, cache=True, refresh=True, priority=SteamCallPriority.BACKGROUND
+                )
+                refreshed += 1
+            except SteamBudgetExceededError:
+                self._stats["budget_exhausted"] += 1
+                self._logger.info("Steam budget exhausted for background calls, postponing cache refresh")
+                break
+            except Exception as ex:
+                self._stats["failed"] += 1
+                self._logger.warning(f"Failed to refresh Steam caches for {steam_id}: {ex}")
+
+        self._stats["refreshed"] += refreshed
+        self._logger.info(
+            f"Refreshed Steam caches for {refreshed} of {len(expiring)} expiring users "
+            f"({len(active)} active). Codec stats: {self._steam_client.cache_codec.stats()}"
+        )
+
+    async def _find_expiring(self, steam_ids: list[str]) -> list[str]:
+        redis_client = self._steam_client.redis_client
+        pipe = redis_client.pipeline(transaction=False)
+        for steam_id in steam_ids:
+            pipe.ttl(f"steam:friend_list:{steam_id}")
+            pipe.ttl(f"steam:player_summaries:{steam_id}")
+        ttls = await pipe.execute()
+
+        # A TTL of -2 means the key is missing, so it is refreshed too
+        return [
+            steam_id
+            for i, steam_id in enumerate(steam_ids)
+            if min(ttls[2 * i], ttls[2 * i + 1]) < self._refresh_ahead_seconds
+        ]
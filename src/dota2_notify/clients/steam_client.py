@@ -1,67 +1,102 @@
 import asyncio
-import json
 from urllib import response
 import httpx
 import redis.asyncio as redis
 
 from ..models.match import MatchHistoryResponse
 from ..models.steam_player_summary import SteamPlayerSummary 
+from .cache_codec import CacheCodec, CompactCacheCodec
+from .hedged_requester import HedgedRequester
+from .steam_rate_limiter import SteamBudgetExceededError, SteamCallPriority, SteamRateLimiter
 
 class SteamClient:
     BASE_URL = "https://api.steampowered.com/"
     OPEN_ID_URL = "https://steamcommunity.com/openid/login"
     CACHE_TTL_SECONDS = 3600
     CACHE_TIMEOUT_SECONDS = 0.5
+    ENDPOINT_DEADLINES = {
+        "CheckAuthentication": 5.0,
+        "GetPlayerSummaries": 3.0,
+        "GetFriendList": 3.0,
+        "GetMatchHistory": 5.0,
+        "GetMatchHistoryBySequenceNum": 10.0,
+    }
 
-    def __init__(self, api_key: str, client: httpx.AsyncClient, redis_client: redis.Redis | None = None):
+    def __init__(self, api_key: str, client: httpx.AsyncClient, redis_client: redis.Redis | None = None, rate_limiter: SteamRateLimiter | None = None, cache_codec: CacheCodec | None = None, hedging: bool = True, openid_client: httpx.AsyncClient | None = None):
         self.api_key = api_key
         self.client = client
+        self.requester = HedgedRequester(client, self.ENDPOINT_DEADLINES, hedging=hedging)
+        # OpenID runs on steamcommunity.com, so it may use its own connection pool
+        self.openid_requester = HedgedRequester(openid_client or client, self.ENDPOINT_DEADLINES, hedging=hedging)
         self.redis_client = redis_client
+        self.rate_limiter = rate_limiter
+        self.cache_codec = cache_codec or CompactCacheCodec()
+
+    async def _acquire(self, priority: SteamCallPriority):
+        if self.rate_limiter and not await self.rate_limiter.acquire(priority):
+            raise SteamBudgetExceededError(priority)
+
+    def _hedge_acquirer(self, priority: SteamCallPriority):
+        """A hedged duplicate is one more Steam call, sent only if a token is available right away."""
+        if not self.rate_limiter:
+            return None
+        return lambda: self.rate_limiter.acquire(priority, wait=False)
         
+    def request_stats(self) -> dict[str, dict]:
+        return {**self.requester.stats(), **self.openid_requester.stats()}
+
     async def validate_auth_request(self, params: dict) -> bool:         
         params["openid.mode"] = "check_authentication"
         try:
-            response = await self.client.post(self.OPEN_ID_URL, data=params)
+            response = await self.openid_requester.post("CheckAuthentication", self.OPEN_ID_URL, data=params)
         except httpx.HTTPError:
             return False
         return "is_valid:true" in response.text
 
-    async def get_player_summaries(self, steam_id: str ,steam_ids: list[str], cache: bool = False) -> list[SteamPlayerSummary]:
-        if self.redis_client and cache:
+    async def get_player_summaries(self, steam_id: str ,steam_ids: list[str], cache: bool = False, refresh: bool = False, priority: SteamCallPriority = SteamCallPriority.INTERACTIVE) -> list[SteamPlayerSummary]:
+        if self.redis_client and cache and not refresh:
             try:
                 cached_data = await asyncio.wait_for(self.redis_client.get(f"steam:player_summaries:{steam_id}"), timeout=self.CACHE_TIMEOUT_SECONDS)
                 if cached_data:
-                    return [SteamPlayerSummary.model_validate(player) for player in json.loads(cached_data)]
+                    return [SteamPlayerSummary.model_validate(player) for player in self.cache_codec.decode(cached_data)]
             except (Exception, asyncio.TimeoutError):
                 pass
 
-        response = await self.client.get(
+        await self._acquire(priority)
+        response = await self.requester.get(
+            "GetPlayerSummaries",
             f"{self.BASE_URL}ISteamUser/GetPlayerSummaries/v2/",
+            acquire_hedge=self._hedge_acquirer(priority),
             params={"steamids": ",".join(steam_ids), "key": self.api_key}
         )
         response.raise_for_status()
         data = response.json()
-        players_data = data.get("response", {}).get("players", [])
+        players = [SteamPlayerSummary.model_validate(player) for player in data.get("response", {}).get("players", [])]
         
         if self.redis_client and cache:
             try:
-                await asyncio.wait_for(self.redis_client.set(f"steam:player_summaries:{steam_id}", json.dumps(players_data), ex=self.CACHE_TTL_SECONDS), timeout=self.CACHE_TIMEOUT_SECONDS)
+                # Only the fields we model are cached, and defaults are left out
+                cached_data = self.cache_codec.encode([player.model_dump(exclude_defaults=True) for player in players])
+                await asyncio.wait_for(self.redis_client.set(f"steam:player_summaries:{steam_id}", cached_data, ex=self.CACHE_TTL_SECONDS), timeout=self.CACHE_TIMEOUT_SECONDS)
             except (Exception, asyncio.TimeoutError):
                 pass
         
-        return [SteamPlayerSummary.model_validate(player) for player in players_data]
+        return players
     
-    async def get_friend_list(self, steam_id: str) -> list[str]:
-        if self.redis_client:
+    async def get_friend_list(self, steam_id: str, refresh: bool = False, priority: SteamCallPriority = SteamCallPriority.INTERACTIVE) -> list[str]:
+        if self.redis_client and not refresh:
             try:
                 cached_data = await asyncio.wait_for(self.redis_client.get(f"steam:friend_list:{steam_id}"), timeout=self.CACHE_TIMEOUT_SECONDS)
                 if cached_data:
-                    return json.loads(cached_data)
+                    return self.cache_codec.decode(cached_data)
             except (Exception, asyncio.TimeoutError):
                 pass
         
-        response = await self.client.get(
+        await self._acquire(priority)
+        response = await self.requester.get(
+            "GetFriendList",
             f"{self.BASE_URL}ISteamUser/GetFriendList/v1/",
+            acquire_hedge=self._hedge_acquirer(priority),
             params={"steamid": steam_id, "key": self.api_key, "relationship": "friend"}
         )
         response.raise_for_status()
@@ -70,18 +105,21 @@ class SteamClient:
         
         if self.redis_client:
             try:
-                await asyncio.wait_for(self.redis_client.set(f"steam:friend_list:{steam_id}", json.dumps(friend_ids), ex=self.CACHE_TTL_SECONDS), timeout=self.CACHE_TIMEOUT_SECONDS)
+                await asyncio.wait_for(self.redis_client.set(f"steam:friend_list:{steam_id}", self.cache_codec.encode(friend_ids), ex=self.CACHE_TTL_SECONDS), timeout=self.CACHE_TIMEOUT_SECONDS)
             except (Exception, asyncio.TimeoutError):
                 pass
         
         return friend_ids
 
-    async def get_match_history(self, steam_id: str, matches_requested: int | None = None) -> tuple[dict, bool]:
+    async def get_match_history(self, steam_id: str, matches_requested: int | None = None, priority: SteamCallPriority = SteamCallPriority.INTERACTIVE) -> tuple[dict, bool]:
         params = {"account_id": steam_id, "key": self.api_key}
         if matches_requested is not None:
             params["matches_requested"] = matches_requested
-        response = await self.client.get(
+        await self._acquire(priority)
+        response = await self.requester.get(
+            "GetMatchHistory",
             f"{self.BASE_URL}IDOTA2Match_570/GetMatchHistory/v1/",
+            acquire_hedge=self._hedge_acquirer(priority),
             params=params
         )
         response.raise_for_status()
@@ -89,14 +127,18 @@ class SteamClient:
         is_public = data.get("result", {}).get("status") != 15
         return data, is_public
     
-    async def get_match_history_by_sequence_num(self, start_at_match_seq_num: int, matches_requested: int = 100) -> MatchHistoryResponse:
+    async def get_match_history_by_sequence_num(self, start_at_match_seq_num: int, matches_requested: int = 100, priority: SteamCallPriority = SteamCallPriority.FEED) -> MatchHistoryResponse:
         params = {
             "start_at_match_seq_num": start_at_match_seq_num,
             "matches_requested": matches_requested,
             "key": self.api_key
         }
-        response = await self.client.get(
+        await self._acquire(priority)
+        # Never hedged: a duplicate of this heavy call mostly earns a 429 from Steam
+        response = await self.requester.get(
+            "GetMatchHistoryBySequenceNum",
             f"{self.BASE_URL}IDOTA2Match_570/GetMatchHistoryBySequenceNum/v1/",
+            hedge=False,
             params=params
         )
         response.raise_for_status()
@@ -0,0 +1,162 @@
+import asyncio
+import enum
+import logging
+import time
+import redis.asyncio as redis
+
+
+class SteamCallPriority(enum.IntEnum):
+    """Priority classes sharing the Steam API budget, highest priority first."""
+    FEED = 0
+    INTERACTIVE = 1
+    BACKGROUND = 2
+
+
+class SteamBudgetExceededError(Exception):
+    """Raised when a Steam API call could not get a token before its deadline."""
+
+    def __init__(self, priority: SteamCallPriority):
+        super().__init__(f"Steam API budget exhausted for {priority.name.lower()} calls")
+        self.priority = priority
+
+
+# Token bucket shared by every process using the same Steam key. Lower priority
+# classes must leave a reserve in the bucket, so a burst of page views or
+# background refreshes can never drain the tokens the match feed depends on.
+# Uses the Redis server clock so that all replicas agree on the refill time.
+_ACQUIRE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_per_second = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local priority = ARGV[4]
+
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_per_second)
+
+local wait_ms = 0
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+    redis.call('HINCRBY', KEYS[2], priority .. ':granted', 1)
+else
+    wait_ms = math.ceil((reserve + 1 - tokens) / refill_per_second * 1000)
+    redis.call('HINCRBY', KEYS[2], priority .. ':throttled', 1)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill_per_second * 1000) + 60000)
+return wait_ms
+"""
+
+
+class SteamRateLimiter:
+    """Redis-backed token bucket shared by every service calling the Steam Web API."""
+    BUCKET_KEY = "steam:ratelimit:bucket"
+    USAGE_KEY = "steam:ratelimit:usage"
+    REDIS_TIMEOUT_SECONDS = 0.5
+
+    # Fraction of the bucket each priority class has to leave untouched.
+    RESERVE_FRACTIONS = {
+        SteamCallPriority.FEED: 0.0,
+        SteamCallPriority.INTERACTIVE: 0.2,
+        SteamCallPriority.BACKGROUND: 0.5,
+    }
+
+    # How long each priority class may wait for a token before giving up (None waits forever).
+    MAX_WAIT_SECONDS = {
+        SteamCallPriority.FEED: None,
+        SteamCallPriority.INTERACTIVE: 3.0,
+        SteamCallPriority.BACKGROUND: 0.0,
+    }
+
+    def __init__(self, redis_client: redis.Redis, capacity: int = 30, refill_per_second: float = 1.0):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            redis_client: Redis client holding the shared bucket state
+            capacity: Maximum number of tokens (burst size)
+            refill_per_second: Tokens added to the bucket per second
+        """
+        self._redis_client = redis_client
+        self._capacity = capacity
+        self._refill_per_second = refill_per_second
+        self._script = redis_client.register_script(_ACQUIRE_SCRIPT)
+        self._stats = {
+            priority: {"granted": 0, "throttled": 0, "rejected": 0, "failed_open": 0, "wait_seconds": 0.0}
+            for priority in SteamCallPriority
+        }
+        self._logger = logging.getLogger(__name__)
+
+    async def acquire(self, priority: SteamCallPriority, wait: bool = True) -> bool:
+        """
+        Take one token for a call of the given priority.
+
+        Waits for the bucket to refill up to the class' maximum wait, or not
+        at all if `wait` is False. Fails open when Redis is unavailable, since
+        Steam still enforces its own limit.
+
+        Returns:
+            True if the call may proceed, False if no token was available in time
+        """
+        stats = self._stats[priority]
+        max_wait = self.MAX_WAIT_SECONDS[priority] if wait else 0.0
+        reserve = self._capacity * self.RESERVE_FRACTIONS[priority]
+        started = time.monotonic()
+        waited = False
+
+        while True:
+            try:
+                wait_ms = await asyncio.wait_for(
+                    self._script(
+                        keys=[self.BUCKET_KEY, self.USAGE_KEY],
+                        args=[self._capacity, self._refill_per_second, reserve, priority.name.lower()],
+                    ),
+                    timeout=self.REDIS_TIMEOUT_SECONDS,
+                )
+            except (Exception, asyncio.TimeoutError) as ex:
+                self._logger.warning(f"Steam rate limiter unavailable, allowing {priority.name.lower()} call: {ex}")
+                stats["failed_open"] += 1
+                return True
+
+            elapsed = time.monotonic() - started
+            if not wait_ms:
+                stats["granted"] += 1
+                stats["wait_seconds"] += elapsed
+                return True
+
+            if not waited:
+                stats["throttled"] += 1
+                waited = True
+
+            wait_seconds = int(wait_ms) / 1000
+            if max_wait is not None:
+                remaining = max_wait - elapsed
+                if remaining <= 0:
+                    stats["rejected"] += 1
+                    stats["wait_seconds"] += elapsed
+                    return False
+                wait_seconds = min(wait_seconds, remaining)
+
+            await asyncio.sleep(wait_seconds)
+
+    def local_usage(self) -> dict[str, dict]:
+        """Per-priority usage of this process since startup."""
+        return {priority.name.lower(): dict(stats) for priority, stats in self._stats.items()}
+
+    async def cluster_usage(self) -> dict[str, int]:
+        """Per-priority granted/throttled counters aggregated over all processes."""
+        usage = await self._redis_client.hgetall(self.USAGE_KEY)
+        return {
+            (key.decode() if isinstance(key, bytes) else key): int(value)
+            for key, value in usage.items()
+        }
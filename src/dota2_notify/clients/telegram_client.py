@@ -1,13 +1,23 @@
 import httpx
 
+from .hedged_requester import HedgedRequester
+
 class TelegramClient:
     BASE_URL_TEMPLATE = "https://api.telegram.org/bot{token}/"
+    # sendMessage is not idempotent, so it only gets a deadline and is never hedged
+    ENDPOINT_DEADLINES = {
+        "sendMessage": 10.0,
+    }
 
     def __init__(self, token: str, client: httpx.AsyncClient):
         self.client = client
+        self.requester = HedgedRequester(client, self.ENDPOINT_DEADLINES)
         self.base_url = self.BASE_URL_TEMPLATE.format(token=token)
 
+    def request_stats(self) -> dict[str, dict]:
+        return self.requester.stats()
+
     async def send_message(self, chat_id: int, text: str) -> dict:
-        response = await self.client.post(f"{self.base_url}sendMessage", json={"chat_id": chat_id, "text": text})
+        response = await self.requester.post("sendMessage", f"{self.base_url}sendMessage", json={"chat_id": chat_id, "text": text})
         response.raise_for_status()
         return response.json()
\ No newline at end of file
@@ -0,0 +1,110 @@
+import logging
+import random
+import string
+from typing import Optional
+
+import redis.asyncio as redis
+
+# Claims a token for a user and replaces the user's previous token, read by the caller beforehand.
+# Returns -1 if the user's token changed since, 0 if the token is taken, 1 once claimed.
+# KEYS: token key, user key, previous token key (the token key if there is none).
+# ARGV: token, account ID, TTL, previous token ('' if there is none).
+_CREATE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[4] then
+    return -1
+end
+if not redis.call('SET', KEYS[1], ARGV[2], 'NX', 'EX', tonumber(ARGV[3])) then
+    return 0
+end
+if ARGV[4] ~= '' then
+    redis.call('DEL', KEYS[3])
+end
+redis.call('SET', KEYS[2], ARGV[1], 'EX', tonumber(ARGV[3]))
+return 1
+"""
+
+# Deletes a token of the account ID read by the caller beforehand, so a token can be used only once.
+# Returns 1 if the token was deleted, 0 if it was used or expired since.
+# KEYS: token key, user key. ARGV: token, account ID.
+_CONSUME_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+
+class RedisTelegramTokenStore:
+    """
+    Short-lived Telegram verification tokens in Redis.
+
+    Each token maps to its account ID and each account ID to its current
+    token, both expiring after the TTL. Creating a token for a user replaces
+    the previous one.
+    """
+    TOKEN_KEY_PREFIX = "telegram:verify:token:"
+    USER_KEY_PREFIX = "telegram:verify:user:"
+    TOKEN_LENGTH = 6
+    MAX_CREATE_ATTEMPTS = 5
+
+    def __init__(self, redis_client: redis.Redis, ttl_seconds: int = 7 * 24 * 60 * 60):
+        """
+        Initialize the store.
+
+        Args:
+            redis_client: Redis client holding the tokens
+            ttl_seconds: Time until an unused token expires
+        """
+        self._redis_client = redis_client
+        self._ttl_seconds = ttl_seconds
+        self._create_script = redis_client.register_script(_CREATE_SCRIPT)
+        self._consume_script = redis_client.register_script(_CONSUME_SCRIPT)
+        self._logger = logging.getLogger(__name__)
+
+    async def create(self, account_id: int) -> str:
+        """Issue a new token for a user, invalidating the user's previous token."""
+        user_key = self.USER_KEY_PREFIX + str(account_id)
+        for attempt in range(1, self.MAX_CREATE_ATTEMPTS + 1):
+            token = ''.join(random.choices(string.ascii_letters, k=self.TOKEN_LENGTH))
+            token_key = self.TOKEN_KEY_PREFIX + token
+            # Every key the script touches is passed in KEYS, so the previous token is read first
+            previous = await self.get_token(account_id) or ""
+            created = await self._create_script(
+                keys=[token_key, user_key, self.TOKEN_KEY_PREFIX + previous if previous else token_key],
+                args=[token, account_id, self._ttl_seconds, previous]
+            )
+            if created == 1:
+                return token
+            if created == -1:
+                self._logger.warning(f"Telegram verification token of user {account_id} changed while creating a new one (attempt {attempt}/{self.MAX_CREATE_ATTEMPTS})")
+            else:
+                self._logger.warning(f"Telegram verification token collision for user {account_id} (attempt {attempt}/{self.MAX_CREATE_ATTEMPTS})")
+        raise RuntimeError(f"Failed to create unique Telegram verification token for user {account_id} after {self.MAX_CREATE_ATTEMPTS} attempts")
+
+    async def get_or_create(self, account_id: int) -> str:
+        """The user's current token, or a new one if it expired or was used."""
+        token = await self.get_token(account_id)
+        return token or await self.create(account_id)
+
+    async def get_token(self, account_id: int) -> Optional[str]:
+        token = await self._redis_client.get(self.USER_KEY_PREFIX + str(account_id))
+        return token.decode() if isinstance(token, bytes) else token
+
+    async def get_account_id(self, token: str) -> Optional[int]:
+        account_id = await self._redis_client.get(self.TOKEN_KEY_PREFIX + token)
+        return int(account_id) if account_id else None
+
+    async def consume(self, token: str) -> Optional[int]:
+        """Delete a token and return the account ID it belonged to, or None if it is unknown or expired."""
+        account_id = await self.get_account_id(token)
+        if account_id is None:
+            return None
+        consumed = await self._consume_script(
+            keys=[self.TOKEN_KEY_PREFIX + token, self.USER_KEY_PREFIX + str(account_id)],
+            args=[token, account_id]
+        )
+        return account_id if consumed else None
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import redis.asyncio as redis
+
+from .cache_codec import CacheCodec, CompactCacheCodec
+
+# Stores a document unless the cached copy is newer. Cosmos `_ts` only has second
+# resolution, so two versions with the same `_ts` but different etags cannot be
+# ordered; the entry is dropped instead and the next read repopulates it.
+_PUT_SCRIPT = """
+local current = redis.call('HMGET', KEYS[1], 'ts', 'etag')
+local current_ts = tonumber(current[1])
+local new_ts = tonumber(ARGV[1])
+if current_ts ~= nil then
+    if current_ts > new_ts then
+        return 0
+    end
+    if current_ts == new_ts and current[2] ~= ARGV[2] then
+        redis.call('DEL', KEYS[1])
+        return -1
+    end
+end
+redis.call('HSET', KEYS[1], 'ts', ARGV[1], 'etag', ARGV[2], 'doc', ARGV[3])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return 1
+"""
+
+# Drops the cached copy unless it already is the given version (or a newer one).
+_INVALIDATE_SCRIPT = """
+local current = redis.call('HMGET', KEYS[1], 'ts', 'etag')
+local current_ts = tonumber(current[1])
+if current_ts == nil then
+    return 0
+end
+if current[2] == ARGV[2] or current_ts > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+class RedisUserCache:
+    """Redis cache of raw User documents, versioned by their Cosmos `_ts` and `_etag`."""
+    KEY_PREFIX = "user:"
+
+    def __init__(self, redis_client: redis.Redis, codec: CacheCodec | None = None, ttl_seconds: int = 3600, timeout_seconds: float = 0.5):
+        """
+        Initialize the cache.
+
+        Args:
+            redis_client: Redis client holding the cached documents
+            codec: Codec used for the document body
+            ttl_seconds: Time to live of a cached document
+            timeout_seconds: Redis calls slower than this are treated as cache misses
+        """
+        self._redis_client = redis_client
+        self._codec = codec or CompactCacheCodec()
+        self._ttl_seconds = ttl_seconds
+        self._timeout_seconds = timeout_seconds
+        self._put_script = redis_client.register_script(_PUT_SCRIPT)
+        self._invalidate_script = redis_client.register_script(_INVALIDATE_SCRIPT)
+        self._stats = {"hits": 0, "misses": 0, "errors": 0}
+        self._logger = logging.getLogger(__name__)
+
+    @classmethod
+    def key(cls, account_id: int | str) -> str:
+        return f"{cls.KEY_PREFIX}{account_id}"
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    async def get(self, account_id: int) -> Optional[dict]:
+        return (await self.get_many([account_id])).get(account_id)
+
+    async def get_many(self, account_ids: List[int]) -> Dict[int, dict]:
+        """Cached documents by account ID; missing entries are left out."""
+        if not account_ids:
+            return {}
+        try:
+            pipe = self._redis_client.pipeline(transaction=False)
+            for account_id in account_ids:
+                pipe.hget(self.key(account_id), "doc")
+            results = await asyncio.wait_for(pipe.execute(), timeout=self._timeout_seconds)
+        except (Exception, asyncio.TimeoutError) as ex:
+            self._stats["errors"] += 1
+            self._logger.debug(f"User cache read failed: {ex}")
+            return {}
+
+        docs = {account_id: self._codec.decode(data) for account_id, data in zip(account_ids, results) if data}
+        self._stats["hits"] += len(docs)
+        self._stats["misses"] += len(account_ids) - len(docs)
+        return docs
+
+    async def put(self, doc: dict):
+        """Cache a document read from or written to Cosmos, unless a newer version is cached."""
+        if "_ts" not in doc or "_etag" not in doc:
+            return
+        args = [doc["_ts"], doc["_etag"], self._codec.encode(doc), self._ttl_seconds]
+        try:
+            await asyncio.wait_for(self._put_script(keys=[self.key(doc["id"])], args=args), timeout=self._timeout_seconds)
+        except (Exception, asyncio.TimeoutError) as ex:
+            self._stats["errors"] += 1
+            self._logger.warning(f"Failed to update cached user {doc.get('id')}: {ex}")
+
+    async def invalidate(self, doc: dict, client: redis.client.Pipeline | None = None):
+        """
+        Drop the cached copy of a changed document if it is older than `doc`.
+
+        Unlike the other writes, Redis errors are raised so the caller (the
+        change feed consumer) can retry instead of leaving a stale entry.
+        Pass a pipeline as `client` to queue the invalidation on it instead.
+        """
+        await self._invalidate_script(keys=[self.key(doc["id"])], args=[doc.get("_ts", 0), doc.get("_etag", "")], client=client)
+
+    async def delete(self, account_id: int):
+        try:
+            await asyncio.wait_for(self._redis_client.delete(self.key(account_id)), timeout=self._timeout_seconds)
+        except (Exception, asyncio.TimeoutError) as ex:
+            self._stats["errors"] += 1
+            self._logger.warning(f"Failed to delete cached user {account_id}: {ex}")
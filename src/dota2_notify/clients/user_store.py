@@ -0,0 +1,181 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Generic, List, Optional, Sequence, TypeVar
+
+from dota2_notify.models.user import Friend, User, steam_id_to_account_id
+
+ModelT = TypeVar("ModelT", User, Friend)
+
+
+@dataclass
+class QueryPage(Generic[ModelT]):
+    """One page of query results and the token to resume the query after it."""
+    items: List[ModelT]
+    continuation: Optional[str]
+
+
+class PreconditionFailedError(Exception):
+    """A conditional write was rejected because the document changed since it was read."""
+
+
+class UserStore(ABC):
+    """
+    Storage backend for users, their friends and Telegram verification tokens.
+
+    Users and friends share one collection partitioned by userId: a user's
+    document has its own account ID as id, a friend's document has the
+    friend's account ID as id.
+    """
+    DEFAULT_PAGE_SIZE = 100
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @abstractmethod
+    async def connect(self):
+        ...
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+    def request_stats(self) -> dict:
+        """Cost and latency per method, for backends that track them."""
+        return {}
+
+    ##
+    ## Users
+    ##
+
+    @abstractmethod
+    async def create_user_async(self, account_id: int, name: str, telegram_token: str) -> User:
+        """Create a followed user, or return the existing one."""
+
+    async def create_user_with_steam_id_async(self, steam_id: int, name: str, telegram_token: str) -> User:
+        return await self.create_user_async(steam_id_to_account_id(steam_id), name, telegram_token)
+
+    @abstractmethod
+    async def get_user_async(self, account_id: int) -> Optional[User]:
+        ...
+
+    async def get_user_with_steam_id_async(self, steam_id: int) -> Optional[User]:
+        return await self.get_user_async(steam_id_to_account_id(steam_id))
+
+    @abstractmethod
+    async def get_users_async(self, account_ids: List[int]) -> Dict[int, User]:
+        """Users by account ID; users that do not exist are left out."""
+
+    @abstractmethod
+    async def get_all_users_async(self) -> List[User]:
+        ...
+
+    @abstractmethod
+    def iter_users_async(
+        self,
+        max_item_count: int = DEFAULT_PAGE_SIZE,
+        continuation: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[QueryPage[User]]:
+        """
+        Stream all users page by page instead of loading them into one list.
+
+        Args:
+            max_item_count: Maximum number of users per page
+            continuation: Continuation token of a previous page to resume after
+            fields: User field names to project (e.g. ["id", "following"]); fields
+                that are left out keep their model defaults
+
+        Yields:
+            Pages of users with the continuation token to resume after each page
+        """
+
+    @abstractmethod
+    async def update_user_async(self, user: User):
+        ...
+
+    @abstractmethod
+    async def patch_user_async(self, account_id: int, fields: Dict[str, Any], etag: Optional[str] = None) -> Optional[User]:
+        """
+        Set only the given User fields instead of replacing the whole document.
+
+        Args:
+            account_id: Account ID of the user
+            fields: New values keyed by User field name
+            etag: If given, the patch only applies when the document still has this ETag,
+                otherwise PreconditionFailedError is raised
+
+        Returns:
+            The patched user, or None if the user does not exist
+        """
+
+    ##
+    ## Friends
+    ##
+
+    @abstractmethod
+    async def get_friends_async(self, account_id: int, following: Optional[bool] = None) -> List[Friend]:
+        ...
+
+    @abstractmethod
+    def iter_friends_async(
+        self,
+        account_id: int,
+        following: Optional[bool] = None,
+        max_item_count: int = DEFAULT_PAGE_SIZE,
+        continuation: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[QueryPage[Friend]]:
+        """Stream the friends of a user page by page, see iter_users_async."""
+
+    @abstractmethod
+    async def get_friend_async(self, account_id: int, followed_player_id: int) -> Optional[Friend]:
+        ...
+
+    async def get_friend_by_steam_id_async(self, steam_id: int, friend_steam_id: int) -> Optional[Friend]:
+        return await self.get_friend_async(steam_id_to_account_id(steam_id), steam_id_to_account_id(friend_steam_id))
+
+    @abstractmethod
+    async def get_friends_by_ids_async(self, account_id: int, followed_player_ids: List[int]) -> Dict[int, Friend]:
+        """Friends of one user by their account ID; friends that are not stored are left out."""
+
+    @abstractmethod
+    async def update_friend_async(self, friend: Friend) -> Friend:
+        """Write a friend. Returns it as stored, with its system properties."""
+
+    @abstractmethod
+    async def import_friends_async(self, account_id: int, friends: List[Friend], max_request_charge: Optional[float] = None) -> int:
+        """
+        Write many friends of one user at once, leaving friends that are already stored as they are.
+
+        Args:
+            account_id: Account ID of the user owning the friends
+            friends: Friends to write
+            max_request_charge: Stop once this much request charge was spent, for backends that charge per request
+
+        Returns:
+            Number of friends written
+        """
+
+    @abstractmethod
+    async def patch_friend_async(self, account_id: int, followed_player_id: int, fields: Dict[str, Any], etag: Optional[str] = None) -> Optional[Friend]:
+        """Set only the given Friend fields, see patch_user_async."""
+
+    ##
+    ## Telegram verification token management
+    ##
+
+    @abstractmethod
+    async def create_telegram_verify_token_async(self, account_id: int) -> str:
+        ...
+
+    @abstractmethod
+    async def get_user_id_by_telegram_token_async(self, token: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    async def delete_telegram_verify_token_async(self, token: str):
+        ...
@@ -0,0 +1,35 @@
+from pydantic_settings import BaseSettings
+
+# Container names of the in-memory backend, the same in every service so that
+# `local-stack` can hand them all one shared client
+MEMORY_COSMOSDB_NAMES = {
+    "cosmosdb_database_name": "dota2-notify",
+    "cosmosdb_container_name": "users",
+    "cosmosdb_token_container_name": "telegram-tokens",
+    "cosmosdb_metadata_container_name": "metadata",
+}
+
+MEMORY_BACKEND_ERROR = (
+    "STORAGE__BACKEND=memory only works under local-stack, which shares one in-memory Cosmos DB "
+    "between the services; a service on its own would never see the others' data"
+)
+
+
+def check_storage_settings(settings: BaseSettings) -> BaseSettings:
+    """
+    Validate the storage settings shared by the services.
+
+    The cosmos backend needs every `cosmosdb_` setting of the service. The
+    memory backend only needs container names, so missing ones get the
+    defaults of MEMORY_COSMOSDB_NAMES.
+    """
+    fields = type(settings).model_fields
+    if settings.storage_backend == "cosmos":
+        missing = [field.alias for name, field in fields.items() if name.startswith("cosmosdb_") and not getattr(settings, name)]
+        if missing:
+            raise ValueError(f"Missing Cosmos DB settings: {', '.join(missing)}")
+    elif settings.storage_backend == "memory":
+        for name, default in MEMORY_COSMOSDB_NAMES.items():
+            if name in fields and not getattr(settings, name):
+                setattr(settings, name, default)
+    return settings
@@ -0,0 +1,27 @@
+from functools import cache
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Settings of local-stack only, each service still reads its own settings from the same environment."""
+    port: int = Field(8000, alias="LOCAL__PORT")
+    # The match feed of a fresh in-memory metadata container starts here, e.g. a recent match_seq_num from GetMatchHistory
+    start_match_seq_num: int = Field(..., alias="LOCAL__STARTMATCHSEQNUM")
+    cosmosdb_latency_seconds: float = Field(0.0, alias="LOCAL__COSMOSDB__LATENCYSECONDS")
+    cosmosdb_latency_jitter_seconds: float = Field(0.0, alias="LOCAL__COSMOSDB__LATENCYJITTERSECONDS")
+    cosmosdb_throttle_probability: float = Field(0.0, alias="LOCAL__COSMOSDB__THROTTLEPROBABILITY")
+    cosmosdb_feed_range_count: int = Field(4, alias="LOCAL__COSMOSDB__FEEDRANGECOUNT")
+
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_nested_delimiter="___",
+        env_prefix="",
+        extra="ignore",
+    )
+
+
+@cache
+def get_settings():
+    return Settings()
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import os
+import signal
+
+from dota2_notify.clients.in_memory_cosmos import InMemoryCosmosClient
+from dota2_notify.config import MEMORY_COSMOSDB_NAMES
+from dota2_notify.local.config import Settings, get_settings
+from dota2_notify.notify import main as notify_main
+from dota2_notify.sync import main as sync_main
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+
+async def create_shared_client(settings: Settings) -> InMemoryCosmosClient:
+    """In-memory Cosmos DB for all services, with the match feed position seeded so match-notify has a place to start."""
+    # 429s are injected where the services go through the concurrency limiter, not on the metadata container
+    throttling = {"throttle_probability": settings.cosmosdb_throttle_probability}
+    cosmos_client = InMemoryCosmosClient(
+        partition_key_paths={MEMORY_COSMOSDB_NAMES["cosmosdb_container_name"]: "/userId"},
+        options_by_container={
+            MEMORY_COSMOSDB_NAMES["cosmosdb_container_name"]: throttling,
+            MEMORY_COSMOSDB_NAMES["cosmosdb_token_container_name"]: throttling,
+        },
+        latency_seconds=settings.cosmosdb_latency_seconds,
+        latency_jitter_seconds=settings.cosmosdb_latency_jitter_seconds,
+        feed_range_count=settings.cosmosdb_feed_range_count
+    )
+    database = cosmos_client.get_database_client(MEMORY_COSMOSDB_NAMES["cosmosdb_database_name"])
+    metadata_container = database.get_container_client(MEMORY_COSMOSDB_NAMES["cosmosdb_metadata_container_name"])
+    await notify_main.save_match_sequence_num(metadata_container, settings.start_match_seq_num)
+    return cosmos_client
+
+
+async def main() -> None:
+    settings = get_settings()
+    # Every service reads its settings from the environment, so they all pick the shared client up
+    os.environ["STORAGE__BACKEND"] = "memory"
+    cosmos_client = await create_shared_client(settings)
+
+    import uvicorn
+    # Imported once the backend is set: the web app reads its settings on import
+    from dota2_notify.app.main import app
+
+    app.state.cosmosdb_client = cosmos_client
+    server = uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=settings.port))
+
+    def stop(*args):
+        notify_main.keep_running = False
+        sync_main.keep_running = False
+        server.should_exit = True
+
+    # Replaces the handlers match-notify and data-sync install on import, each of which stops only its own service
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    async def serve_app():
+        try:
+            await server.serve()
+        finally:
+            stop()
+
+    logger.info("Running the web app, match-notify and data-sync on a shared in-memory Cosmos DB")
+    await asyncio.gather(
+        serve_app(),
+        notify_main.main(cosmos_client=cosmos_client),
+        sync_main.main(cosmos_client=cosmos_client)
+    )
+
+
+def run() -> None:
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+
+
+if __name__ == "__main__":
+    run()
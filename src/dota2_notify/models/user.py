@@ -20,6 +20,10 @@ class Friend(BaseModel):
     name: str = ""
     following: bool = False
     type: str = "friend"
+    # Cosmos DB system property, used for optimistic concurrency; never written back
+    etag: str = Field("", alias="_etag", exclude=True)
+    # Cosmos DB system property, the last write in epoch seconds; never written back
+    ts: int = Field(0, alias="_ts", exclude=True)
 
 
 class User(BaseModel):
@@ -34,6 +38,10 @@ class User(BaseModel):
     telegram_verify_token: str = Field("", alias="telegramVerifyToken")
     following: bool = True
     type: str = "user"
+    # Cosmos DB system property, used for optimistic concurrency; never written back
+    etag: str = Field("", alias="_etag", exclude=True)
+    # Cosmos DB system property, the last write in epoch seconds; never written back
+    ts: int = Field(0, alias="_ts", exclude=True)
 
     @property
     def is_telegram_verified(self) -> bool:
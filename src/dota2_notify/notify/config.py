@@ -1,23 +1,41 @@
 from functools import cache
+from typing import Literal
 
-from pydantic import Field
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from dota2_notify.config import check_storage_settings
+
 
 class Settings(BaseSettings):
-    cosmosdb_endpoint_uri: str = Field(..., alias="COSMOSDB__ENDPOINTURI")
-    cosmosdb_primary_key: str = Field(..., alias="COSMOSDB__PRIMARYKEY")
-    cosmosdb_database_name: str = Field(..., alias="COSMOSDB__DATABASENAME")
-    cosmosdb_container_name: str = Field(..., alias="COSMOSDB__CONTAINERNAME")
-    cosmosdb_token_container_name: str = Field(..., alias='COSMOSDB__TOKENCONTAINERNAME')
-    cosmosdb_metadata_container_name: str = Field(..., alias="COSMOSDB__METADATACONTAINERNAME")
+    # memory is only for local-stack, which runs all services in one process on a shared in-memory Cosmos DB
+    storage_backend: Literal["cosmos", "sqlite", "memory"] = Field("cosmos", alias="STORAGE__BACKEND")
+    sqlite_path: str = Field("dota2_notify.db", alias="STORAGE__SQLITEPATH")
+    cosmosdb_endpoint_uri: str = Field("", alias="COSMOSDB__ENDPOINTURI")
+    cosmosdb_primary_key: str = Field("", alias="COSMOSDB__PRIMARYKEY")
+    cosmosdb_database_name: str = Field("", alias="COSMOSDB__DATABASENAME")
+    cosmosdb_container_name: str = Field("", alias="COSMOSDB__CONTAINERNAME")
+    cosmosdb_token_container_name: str = Field("", alias='COSMOSDB__TOKENCONTAINERNAME')
+    cosmosdb_metadata_container_name: str = Field("", alias="COSMOSDB__METADATACONTAINERNAME")
+    # Named without the cosmosdb_ prefix, which marks settings required by the cosmos backend
+    cosmos_throttle_enabled: bool = Field(True, alias="COSMOSDB__THROTTLE__ENABLED")
+    cosmos_throttle_max_concurrency: int = Field(64, alias="COSMOSDB__THROTTLE__MAXCONCURRENCY")
 
     steam_api_key: str = Field(..., alias='STEAM__APIKEY')
+    steam_rate_limit_capacity: int = Field(30, alias="STEAM__RATELIMIT__CAPACITY")
+    steam_rate_limit_refill_per_second: float = Field(1.0, alias="STEAM__RATELIMIT__REFILLPERSECOND")
+    http2_enabled: bool = Field(False, alias="HTTP__HTTP2ENABLED")
+    steam_max_connections: int = Field(20, alias="HTTP__STEAM__MAXCONNECTIONS")
+    telegram_max_connections: int = Field(10, alias="HTTP__TELEGRAM__MAXCONNECTIONS")
 
     telegram_bot_token: str = Field(..., alias='TELEGRAM__BOTTOKEN')
 
     redis_host: str = Field(..., alias="REDIS__HOST")
     redis_port: int = Field(..., alias="REDIS__PORT")
+    user_cache_ttl_seconds: int = Field(3600, alias="USERCACHE__TTLSECONDS")
+    follower_cache_enabled: bool = Field(True, alias="FOLLOWERCACHE__ENABLED")
+    follower_cache_max_entries: int = Field(100_000, alias="FOLLOWERCACHE__MAXENTRIES")
+    follower_cache_max_age_seconds: float = Field(300.0, alias="FOLLOWERCACHE__MAXAGESECONDS")
 
     poll_interval: float = Field(5.0, alias="POLL__INTERVAL")
     rate_limit_backoff_time: float = Field(60.0, alias="RATELIMIT__BACKOFFTIME")
@@ -29,6 +47,10 @@ class Settings(BaseSettings):
         extra="ignore",
     )
 
+    @model_validator(mode="after")
+    def require_cosmosdb_settings(self):
+        return check_storage_settings(self)
+
 
 @cache
 def get_settings():
@@ -2,15 +2,27 @@ import asyncio
 import logging
 import signal
 import time
+from collections import defaultdict
+from contextlib import AsyncExitStack
 import httpx
 import redis.asyncio as redis
 
 from azure.cosmos.aio import CosmosClient
 from dota2_notify.clients.cosmosdb_client import CosmosDbUserService
+from dota2_notify.clients.cosmos_throttle import AdaptiveConcurrencyLimiter
+from dota2_notify.clients.follower_cache import CachedFollowerIndex
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.clients.sqlite_user_store import SqliteUserStore
+from dota2_notify.clients.http_pools import UpstreamPools
 from dota2_notify.clients.steam_client import SteamClient
+from dota2_notify.clients.steam_rate_limiter import SteamRateLimiter
 from dota2_notify.clients.telegram_client import TelegramClient
+from dota2_notify.clients.user_cache import RedisUserCache
+from dota2_notify.clients.user_store import UserStore
+from dota2_notify.config import MEMORY_BACKEND_ERROR
 from dota2_notify.notify.config import get_settings
 from dota2_notify.models.match import Match
+from dota2_notify.models.user import Friend, User
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
@@ -28,9 +40,8 @@ signal.signal(signal.SIGINT, handle_exit)
 signal.signal(signal.SIGTERM, handle_exit)
 
 
-async def send_notification(user_id: int, account_id: int, match: Match, db_client: CosmosDbUserService, telegram_client: TelegramClient):
+async def send_notification(user_id: int, account_id: int, match: Match, notified_user: User | None, friend: Friend | None, telegram_client: TelegramClient):
     """Send a notification to a user about a match."""
-    notified_user = await db_client.get_user_async(user_id)
     if not notified_user or not notified_user.telegram_chat_id:
         logger.warning(f"User {user_id} not found or has no telegram chat id.")
         return
@@ -43,7 +54,6 @@ async def send_notification(user_id: int, account_id: int, match: Match, db_clie
     if user_id == account_id:
         followed_player_name = notified_user.name
     else:
-        friend = await db_client.get_friend_async(user_id, account_id)
         if not friend:
             logger.warning(f"Friendship between user {user_id} and player {account_id} not found.")
             return
@@ -75,7 +85,7 @@ async def send_notification(user_id: int, account_id: int, match: Match, db_clie
     await telegram_client.send_message(notified_user.telegram_chat_id, message)
    
 
-async def process_match(match: Match, redis_client: redis.Redis, db_client: CosmosDbUserService, telegram_client: TelegramClient):
+async def process_match(match: Match, follower_index: FollowerIndex, db_client: UserStore, telegram_client: TelegramClient):
     """Process a single match to find and notify users."""
     public_players = [
         p.account_id
@@ -86,27 +96,54 @@ async def process_match(match: Match, redis_client: redis.Redis, db_client: Cosm
     if not public_players:
         return
 
-    pipe = redis_client.pipeline()
-    for account_id in public_players:
-        pipe.smembers(str(account_id))
-    
     try:
-        results = await pipe.execute()
-        
-        for i, account_id in enumerate(public_players):
-            user_ids_to_notify = results[i]
-            if user_ids_to_notify:
-                for user_id_bytes in user_ids_to_notify:
-                    user_id = int(user_id_bytes.decode('utf-8'))
-                    logger.info(f"User {user_id} should be notified about player {account_id} in match {match.match_id}")
-                    await send_notification(user_id, account_id, match, db_client, telegram_client)
+        followers = await follower_index.get_followers_many(public_players)
     except redis.RedisError as e:
         logger.error(f"Redis error while processing match {match.match_id}: {e}")
+        return
+
+    notifications = []
+    for account_id in public_players:
+        for user_id in followers[account_id]:
+            logger.info(f"User {user_id} should be notified about player {account_id} in match {match.match_id}")
+            notifications.append((user_id, account_id))
+
+    if not notifications:
+        return
+
+    # Fetch every notified user and followed friend up front in batches instead of one read per notification
+    followed_friends = defaultdict(list)
+    for user_id, account_id in notifications:
+        if user_id != account_id:
+            followed_friends[user_id].append(account_id)
+
+    users, friends = await asyncio.gather(
+        db_client.get_users_async([user_id for user_id, _ in notifications]),
+        asyncio.gather(*(
+            db_client.get_friends_by_ids_async(user_id, account_ids)
+            for user_id, account_ids in followed_friends.items()
+        ))
+    )
+    friends_by_user = dict(zip(followed_friends, friends))
+
+    for user_id, account_id in notifications:
+        friend = friends_by_user.get(user_id, {}).get(account_id)
+        await send_notification(user_id, account_id, match, users.get(user_id), friend, telegram_client)
 
 
 MATCH_SEQ_NUM_DOC_ID = "dota2_notify_match_seq_num"
 
 
+async def log_steam_budget_usage(rate_limiter: SteamRateLimiter):
+    """Log the per-priority Steam API usage of this process and of the whole cluster."""
+    try:
+        cluster_usage = await rate_limiter.cluster_usage()
+    except redis.RedisError as e:
+        logger.error(f"Redis error while reading Steam budget usage: {e}")
+        cluster_usage = {}
+    logger.info(f"Steam API budget usage. Local: {rate_limiter.local_usage()}. Cluster: {cluster_usage}")
+
+
 async def get_match_sequence_num(metadata_container):
     try:
         metadata_doc = await metadata_container.read_item(
@@ -125,11 +162,12 @@ async def save_match_sequence_num(metadata_container, seq_num):
     await metadata_container.upsert_item(body=metadata_doc)
 
 
-async def consume_match_feed(steam_client: SteamClient, redis_client: redis.Redis, db_client: CosmosDbUserService, telegram_client: TelegramClient, metadata_container, poll_interval: float, rate_limit_backoff_time: float, redact=None):
+async def consume_match_feed(steam_client: SteamClient, redis_client: redis.Redis, db_client: UserStore, telegram_client: TelegramClient, metadata_container, poll_interval: float, rate_limit_backoff_time: float, redact=None, http_pools: UpstreamPools | None = None, follower_index: FollowerIndex | None = None):
     """Poll the Steam API for new matches indefinitely."""
     start_at_match_seq_num = await get_match_sequence_num(metadata_container)
     batch_size = 100
     iterations = 0
+    follower_index = follower_index or FollowerIndex(redis_client)
 
     if start_at_match_seq_num is None:
         return
@@ -151,7 +189,7 @@ async def consume_match_feed(steam_client: SteamClient, redis_client: redis.Redi
                 for match in matches:
                     if not keep_running:
                         break
-                    await process_match(match, redis_client, db_client, telegram_client)
+                    await process_match(match, follower_index, db_client, telegram_client)
 
                 last_match = matches[-1]
                 last_match_end_time = last_match.start_time + last_match.duration
@@ -165,6 +203,15 @@ async def consume_match_feed(steam_client: SteamClient, redis_client: redis.Redi
                 if iterations % 5 == 0:
                     logger.info(f"Saving next sequence number to DB: {start_at_match_seq_num}")
                     await save_match_sequence_num(metadata_container, start_at_match_seq_num)
+                if iterations % 60 == 0:
+                    logger.info(f"Upstream request stats. Steam: {steam_client.request_stats()}. Telegram: {telegram_client.request_stats()}")
+                    if http_pools:
+                        logger.info(f"HTTP pool stats: {http_pools.stats()}")
+                    logger.info(f"Storage request stats: {db_client.request_stats()}")
+                    if isinstance(follower_index, CachedFollowerIndex):
+                        logger.info(f"Follower cache stats: {follower_index.stats()}")
+                    if steam_client.rate_limiter:
+                        await log_steam_budget_usage(steam_client.rate_limiter)
             else:
                 logger.info("No new matches found.")
                 if keep_running: 
@@ -196,7 +243,8 @@ async def consume_match_feed(steam_client: SteamClient, redis_client: redis.Redi
             await asyncio.sleep(sleep_time)
 
 
-async def main() -> None:
+async def main(cosmos_client=None) -> None:
+    """Run match-notify, on `cosmos_client` if given (local-stack shares one between the services)."""
     logging.getLogger("azure.cosmos").setLevel(logging.WARNING)
     logging.getLogger("azure.core").setLevel(logging.WARNING)
     logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -218,23 +266,65 @@ async def main() -> None:
     async def log_response(response):
         logging.info(f"HTTP Response: {response.status_code}")    
 
-    async with httpx.AsyncClient(event_hooks={'request': [log_request], 'response': [log_response]}) as http_client, CosmosClient(
-        url=settings.cosmosdb_endpoint_uri,
-        credential=settings.cosmosdb_primary_key,
-    ) as cosmos_client:
-        steam_client = SteamClient(api_key=settings.steam_api_key, client=http_client)
-        telegram_client = TelegramClient(token=settings.telegram_bot_token, client=http_client)
-        db_client = CosmosDbUserService(
-            cosmosdb_client=cosmos_client,
-            database_name=settings.cosmosdb_database_name,
-            user_container_name=settings.cosmosdb_container_name,
-            telegram_verify_token_container_name=settings.cosmosdb_token_container_name
+    pool_limits = {
+        UpstreamPools.STEAM_API: httpx.Limits(max_connections=settings.steam_max_connections, max_keepalive_connections=settings.steam_max_connections),
+        UpstreamPools.TELEGRAM: httpx.Limits(max_connections=settings.telegram_max_connections, max_keepalive_connections=settings.telegram_max_connections),
+    }
+
+    async with AsyncExitStack() as stack:
+        http_pools = await stack.enter_async_context(
+            UpstreamPools(pool_limits, http2=settings.http2_enabled, event_hooks={'request': [log_request], 'response': [log_response]})
+        )
+        rate_limiter = SteamRateLimiter(
+            redis_client,
+            capacity=settings.steam_rate_limit_capacity,
+            refill_per_second=settings.steam_rate_limit_refill_per_second
         )
-        await db_client.connect()
+        steam_client = SteamClient(api_key=settings.steam_api_key, client=http_pools[UpstreamPools.STEAM_API], rate_limiter=rate_limiter)
+        telegram_client = TelegramClient(token=settings.telegram_bot_token, client=http_pools[UpstreamPools.TELEGRAM])
+        if settings.storage_backend == "sqlite":
+            db_client = await stack.enter_async_context(SqliteUserStore(settings.sqlite_path))
+            metadata_container = db_client.metadata_container
+        else:
+            concurrency_limiter = None
+            client_options = {}
+            if settings.cosmos_throttle_enabled:
+                concurrency_limiter = AdaptiveConcurrencyLimiter(max_limit=settings.cosmos_throttle_max_concurrency)
+                # Let the limiter handle 429s instead of the SDK retrying each request on its own
+                client_options["retry_throttle_total"] = 1
+            if cosmos_client is None:
+                if settings.storage_backend == "memory":
+                    raise RuntimeError(MEMORY_BACKEND_ERROR)
+                cosmos_client = await stack.enter_async_context(CosmosClient(
+                    url=settings.cosmosdb_endpoint_uri,
+                    credential=settings.cosmosdb_primary_key,
+                    **client_options
+                ))
+            db_client = CosmosDbUserService(
+                cosmosdb_client=cosmos_client,
+                database_name=settings.cosmosdb_database_name,
+                user_container_name=settings.cosmosdb_container_name,
+                telegram_verify_token_container_name=settings.cosmosdb_token_container_name,
+                user_cache=RedisUserCache(redis_client, ttl_seconds=settings.user_cache_ttl_seconds),
+                concurrency_limiter=concurrency_limiter
+            )
+            await db_client.connect()
 
-        database = cosmos_client.get_database_client(settings.cosmosdb_database_name)
-        metadata_container = database.get_container_client(settings.cosmosdb_metadata_container_name)
+            database = cosmos_client.get_database_client(settings.cosmosdb_database_name)
+            metadata_container = database.get_container_client(settings.cosmosdb_metadata_container_name)
         
+        await http_pools.prewarm()
+
+        follower_index = None
+        if settings.follower_cache_enabled:
+            follower_index = CachedFollowerIndex(
+                redis_client,
+                max_entries=settings.follower_cache_max_entries,
+                max_age_seconds=settings.follower_cache_max_age_seconds
+            )
+            tracking_task = asyncio.create_task(follower_index.run())
+            stack.callback(tracking_task.cancel)
+
         logger.info("Starting match feed consumer...")
         await consume_match_feed(
             steam_client, 
@@ -244,7 +334,9 @@ async def main() -> None:
             metadata_container,
             poll_interval=settings.poll_interval, 
             rate_limit_backoff_time=settings.rate_limit_backoff_time,
-            redact=redact
+            redact=redact,
+            http_pools=http_pools,
+            follower_index=follower_index
         )
 
     logger.info("Shutting down Redis client...")
@@ -1,17 +1,32 @@
 from functools import cache
+from typing import Literal
 
-from pydantic import Field
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from dota2_notify.config import check_storage_settings
+
 
 class Settings(BaseSettings):
-    cosmosdb_endpoint_uri: str = Field(..., alias="COSMOSDB__ENDPOINTURI")
-    cosmosdb_primary_key: str = Field(..., alias="COSMOSDB__PRIMARYKEY")
-    cosmosdb_database_name: str = Field(..., alias="COSMOSDB__DATABASENAME")
-    cosmosdb_container_name: str = Field(..., alias="COSMOSDB__CONTAINERNAME")
-    cosmosdb_metadata_container_name: str = Field(..., alias="COSMOSDB__METADATACONTAINERNAME")
+    # memory is only for local-stack, which runs all services in one process on a shared in-memory Cosmos DB
+    storage_backend: Literal["cosmos", "sqlite", "memory"] = Field("cosmos", alias="STORAGE__BACKEND")
+    sqlite_path: str = Field("dota2_notify.db", alias="STORAGE__SQLITEPATH")
+    cosmosdb_endpoint_uri: str = Field("", alias="COSMOSDB__ENDPOINTURI")
+    cosmosdb_primary_key: str = Field("", alias="COSMOSDB__PRIMARYKEY")
+    cosmosdb_database_name: str = Field("", alias="COSMOSDB__DATABASENAME")
+    cosmosdb_container_name: str = Field("", alias="COSMOSDB__CONTAINERNAME")
+    cosmosdb_metadata_container_name: str = Field("", alias="COSMOSDB__METADATACONTAINERNAME")
     redis_host: str = Field(..., alias="REDIS__HOST")
     redis_port: int = Field(..., alias="REDIS__PORT")
+    # Seconds between snapshots of the follower index to the metadata container, 0 disables them
+    snapshot_interval_seconds: float = Field(3600.0, alias="SNAPSHOT__INTERVALSECONDS")
+    # Seconds between digest comparisons of the follower index with Cosmos DB, 0 disables them
+    reconcile_interval_seconds: float = Field(21600.0, alias="RECONCILE__INTERVALSECONDS")
+    # Change feed continuations are saved at most this often, or after this many changes of a feed range
+    checkpoint_interval_seconds: float = Field(30.0, alias="CHECKPOINT__INTERVALSECONDS")
+    checkpoint_max_docs: int = Field(10000, alias="CHECKPOINT__MAXDOCS")
+    # Feed ranges queried at once by `data-sync --rebuild`
+    rebuild_max_concurrency: int = Field(4, alias="REBUILD__MAXCONCURRENCY")
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -20,6 +35,10 @@ class Settings(BaseSettings):
         extra="ignore",
     )
 
+    @model_validator(mode="after")
+    def require_cosmosdb_settings(self):
+        return check_storage_settings(self)
+
 
 @cache
 def get_settings():
@@ -1,11 +1,26 @@
+import argparse
 import asyncio
+import hashlib
 import json
 import logging
 import signal
+import sqlite3
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
 import redis.asyncio as redis
 
+from azure.cosmos import exceptions
 from azure.cosmos.aio import CosmosClient
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.clients.sqlite_user_store import SqliteUserStore
+from dota2_notify.clients.user_cache import RedisUserCache
+from dota2_notify.config import MEMORY_BACKEND_ERROR
 from dota2_notify.sync.config import get_settings
+from dota2_notify.sync.metrics import SyncStats
+from dota2_notify.sync.rebuild import rebuild_index
+from dota2_notify.sync.reconcile import reconcile
+from dota2_notify.sync.snapshot import try_restore_snapshot, write_snapshot
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
@@ -13,8 +28,9 @@ logger = logging.getLogger(__name__)
 logging.getLogger("azure.cosmos").setLevel(logging.WARNING)
 logging.getLogger("azure.core").setLevel(logging.WARNING)
 
-REDIS_SENTINEL_KEY = "dota2_notify_sync_sentinel"
 FEED_CONTINUATION_TOKEN_DOC_ID = "feed_continuation_token"
+# Changes written while the single continuation token of older releases was being saved
+LEGACY_CONTINUATION_MARGIN = timedelta(minutes=5)
 keep_running = True
 
 
@@ -27,119 +43,487 @@ signal.signal(signal.SIGINT, handle_exit)
 signal.signal(signal.SIGTERM, handle_exit)
 
 
-async def get_continuation_token(metadata_container):
+def feed_range_doc_id(feed_range: dict) -> str:
+    """ID of the metadata document holding the continuation token of a feed range."""
+    digest = hashlib.sha1(json.dumps(feed_range, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{FEED_CONTINUATION_TOKEN_DOC_ID}:{digest}"
+
+
+async def get_continuation_token(metadata_container, doc_id: str = FEED_CONTINUATION_TOKEN_DOC_ID):
     try:
-        metadata_doc = await metadata_container.read_item(
-            item=FEED_CONTINUATION_TOKEN_DOC_ID, partition_key=FEED_CONTINUATION_TOKEN_DOC_ID
-        )
+        metadata_doc = await metadata_container.read_item(item=doc_id, partition_key=doc_id)
         return metadata_doc.get("continuation_token")
     except Exception:
         return None
 
 
-async def save_continuation_token(metadata_container, token):
+async def save_continuation_token(metadata_container, token, doc_id: str = FEED_CONTINUATION_TOKEN_DOC_ID):
     metadata_doc = {
-        "id": FEED_CONTINUATION_TOKEN_DOC_ID,
+        "id": doc_id,
         "continuation_token": token,
     }
     await metadata_container.upsert_item(body=metadata_doc)
 
 
-async def delete_continuation_token(metadata_container):
+async def get_legacy_start_time(metadata_container) -> datetime | None:
+    """
+    Where feed ranges without a continuation of their own start after an upgrade from the single continuation token.
+
+    That token covers the whole container and cannot be split into feed
+    ranges, so the ranges start a margin before it was last saved instead
+    of replaying the whole feed. Changes applied twice are harmless.
+    """
+    try:
+        metadata_doc = await metadata_container.read_item(item=FEED_CONTINUATION_TOKEN_DOC_ID, partition_key=FEED_CONTINUATION_TOKEN_DOC_ID)
+    except Exception:
+        return None
+    if not metadata_doc.get("continuation_token") or "_ts" not in metadata_doc:
+        return None
+    return datetime.fromtimestamp(metadata_doc["_ts"], timezone.utc) - LEGACY_CONTINUATION_MARGIN
+
+
+async def delete_continuation_token(metadata_container, doc_id: str = FEED_CONTINUATION_TOKEN_DOC_ID):
     try:
-        await metadata_container.delete_item(
-            item=FEED_CONTINUATION_TOKEN_DOC_ID, partition_key=FEED_CONTINUATION_TOKEN_DOC_ID
-        )
+        await metadata_container.delete_item(item=doc_id, partition_key=doc_id)
     except Exception:
         pass
 
 
+class Checkpointer:
+    """
+    Debounced writes of feed continuation tokens to the metadata container.
+
+    The continuation of a feed range is saved once `interval_seconds` passed
+    or `max_docs` changes were applied since its last save, and on flush().
+    After a crash the changes since the last save are applied again, which
+    the follower index and the user cache tolerate.
+    """
+
+    def __init__(self, metadata_container, interval_seconds: float = 30.0, max_docs: int = 10000):
+        self._metadata_container = metadata_container
+        self._interval_seconds = interval_seconds
+        self._max_docs = max_docs
+        self._pending: dict[str, str] = {}
+        self._pending_docs: dict[str, int] = {}
+        self._started = time.monotonic()
+        self._last_saved: dict[str, float] = {}
+        self.saved = 0
+        self.skipped = 0
+
+    async def update(self, doc_id: str, continuation: str, docs: int = 0) -> None:
+        """Record the continuation of a feed range after `docs` changes were applied, saving it if due."""
+        self._pending[doc_id] = continuation
+        self._pending_docs[doc_id] = self._pending_docs.get(doc_id, 0) + docs
+        due = time.monotonic() - self._last_saved.get(doc_id, self._started) >= self._interval_seconds
+        if due or self._pending_docs[doc_id] >= self._max_docs:
+            await self._save(doc_id)
+        else:
+            self.skipped += 1
+
+    async def flush(self) -> None:
+        """Save every continuation not saved yet, e.g. on shutdown."""
+        for doc_id in list(self._pending):
+            await self._save(doc_id)
+
+    def discard(self) -> None:
+        """Forget unsaved continuations, after the stored ones were reset to an older position."""
+        self._pending.clear()
+        self._pending_docs.clear()
+
+    async def _save(self, doc_id: str) -> None:
+        await save_continuation_token(self._metadata_container, self._pending[doc_id], doc_id)
+        del self._pending[doc_id]
+        self._pending_docs.pop(doc_id, None)
+        self._last_saved[doc_id] = time.monotonic()
+        self.saved += 1
+
+    def stats(self) -> dict:
+        return {"saved": self.saved, "skipped": self.skipped, "pending": len(self._pending)}
+
+
+async def apply_changes(docs: list[dict], follower_index: FollowerIndex, user_cache: RedisUserCache | None = None) -> None:
+    """
+    Apply a batch of changed documents to the follower index and drop their cached copies.
+
+    The whole batch is one MULTI/EXEC round-trip, so it either lands completely
+    or not at all. Commands keep the feed order, so the latest version of a
+    document that changed more than once wins.
+    """
+    if not docs:
+        return
+    async with follower_index.redis_client.pipeline(transaction=True) as pipe:
+        for doc in docs:
+            if user_cache and doc.get("type") == "user":
+                await user_cache.invalidate(doc, client=pipe)
+            await follower_index.apply(pipe, doc)
+        await pipe.execute()
+
+
+async def ensure_index_ready(follower_index: FollowerIndex, metadata_container, doc_ids: list[str], continuations: list) -> tuple[list, bool]:
+    """
+    Check the sentinel of the follower index and rebuild what Redis lost.
+
+    The latest snapshot is restored and only the changes after it are
+    replayed, or without a snapshot the whole feed is. This is also how a new
+    layout version is built: older layouts stay in place until it is ready.
+
+    Returns:
+        The continuations to read from, and whether a replay has to finish before the index is ready
+    """
+    if await follower_index.redis_client.exists(follower_index.sentinel_key):
+        return continuations, False
+
+    snapshot_continuations = await try_restore_snapshot(metadata_container, follower_index) or {}
+    if snapshot_continuations:
+        logger.warning("Redis sentinel key not found. Restored the follower snapshot, replaying the changes after it.")
+    else:
+        logger.warning("Redis sentinel key not found. Restarting from the beginning.")
+    # Ranges missing from the snapshot (e.g. after a split) start from the beginning
+    continuations = [snapshot_continuations.get(doc_id) for doc_id in doc_ids]
+    await asyncio.gather(*(
+        save_continuation_token(metadata_container, continuation, doc_id) if continuation
+        else delete_continuation_token(metadata_container, doc_id)
+        for doc_id, continuation in zip(doc_ids, continuations)
+    ))
+    return continuations, True
+
+
+async def mark_index_ready(follower_index: FollowerIndex) -> None:
+    """Set the sentinel once the index holds every follow edge, and drop the layouts it replaces."""
+    logger.info("Initial run completed. Setting Redis sentinel key.")
+    await follower_index.redis_client.set(follower_index.sentinel_key, "1")
+    try:
+        await follower_index.drop_previous_layouts()
+    except Exception as e:
+        logger.warning(f"Failed to drop previous follower index layouts: {e}")
+    await log_index_memory(follower_index)
+
+
+async def log_index_memory(follower_index: FollowerIndex) -> None:
+    try:
+        logger.info("Follower index memory: %s", await follower_index.memory_report())
+    except Exception as e:
+        logger.warning(f"Failed to report follower index memory: {e}")
+
+
+def log_throughput(docs: int, batches: int, started: float) -> None:
+    if docs:
+        elapsed = time.perf_counter() - started
+        logger.info("Applied %d changes in %d batches (%.0f docs/s)", docs, batches, docs / elapsed if elapsed > 0 else 0.0)
+
+
+async def poll_feed_range(
+    container,
+    checkpointer: Checkpointer,
+    follower_index: FollowerIndex,
+    feed_range: dict,
+    continuation: str | None,
+    user_cache: RedisUserCache | None = None,
+    batch_size: int = 1000,
+    stats: SyncStats | None = None,
+    start_time: datetime | str = "Beginning"
+) -> tuple[str | None, int, int, bool]:
+    """
+    Apply every change of one feed range since `continuation`, or since `start_time` without one.
+
+    Every feed page is applied as one Redis transaction, and the continuation
+    of the range only moves past a page after it landed, so a failed batch
+    is read again on the next poll.
+
+    Returns:
+        The new continuation, the number of changes and batches applied, and whether the range was read to the end
+    """
+    doc_id = feed_range_doc_id(feed_range)
+    # The response hook sees the headers of this range's pages only, while
+    # last_response_headers is shared by all ranges read concurrently. The
+    # hook runs with the raw LSN etag of the server response; the SDK swaps
+    # in the composite continuation of the feed range afterwards, so the
+    # etag is read once the page is fetched
+    page_headers = []
+    feed_kwargs = {"continuation": continuation} if continuation else {"feed_range": feed_range, "start_time": start_time}
+    applied = 0
+    batches = 0
+    try:
+        pages = container.query_items_change_feed(
+            max_item_count=batch_size,
+            response_hook=lambda headers, body: page_headers.append(headers),
+            **feed_kwargs
+        ).by_page()
+        async for page in pages:
+            docs = [doc async for doc in page]
+            page_continuation = page_headers[-1].get("etag")
+            started = time.perf_counter()
+            try:
+                await apply_changes(docs, follower_index, user_cache)
+            except redis.RedisError:
+                if stats:
+                    stats.record_batch(docs, time.perf_counter() - started, failed=True)
+                raise
+            if stats and docs:
+                stats.record_batch(docs, time.perf_counter() - started)
+            applied += len(docs)
+            batches += 1
+            if page_continuation and page_continuation != continuation:
+                continuation = page_continuation
+                await checkpointer.update(doc_id, continuation, len(docs))
+    except redis.RedisError as e:
+        logger.error(f"Redis error during change feed processing of range {doc_id}: {e}. Retrying batch.")
+        return continuation, applied, batches, False
+    except exceptions.CosmosHttpResponseError as e:
+        if e.status_code != 429:
+            raise
+        # The SDK gave up retrying; the range is read again from its continuation on the next poll
+        logger.warning(f"Change feed of range {doc_id} throttled: {e.message}. Retrying on the next poll.")
+        return continuation, applied, batches, False
+
+    # An empty range still returns a continuation for the next poll
+    last_continuation = page_headers[-1].get("etag") if page_headers else None
+    if last_continuation and last_continuation != continuation:
+        continuation = last_continuation
+        await checkpointer.update(doc_id, continuation)
+    return continuation, applied, batches, True
+
+
 async def consume_change_feed(
-    container, metadata_container, redis_client, poll_interval: float = 5.0
+    container,
+    metadata_container,
+    follower_index: FollowerIndex,
+    poll_interval: float = 5.0,
+    user_cache: RedisUserCache | None = None,
+    batch_size: int = 1000,
+    snapshot_interval_seconds: float | None = None,
+    reconcile_interval_seconds: float | None = None,
+    checkpoint_interval_seconds: float = 30.0,
+    checkpoint_max_docs: int = 10000
 ) -> None:
-    """Poll the Cosmos DB change feed indefinitely and print each changed document."""
-    continuation = await get_continuation_token(metadata_container)
+    """
+    Poll the Cosmos DB change feed indefinitely, updating the follower index and invalidating cached users.
+
+    The container is split into its feed ranges, which are read concurrently,
+    each with its own continuation token in the metadata container. Tokens
+    are saved at most every `checkpoint_interval_seconds` or
+    `checkpoint_max_docs` changes per range, and when the loop stops.
+
+    Every `snapshot_interval_seconds` the follower index is written to the
+    metadata container together with the continuations. When the Redis
+    sentinel is missing (Redis lost its data) the snapshot is restored and
+    only the changes after it are replayed.
+
+    Every `reconcile_interval_seconds` the index is compared with Cosmos DB
+    bucket by bucket, and buckets that drifted are repaired. It runs between
+    polls, so no feed changes are applied while it does.
+    """
+    feed_ranges = [feed_range async for feed_range in container.read_feed_ranges()]
+    continuations = list(await asyncio.gather(
+        *(get_continuation_token(metadata_container, feed_range_doc_id(feed_range)) for feed_range in feed_ranges)
+    ))
+    logger.info("Reading the change feed in %d feed ranges", len(feed_ranges))
+    # Right after the upgrade from the single continuation token, the ranges start from its position
+    legacy_start_time = None if all(continuations) else await get_legacy_start_time(metadata_container)
+    if legacy_start_time:
+        logger.info("Starting feed ranges without a continuation at %s, from the single continuation token", legacy_start_time)
+    doc_ids = [feed_range_doc_id(feed_range) for feed_range in feed_ranges]
+    iterations = 0
+    # True while some range is read from the beginning and the sentinel is not set yet
+    initial_run_pending = False
+    last_snapshot = time.monotonic()
+    last_reconcile = time.monotonic()
+    checkpointer = Checkpointer(metadata_container, checkpoint_interval_seconds, checkpoint_max_docs)
+    stats = SyncStats()
+
+    try:
+        while keep_running:
+            iterations += 1
+            # On startup and every 10th poll
+            if iterations % 10 == 1:
+                try:
+                    logger.info("Checking for Redis sentinel key...")
+                    continuations, replay_pending = await ensure_index_ready(follower_index, metadata_container, doc_ids, continuations)
+                    if replay_pending:
+                        checkpointer.discard()
+                        legacy_start_time = None
+                    initial_run_pending = initial_run_pending or replay_pending
+                except redis.RedisError as e:
+                    logger.error(f"Redis error when checking sentinel key: {e}")
+            if iterations % 60 == 0:
+                logger.info("Sync stats: %s. Checkpoints: %s", stats.report(), checkpointer.stats())
+
+            initial_run_pending = initial_run_pending or (not all(continuations) and not legacy_start_time)
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                poll_feed_range(
+                    container, checkpointer, follower_index, feed_range, continuation, user_cache, batch_size, stats,
+                    start_time=legacy_start_time or "Beginning"
+                )
+                for feed_range, continuation in zip(feed_ranges, continuations)
+            ))
+            continuations = [continuation for continuation, _, _, _ in results]
+            log_throughput(sum(result[1] for result in results), sum(result[2] for result in results), started)
+
+            if not all(completed for _, _, _, completed in results):
+                await asyncio.sleep(poll_interval)
+                continue
+
+            if initial_run_pending:
+                try:
+                    await mark_index_ready(follower_index)
+                    initial_run_pending = False
+                except redis.RedisError as e:
+                    logger.error(f"Redis error when setting sentinel key: {e}")
+
+            if snapshot_interval_seconds and not initial_run_pending and time.monotonic() - last_snapshot >= snapshot_interval_seconds:
+                last_snapshot = time.monotonic()
+                try:
+                    await write_snapshot(metadata_container, follower_index, dict(zip(doc_ids, continuations)))
+                    await log_index_memory(follower_index)
+                except Exception as e:
+                    logger.error(f"Failed to write follower snapshot: {e}")
+
+            if reconcile_interval_seconds and not initial_run_pending and time.monotonic() - last_reconcile >= reconcile_interval_seconds:
+                last_reconcile = time.monotonic()
+                try:
+                    await reconcile(container, follower_index)
+                except Exception as e:
+                    logger.error(f"Failed to reconcile the follower index: {e}")
+
+            logger.debug("Checked for changes. Continuation tokens: %s", continuations)
+
+            logger.debug("Waiting %ss before next poll.", poll_interval)
+            await asyncio.sleep(poll_interval)
+    finally:
+        try:
+            await checkpointer.flush()
+        except Exception as e:
+            logger.error(f"Failed to save the change feed continuations on shutdown: {e}")
+        logger.info("Sync stats: %s. Checkpoints: %s", stats.report(), checkpointer.stats())
+
+
+async def rebuild(container, metadata_container, follower_index: FollowerIndex, max_concurrency: int = 4) -> None:
+    """Rebuild the follower index from Cosmos DB and point every feed range at the continuation captured before the rebuild."""
+    for feed_range, continuation in await rebuild_index(container, follower_index, max_concurrency):
+        doc_id = feed_range_doc_id(feed_range)
+        if continuation:
+            await save_continuation_token(metadata_container, continuation, doc_id)
+        else:
+            await delete_continuation_token(metadata_container, doc_id)
+    await follower_index.drop_previous_layouts()
+    await log_index_memory(follower_index)
+
+
+async def consume_change_log(store: SqliteUserStore, follower_index: FollowerIndex, poll_interval: float = 5.0, batch_size: int = 1000) -> None:
+    """Tail the change log of the SQLite store indefinitely, the SQLite counterpart of consume_change_feed."""
+    metadata_container = store.metadata_container
+    position = await get_continuation_token(metadata_container) or 0
     iterations = 0
     initial_run_completed = False
 
     while keep_running:
         iterations += 1
-        if iterations % 10 == 0:
+        # On startup and every 10th poll
+        if iterations % 10 == 1:
             try:
-                logger.info("Checking for Redis sentinel key...")
-                sentinel_exists = await redis_client.exists(REDIS_SENTINEL_KEY)
-                if not sentinel_exists:
-                    logger.warning("Redis sentinel key not found. Restarting from the beginning.")
-                    continuation = None
+                [continuation], replay_pending = await ensure_index_ready(
+                    follower_index, metadata_container, [FEED_CONTINUATION_TOKEN_DOC_ID], [position]
+                )
+                if replay_pending:
+                    position = continuation or 0
                     initial_run_completed = False
-                    await delete_continuation_token(metadata_container)
             except redis.RedisError as e:
                 logger.error(f"Redis error when checking sentinel key: {e}")
 
-        feed_kwargs = (
-            {"continuation": continuation} if continuation else {"start_time": "Beginning"}
-        )
-
+        started = time.perf_counter()
+        try:
+            docs, new_position = await store.read_change_log_async(position, limit=batch_size)
+        except sqlite3.Error as e:
+            # e.g. the database stays locked by a writer past the busy timeout
+            logger.error(f"SQLite error when reading the change log: {e}. Retrying batch.")
+            await asyncio.sleep(poll_interval)
+            continue
         try:
-            iterator = container.query_items_change_feed(**feed_kwargs)
-            async for doc in iterator:
-                print(json.dumps(doc, indent=2))
-                if doc.get("following"):
-                    await redis_client.sadd(doc["id"], doc["userId"])
-                else:
-                    await redis_client.srem(doc["id"], doc["userId"])
+            await apply_changes(docs, follower_index)
         except redis.RedisError as e:
-            logger.error(f"Redis error during change feed processing: {e}. Retrying batch.")
+            logger.error(f"Redis error during change log processing: {e}. Retrying batch.")
             await asyncio.sleep(poll_interval)
             continue
+        log_throughput(len(docs), 1, started)
 
-        if not continuation and not initial_run_completed:
+        if new_position != position:
+            position = new_position
             try:
-                logger.info("Initial run completed. Setting Redis sentinel key.")
-                await redis_client.set(REDIS_SENTINEL_KEY, "1")
-                initial_run_completed = True
-            except redis.RedisError as e:
-                logger.error(f"Redis error when setting sentinel key: {e}")
-
-        new_continuation = container.client_connection.last_response_headers.get("etag")
-        if new_continuation and new_continuation != continuation:
-            continuation = new_continuation
-            await save_continuation_token(metadata_container, continuation)
+                await save_continuation_token(metadata_container, position)
+            except sqlite3.Error as e:
+                # Applying a batch again is harmless, so a restart before the next save only replays it
+                logger.error(f"SQLite error when saving the change log position {position}: {e}")
 
-        logger.debug("Checked for changes. Continuation token: %s", continuation)
-
-        logger.debug("Waiting %ss before next poll.", poll_interval)
-        await asyncio.sleep(poll_interval)
+        if len(docs) < batch_size:
+            if not initial_run_completed:
+                try:
+                    await mark_index_ready(follower_index)
+                    initial_run_completed = True
+                except redis.RedisError as e:
+                    logger.error(f"Redis error when setting sentinel key: {e}")
+            logger.debug("Waiting %ss before next poll.", poll_interval)
+            await asyncio.sleep(poll_interval)
 
 
-async def main() -> None:
+async def main(rebuild_first: bool = False, cosmos_client=None) -> None:
+    """Run data-sync, on `cosmos_client` if given (local-stack shares one between the services)."""
     settings = get_settings()
 
     logger.info("Connecting to Redis: %s:%s", settings.redis_host, settings.redis_port)
     redis_client = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
-    logger.info("Connecting to Cosmos DB: %s", settings.cosmosdb_endpoint_uri)
-    async with CosmosClient(
-        url=settings.cosmosdb_endpoint_uri,
-        credential=settings.cosmosdb_primary_key,
-    ) as client:
-        database = client.get_database_client(settings.cosmosdb_database_name)
-        container = database.get_container_client(settings.cosmosdb_container_name)
-        metadata_container = database.get_container_client(settings.cosmosdb_metadata_container_name)
-        logger.info(
-            "Listening to change feed on %s/%s",
-            settings.cosmosdb_database_name,
-            settings.cosmosdb_container_name,
-        )
-        await consume_change_feed(container, metadata_container, redis_client)
+    if settings.storage_backend == "sqlite":
+        logger.info("Tailing the change log of %s", settings.sqlite_path)
+        if rebuild_first:
+            logger.warning("--rebuild needs Cosmos DB, tailing the change log instead")
+        async with SqliteUserStore(settings.sqlite_path) as store:
+            await consume_change_log(store, FollowerIndex(redis_client))
+    else:
+        async with AsyncExitStack() as stack:
+            if cosmos_client is None:
+                if settings.storage_backend == "memory":
+                    raise RuntimeError(MEMORY_BACKEND_ERROR)
+                logger.info("Connecting to Cosmos DB: %s", settings.cosmosdb_endpoint_uri)
+                cosmos_client = await stack.enter_async_context(
+                    CosmosClient(url=settings.cosmosdb_endpoint_uri, credential=settings.cosmosdb_primary_key)
+                )
+            database = cosmos_client.get_database_client(settings.cosmosdb_database_name)
+            container = database.get_container_client(settings.cosmosdb_container_name)
+            metadata_container = database.get_container_client(settings.cosmosdb_metadata_container_name)
+            logger.info(
+                "Listening to change feed on %s/%s",
+                settings.cosmosdb_database_name,
+                settings.cosmosdb_container_name,
+            )
+            follower_index = FollowerIndex(redis_client)
+            if rebuild_first:
+                logger.info("Rebuilding the follower index from a query of %s", settings.cosmosdb_container_name)
+                await rebuild(container, metadata_container, follower_index, settings.rebuild_max_concurrency)
+            await consume_change_feed(
+                container,
+                metadata_container,
+                follower_index,
+                user_cache=RedisUserCache(redis_client),
+                snapshot_interval_seconds=settings.snapshot_interval_seconds,
+                reconcile_interval_seconds=settings.reconcile_interval_seconds,
+                checkpoint_interval_seconds=settings.checkpoint_interval_seconds,
+                checkpoint_max_docs=settings.checkpoint_max_docs
+            )
 
     logger.info("Shutting down Redis client...")
     await redis_client.close()
 
 
 def run() -> None:
+    parser = argparse.ArgumentParser(description="Keep the Redis follower index in sync with the user store.")
+    parser.add_argument(
+        "--rebuild", action="store_true",
+        help="rebuild the follower index from a query of Cosmos DB, then follow the change feed from before the rebuild"
+    )
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(rebuild_first=args.rebuild))
     except KeyboardInterrupt:
         logger.info("Shutting down...")
 
@@ -0,0 +1,43 @@
+import time
+
+
+class SyncStats:
+    """Docs applied, change feed lag and Redis latency of data-sync."""
+
+    def __init__(self):
+        self.docs_applied = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self._redis_seconds = 0.0
+        self._max_redis_seconds = 0.0
+        # `_ts` of the newest change applied, and how long after it was written it was applied
+        self.last_change_ts: int | None = None
+        self.lag_seconds: float | None = None
+        self.max_lag_seconds = 0.0
+
+    def record_batch(self, docs: list[dict], seconds: float, failed: bool = False):
+        """Record one Redis transaction applying a page of changes, and the lag of its newest change."""
+        self.batches += 1
+        self._redis_seconds += seconds
+        self._max_redis_seconds = max(self._max_redis_seconds, seconds)
+        if failed:
+            self.failed_batches += 1
+            return
+        self.docs_applied += len(docs)
+        change_ts = max((doc.get("_ts", 0) for doc in docs), default=0)
+        if change_ts:
+            self.last_change_ts = max(self.last_change_ts or 0, change_ts)
+            self.lag_seconds = max(0.0, time.time() - change_ts)
+            self.max_lag_seconds = max(self.max_lag_seconds, self.lag_seconds)
+
+    def report(self) -> dict:
+        return {
+            "docs_applied": self.docs_applied,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "avg_redis_latency_ms": round(self._redis_seconds / self.batches * 1000, 1) if self.batches else 0.0,
+            "max_redis_latency_ms": round(self._max_redis_seconds * 1000, 1),
+            "lag_seconds": round(self.lag_seconds, 1) if self.lag_seconds is not None else None,
+            "max_lag_seconds": round(self.max_lag_seconds, 1),
+            "seconds_since_last_change": round(time.time() - self.last_change_ts, 1) if self.last_change_ts else None,
+        }
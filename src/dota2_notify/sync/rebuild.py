@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable
+
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.models.user import User
+from dota2_notify.sync.reconcile import EDGES_QUERY, USERS_QUERY
+
+logger = logging.getLogger(__name__)
+
+# Namespace the new index is built in before it replaces the live one
+SHADOW_NAMESPACE = "followers-rebuild"
+QUERY_PAGE_SIZE = 1000
+
+
+async def capture_continuation(container, feed_range: dict) -> str | None:
+    """Continuation token of the current end of a feed range's change feed."""
+    # The SDK puts the composite continuation in the headers after the hook returned
+    page_headers = []
+    pages = container.query_items_change_feed(
+        feed_range=feed_range,
+        start_time="Now",
+        max_item_count=1,
+        response_hook=lambda headers, body: page_headers.append(headers)
+    ).by_page()
+    async for page in pages:
+        [doc async for doc in page]
+        break
+    return page_headers[-1].get("etag") if page_headers else None
+
+
+async def query_feed_ranges(
+    container,
+    query: str,
+    feed_ranges: list[dict],
+    handle_page: Callable[[list[dict]], Awaitable[None]],
+    max_concurrency: int
+) -> int:
+    """
+    Run a cross-partition query as one query per feed range, at most `max_concurrency` at a time.
+
+    Returns:
+        Number of documents read
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    counts = []
+
+    async def query_range(feed_range: dict):
+        count = 0
+        async with semaphore:
+            pages = container.query_items(query=query, feed_range=feed_range, max_item_count=QUERY_PAGE_SIZE).by_page()
+            async for page in pages:
+                docs = [doc async for doc in page]
+                await handle_page(docs)
+                count += len(docs)
+        counts.append(count)
+
+    await asyncio.gather(*(query_range(feed_range) for feed_range in feed_ranges))
+    return sum(counts)
+
+
+async def rebuild_index(container, follower_index: FollowerIndex, max_concurrency: int = 4) -> list[tuple[dict, str | None]]:
+    """
+    Rebuild the follower index from a projected query of Cosmos DB instead of replaying the change feed.
+
+    The index is bulk-loaded into a shadow namespace and then atomically
+    swapped in. The change feed continuations are captured before the
+    queries start, so resuming the feed from them re-applies every change the
+    queries may have missed, including edges the web app wrote meanwhile.
+
+    Returns:
+        Each feed range with the continuation to resume its change feed from
+    """
+    started = time.perf_counter()
+    feed_ranges = [feed_range async for feed_range in container.read_feed_ranges()]
+    continuations = list(await asyncio.gather(*(capture_continuation(container, feed_range) for feed_range in feed_ranges)))
+
+    shadow = FollowerIndex(follower_index.redis_client, follower_index.version, namespace=SHADOW_NAMESPACE)
+    # Left over from an interrupted rebuild
+    await shadow.drop()
+
+    notifiable = set()
+
+    async def load_users(docs: list[dict]):
+        user_ids = [int(doc["userId"]) for doc in docs if User.model_validate(doc).is_telegram_verified]
+        if user_ids:
+            notifiable.update(user_ids)
+            await shadow.redis_client.sadd(shadow.notifiable_key, *user_ids)
+
+    async def load_edges(docs: list[dict]):
+        following = defaultdict(dict)
+        for doc in docs:
+            following[int(doc["userId"])][int(doc["id"])] = doc.get("_ts", 0)
+        pipe = shadow.redis_client.pipeline(transaction=False)
+        for user_id, versions in following.items():
+            pipe.sadd(shadow.following_key(user_id), *versions)
+            pipe.hset(shadow.versions_key(user_id), mapping=versions)
+            if user_id in notifiable:
+                for account_id in versions:
+                    pipe.sadd(shadow.followers_key(account_id), user_id)
+        await pipe.execute()
+
+    # Users first, so edges of notifiable users go straight into the followers sets
+    users = await query_feed_ranges(container, USERS_QUERY, feed_ranges, load_users, max_concurrency)
+    edges = await query_feed_ranges(container, EDGES_QUERY, feed_ranges, load_edges, max_concurrency)
+    await shadow.redis_client.set(shadow.sentinel_key, "1")
+    await follower_index.replace_with(shadow)
+
+    logger.info(
+        "Rebuilt the follower index from %d users and %d edges (%d notifiable users) in %.1fs",
+        users, edges, len(notifiable), time.perf_counter() - started
+    )
+    return list(zip(feed_ranges, continuations))
@@ -0,0 +1,265 @@
+import logging
+import time
+from collections import defaultdict
+from typing import Iterable
+
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Users are split into this many buckets by account ID; only buckets whose digests differ are repaired
+BUCKETS = 256
+# Digest of the follow edges of each bucket, aggregated by Cosmos DB: the edge
+# count, the sum of the followed account IDs and the sum of a product of both
+# IDs. The SDK cannot merge GROUP BY results across partitions, so it runs per
+# feed range and the digests are added up. Sums are doubles in Cosmos DB;
+# account IDs stay below 2^32, so they are exact up to 2^21 edges per bucket.
+EDGE_DIGESTS_QUERY = (
+    "SELECT c.userId % {buckets} AS bucket, COUNT(1) AS edges, SUM(StringToNumber(c.id)) AS accounts, "
+    "SUM((c.userId % 65521) * (StringToNumber(c.id) % 65519)) AS pairs "
+    "FROM c WHERE c.following = true GROUP BY c.userId % {buckets}"
+)
+EDGES_QUERY = "SELECT c.id, c.userId, c._ts FROM c WHERE c.following = true"
+USER_EDGES_QUERY = "SELECT c.id, c.userId, c._ts FROM c WHERE c.following = true AND ARRAY_CONTAINS(@userIds, c.userId)"
+USERS_QUERY = "SELECT c.userId, c.telegramChatId FROM c WHERE c.type = 'user'"
+QUERY_PAGE_SIZE = 1000
+# Users whose edges are queried at once when repairing
+USER_BATCH_SIZE = 500
+# Versions of removed edges only reject late writes of an older version, which
+# arrive within the change feed lag, far below this
+TOMBSTONE_RETENTION_SECONDS = 24 * 60 * 60
+
+Digests = dict[int, tuple[int, int, int]]
+
+
+def bucket_of(user_id: int, buckets: int = BUCKETS) -> int:
+    return user_id % buckets
+
+
+def _add_edges(digests: Digests, bucket: int, user_id: int, account_ids: Iterable[int]) -> None:
+    """Add follow edges of a user to the digest of its bucket, computed like EDGE_DIGESTS_QUERY."""
+    count, accounts, pairs = digests.get(bucket, (0, 0, 0))
+    for account_id in account_ids:
+        count += 1
+        accounts += account_id
+        pairs += (user_id % 65521) * (account_id % 65519)
+    digests[bucket] = (count, accounts, pairs)
+
+
+async def read_cosmos_digests(container, buckets: int = BUCKETS) -> Digests:
+    """Digests of the follow edges in Cosmos DB, aggregated server-side."""
+    digests = {}
+    query = EDGE_DIGESTS_QUERY.format(buckets=buckets)
+    async for feed_range in container.read_feed_ranges():
+        async for row in container.query_items(query=query, feed_range=feed_range):
+            count, accounts, pairs = digests.get(int(row["bucket"]), (0, 0, 0))
+            digests[int(row["bucket"])] = (count + int(row["edges"]), accounts + int(row["accounts"]), pairs + int(row["pairs"]))
+    return digests
+
+
+async def read_cosmos_users(container) -> tuple[set[int], set[int]]:
+    """
+    Read the users and their Telegram connections from Cosmos DB.
+
+    Returns:
+        Every user, and the users that can be notified
+    """
+    user_ids = set()
+    notifiable = set()
+    async for doc in container.query_items(query=USERS_QUERY, max_item_count=QUERY_PAGE_SIZE):
+        user_ids.add(int(doc["userId"]))
+        if User.model_validate(doc).is_telegram_verified:
+            notifiable.add(int(doc["userId"]))
+    return user_ids, notifiable
+
+
+async def read_cosmos_edges(container, user_ids: list[int]) -> dict[int, dict[int, int]]:
+    """The accounts each of the given users follows in Cosmos DB, with the `_ts` of the edge."""
+    following = defaultdict(dict)
+    for start in range(0, len(user_ids), USER_BATCH_SIZE):
+        parameters = [{"name": "@userIds", "value": user_ids[start:start + USER_BATCH_SIZE]}]
+        async for doc in container.query_items(query=USER_EDGES_QUERY, parameters=parameters, max_item_count=QUERY_PAGE_SIZE):
+            following[int(doc["userId"])][int(doc["id"])] = doc.get("_ts", 0)
+    return dict(following)
+
+
+async def read_redis_digests(follower_index: FollowerIndex, notifiable: set[int], buckets: int = BUCKETS) -> tuple[Digests, Digests, set[int]]:
+    """
+    Digests of the following sets in Redis, from one scan of them.
+
+    Returns:
+        Digests of the edges, digests of the followers entries the edges of
+        the `notifiable` users should have, and the users following someone
+    """
+    digests = {}
+    expected_followers = {}
+    user_ids = set()
+    async for user_id, account_ids in follower_index.iter_following():
+        _add_edges(digests, bucket_of(user_id, buckets), user_id, account_ids)
+        if user_id in notifiable:
+            _add_edges(expected_followers, bucket_of(user_id, buckets), user_id, account_ids)
+        user_ids.add(user_id)
+    return digests, expected_followers, user_ids
+
+
+async def read_redis_followers(follower_index: FollowerIndex, drifted: set[int], buckets: int = BUCKETS) -> tuple[Digests, dict[int, set[int]]]:
+    """
+    Digests of the followers entries in Redis, from one scan of the followers sets.
+
+    Returns:
+        Digests of the entries, and the accounts each user of the drifted buckets is a follower of
+    """
+    digests = {}
+    followers_of = defaultdict(set)
+    async for account_id, user_ids in follower_index.iter_followers():
+        for user_id in user_ids:
+            _add_edges(digests, bucket_of(user_id, buckets), user_id, [account_id])
+            if bucket_of(user_id, buckets) in drifted:
+                followers_of[user_id].add(account_id)
+    return digests, dict(followers_of)
+
+
+async def read_redis_following(follower_index: FollowerIndex, user_ids: list[int]) -> dict[int, set[int]]:
+    """The accounts each of the given users follows in Redis, read by key."""
+    following = {}
+    for start in range(0, len(user_ids), follower_index.BATCH_SIZE):
+        batch = user_ids[start:start + follower_index.BATCH_SIZE]
+        pipe = follower_index.redis_client.pipeline(transaction=False)
+        for user_id in batch:
+            pipe.smembers(follower_index.following_key(user_id))
+        for user_id, members in zip(batch, await pipe.execute()):
+            if members:
+                following[user_id] = {int(member) for member in members}
+    return following
+
+
+async def repair_bucket(
+    follower_index: FollowerIndex,
+    user_ids: set[int],
+    cosmos_following: dict[int, dict[int, int]],
+    cosmos_notifiable: set[int],
+    redis_following: dict[int, set[int]],
+    redis_followers_of: dict[int, set[int]],
+    redis_notifiable: set[int],
+    cutoff: int
+) -> int:
+    """
+    Bring the users of one bucket in line with Cosmos DB, in one transaction.
+
+    Edges go through the versioned edge script: added ones with the `_ts` of
+    their document, removed ones with `cutoff`, so anything the web app wrote
+    after the Cosmos DB state was read is left alone.
+
+    Returns:
+        Number of users that needed a change
+    """
+    repaired = 0
+    async with follower_index.redis_client.pipeline(transaction=True) as pipe:
+        for user_id in user_ids:
+            expected = cosmos_following.get(user_id, {})
+            actual = redis_following.get(user_id, set())
+            followers_of = redis_followers_of.get(user_id, set())
+            notifiable = user_id in cosmos_notifiable
+            changed = False
+
+            if notifiable != (user_id in redis_notifiable):
+                if notifiable:
+                    pipe.sadd(follower_index.notifiable_key, user_id)
+                else:
+                    pipe.srem(follower_index.notifiable_key, user_id)
+                changed = True
+            for account_id in expected.keys() - actual:
+                await follower_index.set_following(user_id, account_id, True, expected[account_id], client=pipe)
+                changed = True
+            for account_id in actual - expected.keys():
+                await follower_index.set_following(user_id, account_id, False, cutoff, client=pipe)
+                changed = True
+            # Edges both sides agree on, and followers entries without any edge behind them
+            for account_id in (expected.keys() & actual) | (followers_of - expected.keys() - actual):
+                should_follow = notifiable and account_id in expected
+                if should_follow and account_id not in followers_of:
+                    pipe.sadd(follower_index.followers_key(account_id), user_id)
+                    changed = True
+                elif not should_follow and account_id in followers_of:
+                    pipe.srem(follower_index.followers_key(account_id), user_id)
+                    changed = True
+            repaired += changed
+        await pipe.execute()
+    return repaired
+
+
+async def reconcile(container, follower_index: FollowerIndex, buckets: int = BUCKETS) -> dict:
+    """
+    Compare per-bucket digests of the follow edges in Cosmos DB and Redis, and
+    re-sync the buckets that differ. Versions of edges removed more than
+    TOMBSTONE_RETENTION_SECONDS ago are pruned after.
+
+    Cosmos DB only returns the digests and the user documents; the edges are
+    queried for the users of drifted buckets alone, so edges of a user
+    without a user document are only repaired once the index has some of them.
+    Redis is scanned once, the followers sets a second time only if their
+    entries drifted while the edges behind them did not.
+
+    Must not run concurrently with the change feed consumer: notifiability is
+    not versioned, so a change applied from the feed between reading Cosmos DB
+    and the repair would be undone.
+
+    Returns:
+        Bucket, edge and repair counts
+    """
+    started = time.perf_counter()
+    # Edges written after this second may be missing from the queries
+    cutoff = int(time.time()) - 1
+    cosmos_digests = await read_cosmos_digests(container, buckets)
+    cosmos_users, cosmos_notifiable = await read_cosmos_users(container)
+    redis_notifiable = await follower_index.get_notifiable()
+    redis_digests, expected_followers, redis_users = await read_redis_digests(follower_index, cosmos_notifiable, buckets)
+
+    drifted = {bucket for bucket in cosmos_digests.keys() | redis_digests.keys() if cosmos_digests.get(bucket) != redis_digests.get(bucket)}
+    drifted |= {bucket_of(user_id, buckets) for user_id in cosmos_notifiable ^ redis_notifiable}
+    followers_digests, redis_followers_of = await read_redis_followers(follower_index, drifted, buckets)
+    followers_drifted = {
+        bucket for bucket in followers_digests.keys() | expected_followers.keys()
+        if followers_digests.get(bucket) != expected_followers.get(bucket)
+    } - drifted
+    if followers_drifted:
+        redis_followers_of.update((await read_redis_followers(follower_index, followers_drifted, buckets))[1])
+        drifted |= followers_drifted
+
+    repaired = 0
+    queried_users = 0
+    if drifted:
+        user_ids = sorted(
+            user_id for user_id in cosmos_users | redis_users | redis_notifiable | redis_followers_of.keys()
+            if bucket_of(user_id, buckets) in drifted
+        )
+        queried_users = len(user_ids)
+        cosmos_following = await read_cosmos_edges(container, user_ids)
+        redis_following = await read_redis_following(follower_index, user_ids)
+        users_by_bucket = defaultdict(set)
+        for user_id in user_ids:
+            users_by_bucket[bucket_of(user_id, buckets)].add(user_id)
+        for bucket in sorted(users_by_bucket):
+            repaired += await repair_bucket(
+                follower_index, users_by_bucket[bucket], cosmos_following, cosmos_notifiable,
+                redis_following, redis_followers_of, redis_notifiable, cutoff
+            )
+
+    pruned = await follower_index.prune_versions(cutoff - TOMBSTONE_RETENTION_SECONDS)
+
+    report = {
+        "buckets": buckets,
+        "drifted_buckets": len(drifted),
+        "queried_users": queried_users,
+        "repaired_users": repaired,
+        "pruned_versions": pruned,
+        "edges": sum(count for count, _, _ in cosmos_digests.values()),
+        "notifiable_users": len(cosmos_notifiable),
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+    if drifted:
+        logger.warning("Follower index drifted from Cosmos DB, repaired: %s", report)
+    else:
+        logger.info("Follower index matches Cosmos DB: %s", report)
+    return report
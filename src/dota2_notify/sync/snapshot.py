@@ -0,0 +1,144 @@
+import base64
+import json
+import logging
+import time
+import zlib
+
+from dota2_notify.clients.follower_index import FollowerIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MANIFEST_DOC_ID = "follower_snapshot"
+# Cosmos DB documents are limited to 2 MB, keep every chunk well below
+MAX_CHUNK_BYTES = 1024 * 1024
+# Version of the chunk contents; snapshots of another format are not restored
+SNAPSHOT_FORMAT = 2
+
+
+def _chunk_doc_id(generation: int, index: int) -> str:
+    return f"{SNAPSHOT_MANIFEST_DOC_ID}:{generation}:{index}"
+
+
+def _encode(chunk: dict) -> str:
+    return base64.b64encode(zlib.compress(json.dumps(chunk, separators=(",", ":")).encode())).decode()
+
+
+def _decode(data: str) -> dict:
+    return json.loads(zlib.decompress(base64.b64decode(data)))
+
+
+async def write_snapshot(metadata_container, follower_index: FollowerIndex, continuations: dict[str, str]) -> dict:
+    """
+    Write the follower index to the metadata container as of the given feed continuations.
+
+    The continuations must be captured before the index is read, so the
+    snapshot is at least as new as them and replaying the feed from them
+    only re-applies changes. Chunks are written first and the manifest last,
+    so a partially written snapshot is never restored.
+
+    Returns:
+        The manifest of the new snapshot
+    """
+    started = time.perf_counter()
+    following = {user_id: account_ids async for user_id, account_ids in follower_index.iter_following()}
+    notifiable = await follower_index.get_notifiable()
+    generation = time.time_ns()
+
+    # A user's edges and notifiability stay in the same chunk, so every chunk restores on its own
+    chunks = []
+    chunk = {"following": {}, "notifiable": []}
+    chunk_bytes = 0
+    for user_id in sorted(following.keys() | notifiable):
+        account_ids = following.get(user_id, [])
+        # Rough uncompressed size; compression only makes the chunk smaller
+        entry_bytes = 11 * (len(account_ids) + 2) + 8
+        if chunk_bytes and chunk_bytes + entry_bytes > MAX_CHUNK_BYTES:
+            chunks.append(chunk)
+            chunk, chunk_bytes = {"following": {}, "notifiable": []}, 0
+        if account_ids:
+            chunk["following"][str(user_id)] = account_ids
+        if user_id in notifiable:
+            chunk["notifiable"].append(user_id)
+        chunk_bytes += entry_bytes
+    if chunk_bytes:
+        chunks.append(chunk)
+
+    snapshot_bytes = 0
+    for chunk_index, chunk in enumerate(chunks):
+        data = _encode(chunk)
+        snapshot_bytes += len(data)
+        await metadata_container.upsert_item(body={"id": _chunk_doc_id(generation, chunk_index), "data": data})
+
+    previous = await read_manifest(metadata_container)
+    manifest = {
+        "id": SNAPSHOT_MANIFEST_DOC_ID,
+        "format": SNAPSHOT_FORMAT,
+        "generation": generation,
+        "chunks": len(chunks),
+        "keys": len(following),
+        "members": sum(len(account_ids) for account_ids in following.values()),
+        "notifiable": len(notifiable),
+        "continuations": continuations,
+    }
+    await metadata_container.upsert_item(body=manifest)
+
+    if previous:
+        for chunk_index in range(previous["chunks"]):
+            doc_id = _chunk_doc_id(previous["generation"], chunk_index)
+            try:
+                await metadata_container.delete_item(item=doc_id, partition_key=doc_id)
+            except Exception as e:
+                logger.warning(f"Failed to delete chunk {chunk_index} of the previous follower snapshot: {e}")
+
+    logger.info(
+        "Wrote follower snapshot: %d users, %d edges, %d notifiable users, %d chunks, %d bytes in %.1fs",
+        manifest["keys"], manifest["members"], manifest["notifiable"], manifest["chunks"], snapshot_bytes, time.perf_counter() - started
+    )
+    return manifest
+
+
+async def read_manifest(metadata_container) -> dict | None:
+    try:
+        return await metadata_container.read_item(item=SNAPSHOT_MANIFEST_DOC_ID, partition_key=SNAPSHOT_MANIFEST_DOC_ID)
+    except Exception:
+        return None
+
+
+async def restore_snapshot(metadata_container, follower_index: FollowerIndex) -> dict[str, str] | None:
+    """
+    Load the latest follower snapshot into Redis.
+
+    Each chunk replaces the followed accounts of the users it contains, and
+    adds the followers edges of the notifiable ones, in one transaction.
+
+    Returns:
+        The feed continuations the snapshot corresponds to, or None if there is
+        no snapshot of the current format
+    """
+    manifest = await read_manifest(metadata_container)
+    if not manifest:
+        return None
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        logger.warning(f"Ignoring follower snapshot of format {manifest.get('format')}, expected {SNAPSHOT_FORMAT}")
+        return None
+
+    started = time.perf_counter()
+    for chunk_index in range(manifest["chunks"]):
+        doc_id = _chunk_doc_id(manifest["generation"], chunk_index)
+        chunk = _decode((await metadata_container.read_item(item=doc_id, partition_key=doc_id))["data"])
+        await follower_index.load(chunk["following"], chunk["notifiable"])
+
+    logger.info(
+        "Restored follower snapshot: %d users, %d edges in %.1fs",
+        manifest["keys"], manifest["members"], time.perf_counter() - started
+    )
+    return manifest["continuations"]
+
+
+async def try_restore_snapshot(metadata_container, follower_index: FollowerIndex) -> dict[str, str] | None:
+    """restore_snapshot that logs failures and returns None, so the caller falls back to a full replay."""
+    try:
+        return await restore_snapshot(metadata_container, follower_index)
+    except Exception as e:
+        logger.error(f"Failed to restore follower snapshot, replaying the whole change feed: {e}")
+        return None
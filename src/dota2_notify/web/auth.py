@@ -1,14 +1,17 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
+from starlette.background import BackgroundTask
 from urllib.parse import urlencode
 import re
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 
 from dota2_notify.app.config import Settings, get_settings
-from dota2_notify.clients.cosmosdb_client import CosmosDbUserService
-from dota2_notify.models.user import steam_id_to_account_id
+from dota2_notify.clients.user_store import UserStore
+from dota2_notify.clients.steam_client import SteamClient
+from dota2_notify.clients.steam_rate_limiter import SteamCallPriority
+from dota2_notify.models.user import Friend, steam_id_to_account_id
 from .dependencies import get_user_service
 
 steam_openid_url = "https://steamcommunity.com/openid/login"
@@ -34,7 +37,7 @@ async def login(request: Request):
     return RedirectResponse(url=redirect_url)
 
 @router.get("/steam/callback")
-async def steam_callback(request: Request, user_service: CosmosDbUserService = Depends(get_user_service), settings: Settings = Depends(get_settings)):
+async def steam_callback(request: Request, user_service: UserStore = Depends(get_user_service), settings: Settings = Depends(get_settings)):
     params = dict(request.query_params)
     
     # 1. Verification Step
@@ -46,6 +49,7 @@ async def steam_callback(request: Request, user_service: CosmosDbUserService = D
     steam_id = re.search(r"id/(\d+)$", claimed_id).group(1)
 
     # 3. Fetch user from database or create a new one
+    import_friends = False
     user = await user_service.get_user_with_steam_id_async(int(steam_id))
     if user is None:
         logging.info(f"No existing user found with Steam ID {steam_id}. Creating new user.")
@@ -53,8 +57,9 @@ async def steam_callback(request: Request, user_service: CosmosDbUserService = D
         player_summary = steam_player_summaries[0] if steam_player_summaries else None
         name = player_summary.personaname if player_summary else f"User{steam_id}"
         account_id = steam_id_to_account_id(int(steam_id))
-        token = await user_service.create_telegram_verify_token_async(account_id)
-        user = await user_service.create_user_async(account_id, name, token)
+        # The Telegram verification token is issued when the notifications page is first opened
+        user = await user_service.create_user_async(account_id, name, "")
+        import_friends = settings.friend_import_enabled
     else:
         logging.info(f"User with Steam ID {steam_id} already exists in database with user ID {user.user_id}.")
 
@@ -69,8 +74,36 @@ async def steam_callback(request: Request, user_service: CosmosDbUserService = D
         samesite="lax", 
         secure=False # Set to False only for local development
     )
+    if import_friends:
+        # Runs after the redirect is sent so the login itself does not wait for Steam and Cosmos DB
+        response.background = BackgroundTask(
+            import_friend_graph, request.app.state.steam_client, user_service, steam_id, settings.friend_import_max_request_charge
+        )
     return response
 
+async def import_friend_graph(steam_client: SteamClient, user_service: UserStore, steam_id: str, max_request_charge: float):
+    """Store the user's whole Steam friend list (not followed) so it does not have to be built one follow at a time."""
+    account_id = steam_id_to_account_id(int(steam_id))
+    try:
+        # Off the interactive Steam budget, the user is not waiting for it
+        friend_steam_ids = await steam_client.get_friend_list(steam_id, priority=SteamCallPriority.BACKGROUND)
+        # Cached, so the friends page shown right after login reuses the summaries
+        summaries = await steam_client.get_player_summaries(
+            steam_id, friend_steam_ids, cache=True, priority=SteamCallPriority.BACKGROUND
+        )
+        friends = [
+            Friend(
+                id=str(steam_id_to_account_id(int(summary.steamid))),
+                user_id=account_id,
+                name=summary.personaname,
+                following=False
+            )
+            for summary in summaries
+        ]
+        await user_service.import_friends_async(account_id, friends, max_request_charge=max_request_charge)
+    except Exception as ex:
+        logging.warning(f"Friend import for Steam ID {steam_id} failed: {ex}")
+
 @router.get("/logout")
 async def logout():
     response = RedirectResponse(url="/")
@@ -89,6 +122,9 @@ async def get_current_user(request: Request, settings: Settings = Depends(get_se
         steam_id: str = payload.get("sub")
         if steam_id is None:
            return None
+        cache_warmer = getattr(request.app.state, "steam_cache_warmer", None)
+        if cache_warmer is not None:
+            cache_warmer.touch(steam_id)
         return steam_id
     except JWTError:
         return None
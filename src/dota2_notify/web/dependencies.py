@@ -12,4 +12,10 @@ def get_user_service(request: Request):
     return request.app.state.user_service
 
 def get_steam_client(request: Request):
-    return request.app.state.steam_client
\ No newline at end of file
+    return request.app.state.steam_client
+
+def get_token_store(request: Request):
+    return request.app.state.telegram_token_store
+
+def get_follower_index(request: Request):
+    return request.app.state.follower_index
@@ -1,21 +1,49 @@
 import asyncio
+import logging
 from fastapi import APIRouter, HTTPException, Request, Depends, status as http_status
 from fastapi.responses import RedirectResponse
 
-from dota2_notify.clients.cosmosdb_client import CosmosDbUserService
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.clients.user_store import UserStore
 from dota2_notify.clients.steam_client import SteamClient
-from dota2_notify.models.user import Friend, steam_id_to_account_id
+from dota2_notify.clients.steam_rate_limiter import SteamBudgetExceededError
+from dota2_notify.models.user import Friend, User, steam_id_to_account_id
 from .auth import get_current_user
-from .dependencies import get_steam_client, get_user_service, template_obj
+from .dependencies import get_follower_index, get_steam_client, get_user_service, template_obj
 
 router = APIRouter()
 
+# The follow is already stored, a slow Redis only delays it until data-sync applies it
+FOLLOWER_INDEX_TIMEOUT_SECONDS = 0.5
+STEAM_BUSY_MESSAGE = "Steam is busy right now. Please try again in a minute."
+
+
+async def write_follower_index(follower_index: FollowerIndex, doc: User | Friend | None):
+    """Write the follow edge of a stored document through to the follower index, ahead of the change feed."""
+    if doc is None:
+        return
+    try:
+        await asyncio.wait_for(
+            follower_index.set_following(doc.user_id, int(doc.id), doc.following, doc.ts),
+            timeout=FOLLOWER_INDEX_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        logging.warning(f"Failed to update the follower index for {doc.user_id} -> {doc.id}, data-sync will apply it: {e}")
+
+
+def steam_busy_redirect(log_message: str) -> RedirectResponse:
+    """Send the user back to the friends page asking to retry, when the Steam API budget is exhausted."""
+    logging.warning(log_message)
+    response = RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
+    response.set_cookie(key="flash_message", value=STEAM_BUSY_MESSAGE)
+    return response
+
 
 @router.get("/")
 async def get_friends(
     request: Request,  
     steam_id: str = Depends(get_current_user), 
-    user_service: CosmosDbUserService = Depends(get_user_service),
+    user_service: UserStore = Depends(get_user_service),
     steam_client: SteamClient = Depends(get_steam_client)):
     
     user = None
@@ -23,20 +51,32 @@ async def get_friends(
     following = []
     not_following = []
     
+    flash_message = getattr(request.state, "flash_message", None)
+
     if steam_id is not None:
         account_id = steam_id_to_account_id(int(steam_id))
         
-        user, friends_steam_ids, db_friends, current_user_summary_list = await asyncio.gather(
+        # The stored follows are read alongside Steam, and are still needed if the Steam budget is exhausted
+        db_reads = asyncio.gather(
             user_service.get_user_with_steam_id_async(int(steam_id)),
-            steam_client.get_friend_list(steam_id),
-            user_service.get_friends_async(account_id),
-            steam_client.get_player_summaries(steam_id,[steam_id])
+            user_service.get_friends_async(account_id)
         )
-        
-        if current_user_summary_list:
-            current_user_summary = current_user_summary_list[0]
-        
-        player_summaries = await steam_client.get_player_summaries(steam_id, friends_steam_ids, cache=True) # Only cache friend list summaries, not the current user summary since it is needed for the friends page and may change frequently with the profile updates and the following/unfollowing actions
+        try:
+            friends_steam_ids, current_user_summary_list = await asyncio.gather(
+                steam_client.get_friend_list(steam_id),
+                steam_client.get_player_summaries(steam_id,[steam_id])
+            )
+            
+            if current_user_summary_list:
+                current_user_summary = current_user_summary_list[0]
+            
+            player_summaries = await steam_client.get_player_summaries(steam_id, friends_steam_ids, cache=True) # Only cache friend list summaries, not the current user summary since it is needed for the friends page and may change frequently with the profile updates and the following/unfollowing actions
+        except SteamBudgetExceededError as e:
+            # Render the page without the friends list rather than failing it, the budget refills within a minute
+            logging.warning(f"Friends list of {steam_id} not loaded: {e}")
+            flash_message = STEAM_BUSY_MESSAGE
+            player_summaries = []
+        user, db_friends = await db_reads
         
         # Map account_id -> following_status
         # db_friends.id is the account_id as string
@@ -61,8 +101,6 @@ async def get_friends(
     following.sort(key=lambda x: x.personaname)
     not_following.sort(key=lambda x: x.personaname)
 
-    flash_message = getattr(request.state, "flash_message", None)
-
     return template_obj.TemplateResponse(
         request, 
         "friends.html", 
@@ -80,69 +118,73 @@ async def get_friends(
 async def follow_friend(
     friend_steam_id: int, 
     steam_id: str = Depends(get_current_user), 
-    user_service: CosmosDbUserService = Depends(get_user_service), 
-    steam_client: SteamClient = Depends(get_steam_client)):
+    user_service: UserStore = Depends(get_user_service), 
+    steam_client: SteamClient = Depends(get_steam_client),
+    follower_index: FollowerIndex = Depends(get_follower_index)):
     
     if steam_id is None:
         return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
 
+    account_id = steam_id_to_account_id(int(steam_id))
+    friend_account_id = steam_id_to_account_id(friend_steam_id)
+
     if friend_steam_id == int(steam_id):
-        user = await user_service.get_user_with_steam_id_async(int(steam_id))
-        if user is not None:
-            user.following = True
-            await user_service.update_user_async(user)
+        user = await user_service.patch_user_async(account_id, {"following": True})
+        await write_follower_index(follower_index, user)
         return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
 
-    friend_summary = await steam_client.get_player_summaries(steam_id, [str(friend_steam_id)])
-    _, public_profile = await steam_client.get_match_history(str(friend_steam_id), matches_requested=1)
+    try:
+        friend_summary = await steam_client.get_player_summaries(steam_id, [str(friend_steam_id)])
+        _, public_profile = await steam_client.get_match_history(str(friend_steam_id), matches_requested=1)
+    except SteamBudgetExceededError as e:
+        return steam_busy_redirect(f"Follow of {friend_steam_id} by {steam_id} not checked: {e}")
 
     if not public_profile:
         response = RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
         response.set_cookie(key="flash_message", value="Profile is private and cannot be followed.")
         return response
     
-    friend = await user_service.get_friend_by_steam_id_async(int(steam_id), friend_steam_id)
+    fields = {"following": True}
+    if friend_summary:
+        fields["name"] = friend_summary[0].personaname # Update the name in case it changed on Steam
+
+    friend = await user_service.patch_friend_async(account_id, friend_account_id, fields)
     if friend is None:
-        friend_list = await steam_client.get_friend_list(int(steam_id))
-        friend_account_id = steam_id_to_account_id(friend_steam_id)
+        try:
+            friend_list = await steam_client.get_friend_list(int(steam_id))
+        except SteamBudgetExceededError as e:
+            return steam_busy_redirect(f"Follow of new friend {friend_steam_id} by {steam_id} not stored: {e}")
 
         if str(friend_steam_id) in friend_list: # it is a new friend that is not in the database yet, but is in the steam friend list
             friend = Friend(
                 id=str(friend_account_id),
-                user_id=steam_id_to_account_id(int(steam_id)),
+                user_id=account_id,
                 name=friend_summary[0].personaname if friend_summary else "Unknown",
                 following=True
             )
-        else: # not a friend at all
-            return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
-                
-    friend.following = True
-    friend.name = friend_summary[0].personaname if friend_summary else friend.name # Update the name in case it changed on Steam
-    
-    await user_service.update_friend_async(friend)
+            friend = await user_service.update_friend_async(friend)
+
+    await write_follower_index(follower_index, friend)
     return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
 
 @router.post("/unfollow/{friend_steam_id}")
 async def unfollow_friend(
     friend_steam_id: int, 
     steam_id: str = Depends(get_current_user), 
-    user_service: CosmosDbUserService = Depends(get_user_service)):
+    user_service: UserStore = Depends(get_user_service),
+    follower_index: FollowerIndex = Depends(get_follower_index)):
     
     if steam_id is None:
         return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
 
+    account_id = steam_id_to_account_id(int(steam_id))
+
     if friend_steam_id == int(steam_id):
-        user = await user_service.get_user_with_steam_id_async(int(steam_id))
-        if user is not None:
-            user.following = False
-            await user_service.update_user_async(user)
+        user = await user_service.patch_user_async(account_id, {"following": False})
+        await write_follower_index(follower_index, user)
         return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
 
-    friend = await user_service.get_friend_by_steam_id_async(int(steam_id), friend_steam_id)
-    if friend is None:
-        return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
-                
-    friend.following = False
-    
-    await user_service.update_friend_async(friend)
+    # A friend that is not in the database is not followed, so there is nothing to do when the patch finds nothing
+    friend = await user_service.patch_friend_async(account_id, steam_id_to_account_id(friend_steam_id), {"following": False})
+    await write_follower_index(follower_index, friend)
     return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
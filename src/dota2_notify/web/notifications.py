@@ -1,12 +1,15 @@
 from dota2_notify.app.config import Settings, get_settings
-from dota2_notify.clients.cosmosdb_client import CosmosDbUserService
-from .dependencies import get_user_service, template_obj
+from dota2_notify.clients.steam_rate_limiter import SteamBudgetExceededError
+from dota2_notify.clients.telegram_token_store import RedisTelegramTokenStore
+from dota2_notify.clients.user_store import UserStore
+from .dependencies import get_token_store, get_user_service, template_obj
 from fastapi import APIRouter, HTTPException, Request, Depends, status as http_status
 from .auth import get_current_user
 from dota2_notify.models.user import steam_id_to_account_id
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from typing import Optional
+import logging
 
 class TelegramUser(BaseModel):
     id: int
@@ -34,23 +37,27 @@ class TelegramUpdate(BaseModel):
 router = APIRouter(prefix="/notifications")
 
 @router.post("/reset")
-async def reset_telegram_connection(steam_id: str = Depends(get_current_user), user_service: CosmosDbUserService = Depends(get_user_service)):
+async def reset_telegram_connection(
+    steam_id: str = Depends(get_current_user),
+    user_service: UserStore = Depends(get_user_service),
+    token_store: RedisTelegramTokenStore = Depends(get_token_store)):
     if steam_id is None:
         return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
 
     account_id = steam_id_to_account_id(int(steam_id))
-    user = await user_service.get_user_async(account_id)
+    user = await user_service.patch_user_async(account_id, {"telegram_chat_id": ""})
 
     if user:
-        user.telegram_chat_id = ""
-        new_token = await user_service.create_telegram_verify_token_async(account_id)
-        user.telegram_verify_token = new_token
-        await user_service.update_user_async(user)
+        await token_store.create(account_id)
 
     return RedirectResponse(url="/notifications", status_code=http_status.HTTP_303_SEE_OTHER)
 
 @router.get("/")
-async def get_notifications(request: Request,  steam_id: str = Depends(get_current_user), user_service: CosmosDbUserService = Depends(get_user_service)):
+async def get_notifications(
+    request: Request,
+    steam_id: str = Depends(get_current_user),
+    user_service: UserStore = Depends(get_user_service),
+    token_store: RedisTelegramTokenStore = Depends(get_token_store)):
     if steam_id is None:
         return RedirectResponse(url="/", status_code=http_status.HTTP_303_SEE_OTHER)
     
@@ -59,17 +66,19 @@ async def get_notifications(request: Request,  steam_id: str = Depends(get_curre
     
     steam_client = request.app.state.steam_client
     current_user_summary = None
-    current_user_summary_list = await steam_client.get_player_summaries(steam_id, [steam_id])
+    try:
+        current_user_summary_list = await steam_client.get_player_summaries(steam_id, [steam_id])
+    except SteamBudgetExceededError as e:
+        # The summary is only the avatar in the header, the page works without it
+        logging.warning(f"Player summary of {steam_id} not loaded: {e}")
+        current_user_summary_list = []
     if current_user_summary_list:
         current_user_summary = current_user_summary_list[0]
 
     verified = user.is_telegram_verified
+    token = ""
     if not verified:
-        token = user.telegram_verify_token
-        if not bool(token.strip()) or not (await user_service.get_user_id_by_telegram_token_async(token) == account_id):
-            token = await user_service.create_telegram_verify_token_async(account_id)
-            user.telegram_verify_token = token
-            await user_service.update_user_async(user)
+        token = await token_store.get_or_create(account_id)
     
     flash_message = getattr(request.state, "flash_message", None)
 
@@ -81,12 +90,12 @@ async def get_notifications(request: Request,  steam_id: str = Depends(get_curre
             "user": user,
             "current_user_summary": current_user_summary,
             "verified": verified,
-            "token": user.telegram_verify_token,
+            "token": token,
             "flash_message": flash_message
         })
 
 @router.get("/is_telegram_connected")
-async def is_telegram_connected(request: Request, steam_id: str = Depends(get_current_user), user_service: CosmosDbUserService = Depends(get_user_service)):
+async def is_telegram_connected(request: Request, steam_id: str = Depends(get_current_user), user_service: UserStore = Depends(get_user_service)):
     if steam_id is None:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
@@ -97,7 +106,12 @@ async def is_telegram_connected(request: Request, steam_id: str = Depends(get_cu
 
 
 @router.post("/telegram-webhook/74ad1s_{secret}")
-async def telegram_webhook(secret: str, update: TelegramUpdate, user_service: CosmosDbUserService = Depends(get_user_service), settings: Settings = Depends(get_settings)):
+async def telegram_webhook(
+    secret: str,
+    update: TelegramUpdate,
+    user_service: UserStore = Depends(get_user_service),
+    token_store: RedisTelegramTokenStore = Depends(get_token_store),
+    settings: Settings = Depends(get_settings)):
     
     if secret != settings.telegram_bot_token:
         raise HTTPException(status_code=401, detail="Unauthorized")
@@ -106,14 +120,19 @@ async def telegram_webhook(secret: str, update: TelegramUpdate, user_service: Co
         parts = update.message.text.split()
         if len(parts) == 2:
             token = parts[1]
-            account_id = await user_service.get_user_id_by_telegram_token_async(token)
+            account_id = await token_store.consume(token)
+            legacy_token = False
+            if account_id is None:
+                # Tokens issued before they moved to Redis are still in the database until they expire
+                account_id = await user_service.get_user_id_by_telegram_token_async(token)
+                legacy_token = True
             if account_id:
-                user = await user_service.get_user_async(account_id)
-                if user:
-                    user.telegram_chat_id = str(update.message.chat.id)
-                    user.telegram_username = update.message.chat.username or ""
-                    user.telegram_verify_token = ""
-                    await user_service.update_user_async(user)
+                user = await user_service.patch_user_async(account_id, {
+                    "telegram_chat_id": str(update.message.chat.id),
+                    "telegram_username": update.message.chat.username or "",
+                    "telegram_verify_token": ""
+                })
+                if user and legacy_token:
                     await user_service.delete_telegram_verify_token_async(token)
     
     return {"status": "ok"}
\ No newline at end of file
@@ -0,0 +1,68 @@
+import json
+import pytest
+
+from dota2_notify.clients.cache_codec import CacheCodec, CompactCacheCodec, JsonCacheCodec
+
+
+def test_compact_codec_packs_steam_ids():
+    codec = CompactCacheCodec()
+    friend_ids = ["76561198098445678", "76561198153901234"]
+
+    data = codec.encode(friend_ids)
+
+    assert len(data) == 2 + 2 * 8
+    assert codec.decode(data) == friend_ids
+    assert codec.stats()["bytes_saved"] == len(json.dumps(friend_ids)) - len(data)
+
+
+def test_compact_codec_round_trips_json_values():
+    codec = CompactCacheCodec()
+    players = [{"steamid": "76561198098445678", "personaname": "Player1"}]
+
+    assert codec.decode(codec.encode(players)) == players
+    assert codec.decode(codec.encode([])) == []
+
+
+def test_compact_codec_counts_savings_against_plain_json():
+    codec = CompactCacheCodec()
+    players = [{"steamid": "76561198098445678", "personaname": "Player1"}]
+
+    data = codec.encode(players)
+
+    assert codec.stats()["bytes_in"] == len(JsonCacheCodec().encode(players))
+    assert codec.stats()["bytes_saved"] == len(json.dumps(players)) - len(data)
+
+
+def test_codec_must_implement_encode_and_decode():
+    class PartialCodec(CacheCodec):
+        def _encode(self, value):
+            return 0, b""
+
+    with pytest.raises(TypeError):
+        PartialCodec()
+
+
+def test_compact_codec_compresses_above_threshold():
+    codec = CompactCacheCodec(compression_threshold=100)
+    players = [{"steamid": str(76561198098445678 + i), "personaname": f"Player{i}"} for i in range(50)]
+
+    data = codec.encode(players)
+
+    assert len(data) < len(json.dumps(players, separators=(",", ":")))
+    assert codec.decode(data) == players
+    assert codec.stats()["compressed"] == 1
+
+
+def test_compact_codec_keeps_small_values_uncompressed():
+    codec = CompactCacheCodec(compression_threshold=1024)
+
+    codec.encode([{"personaname": "Player1"}])
+
+    assert codec.stats()["compressed"] == 0
+
+
+@pytest.mark.parametrize("legacy_value", [["76561198098445678"], [{"personaname": "Player1"}]])
+def test_compact_codec_reads_legacy_json_entries(legacy_value):
+    legacy_data = JsonCacheCodec().encode(legacy_value)
+
+    assert CompactCacheCodec().decode(legacy_data) == legacy_value
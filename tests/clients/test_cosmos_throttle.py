@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+from azure.cosmos import exceptions
+
+from dota2_notify.clients.cosmos_throttle import AdaptiveConcurrencyLimiter, ThrottledContainer
+from dota2_notify.clients.in_memory_cosmos import InMemoryContainer
+
+
+def throttled_error(retry_after_ms="10"):
+    error = exceptions.CosmosHttpResponseError(status_code=429, message="Request rate is large")
+    error.headers = {"x-ms-retry-after-ms": retry_after_ms} if retry_after_ms is not None else {}
+    return error
+
+
+@pytest.mark.asyncio
+async def test_successes_grow_limit_up_to_max():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=3)
+
+    async def operation():
+        return "ok"
+
+    for _ in range(20):
+        assert await limiter.run(operation) == "ok"
+
+    assert limiter.limit == 3
+    assert limiter.stats()["requests"] == 20
+
+
+@pytest.mark.asyncio
+async def test_throttled_request_is_retried_after_retry_after():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+    errors = [throttled_error("20")]
+
+    async def operation():
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    started = asyncio.get_running_loop().time()
+    assert await limiter.run(operation) == "ok"
+
+    assert asyncio.get_running_loop().time() - started >= 0.02
+    assert limiter.limit == 4
+    stats = limiter.stats()
+    assert stats["throttled"] == 1
+    assert stats["retries"] == 1
+    assert stats["retry_after_seconds"] == 0.02
+
+
+@pytest.mark.asyncio
+async def test_concurrent_429s_from_one_burst_shrink_limit_once():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+    attempts = {}
+
+    async def operation(index):
+        attempts[index] = attempts.get(index, 0) + 1
+        await asyncio.sleep(0)
+        if attempts[index] == 1:
+            raise throttled_error("10")
+        return index
+
+    results = await asyncio.gather(*(limiter.run(lambda i=i: operation(i)) for i in range(8)))
+
+    assert results == list(range(8))
+    assert limiter.stats()["throttled"] == 8
+    assert limiter.stats()["decreases"] == 1
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries_and_passes_other_errors_through():
+    limiter = AdaptiveConcurrencyLimiter(max_retries=2)
+
+    async def always_throttled():
+        raise throttled_error(None)
+
+    limiter.DEFAULT_RETRY_AFTER_SECONDS = 0.001
+    with pytest.raises(exceptions.CosmosHttpResponseError):
+        await limiter.run(always_throttled)
+    assert limiter.stats()["gave_up"] == 1
+    assert limiter.stats()["retries"] == 2
+
+    async def not_found():
+        raise exceptions.CosmosResourceNotFoundError(status_code=404, message="Not found")
+
+    with pytest.raises(exceptions.CosmosResourceNotFoundError):
+        await limiter.run(not_found)
+    assert limiter.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_in_flight_never_exceeds_limit():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2)
+    in_flight = 0
+    peak = 0
+
+    async def operation():
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+
+    await asyncio.gather(*(limiter.run(operation) for _ in range(10)))
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_throttled_container_retries_point_operations():
+    container = InMemoryContainer("users", throttle_probability=0.5, retry_after_ms=1, seed=7)
+    throttled = ThrottledContainer(container, AdaptiveConcurrencyLimiter(max_retries=20))
+
+    await asyncio.gather(*(throttled.upsert_item({"id": str(i)}) for i in range(20)))
+
+    assert container.stats["throttled"] > 0
+    # Queries bypass the limiter and would not be retried
+    container.throttle_probability = 0.0
+    assert len([item async for item in throttled.query_items("SELECT * FROM c")]) == 20
+
+
+@pytest.mark.asyncio
+async def test_throttled_container_retries_throttled_batches():
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    execute_item_batch = container.execute_item_batch
+    attempts = []
+
+    async def throttle_first_attempt(*args, **kwargs):
+        attempts.append(args)
+        if len(attempts) == 1:
+            raise exceptions.CosmosBatchOperationError(
+                error_index=0,
+                headers={"x-ms-retry-after-ms": "10"},
+                status_code=429,
+                message="Request rate is large",
+                operation_responses=[{"statusCode": 429}]
+            )
+        return await execute_item_batch(*args, **kwargs)
+
+    container.execute_item_batch = throttle_first_attempt
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+    throttled = ThrottledContainer(container, limiter)
+
+    await throttled.execute_item_batch([("upsert", ({"id": "1", "userId": 1},))], partition_key=1)
+
+    assert len(attempts) == 2
+    assert await container.read_item("1", partition_key=1)
+    assert limiter.limit == 4
+    assert limiter.stats()["retries"] == 1
@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import ANY, AsyncMock, MagicMock
 from dota2_notify.clients.cosmosdb_client import CosmosDbUserService
 from dota2_notify.models.user import User, Friend
 
@@ -38,7 +38,7 @@ async def test_get_user_async():
         assert user.following == False
         assert user.type == "user"
 
-        mock_container.read_item.assert_awaited_once_with(item="123", partition_key=123)
+        mock_container.read_item.assert_awaited_once_with(item="123", partition_key=123, response_hook=ANY)
 
 @pytest.mark.asyncio
 async def test_get_all_users_async():
@@ -155,11 +155,8 @@ async def test_get_friend_async():
         "type": "friend"
     }
 
-    async def mock_query_iterator(*args, **kwargs):
-        yield mock_friend_data
-
-    mock_container = MagicMock()
-    mock_container.query_items.side_effect = mock_query_iterator
+    mock_container = AsyncMock()
+    mock_container.read_item.return_value = mock_friend_data
     
     mock_client_instance = MagicMock()
     mock_database = mock_client_instance.get_database_client.return_value
@@ -181,7 +178,8 @@ async def test_get_friend_async():
         assert friend.following is True
         assert friend.type == "friend"
         
-        mock_container.query_items.assert_called_once()
+        mock_container.read_item.assert_awaited_once_with(item="1111263425", partition_key=123, response_hook=ANY)
+        mock_container.query_items.assert_not_called()
 
 @pytest.mark.asyncio
 async def test_create_user_async():
@@ -240,11 +238,8 @@ async def test_get_friend_by_steam_id_async():
         "type": "friend"
     }
 
-    async def mock_query_iterator(*args, **kwargs):
-        yield expected_friend_data
-
-    mock_container = MagicMock()
-    mock_container.query_items.side_effect = mock_query_iterator
+    mock_container = AsyncMock()
+    mock_container.read_item.return_value = expected_friend_data
     
     mock_client_instance = MagicMock()
     mock_database = mock_client_instance.get_database_client.return_value
@@ -263,16 +258,8 @@ async def test_get_friend_by_steam_id_async():
         assert friend.id == "456"
         assert friend.user_id == 123
 
-        mock_container.query_items.assert_called_once()
-        call_kwargs = mock_container.query_items.call_args[1]
-        parameters = call_kwargs['parameters']
-        
-        # Verify parameters contain the converted account IDs
-        user_id_param = next(p for p in parameters if p['name'] == '@userId')
-        friend_id_param = next(p for p in parameters if p['name'] == '@friendId')
-        
-        assert user_id_param['value'] == 123
-        assert friend_id_param['value'] == "456"
+        # Verify the point read uses the converted account IDs
+        mock_container.read_item.assert_awaited_once_with(item="456", partition_key=123, response_hook=ANY)
 
 @pytest.mark.asyncio
 async def test_update_friend_async():
@@ -298,9 +285,10 @@ async def test_update_friend_async():
         user_container_name="test-container",
         telegram_verify_token_container_name="test-telegram-container"
     ) as service:
-        await service.update_friend_async(friend)
+        stored = await service.update_friend_async(friend)
 
-        mock_container.upsert_item.assert_awaited_once_with(friend.model_dump(by_alias=True))
+        mock_container.upsert_item.assert_awaited_once_with(friend.model_dump(by_alias=True), response_hook=ANY)
+        assert stored == friend
 
 @pytest.mark.asyncio
 async def test_create_telegram_verify_token_async():
@@ -372,7 +360,7 @@ async def test_get_user_id_by_telegram_token_async_happy_path():
         user_id = await service.get_user_id_by_telegram_token_async(token)
 
         assert user_id == account_id
-        mock_telegram_container.read_item.assert_awaited_once_with(item=token, partition_key=token)
+        mock_telegram_container.read_item.assert_awaited_once_with(item=token, partition_key=token, response_hook=ANY)
 
 @pytest.mark.asyncio
 async def test_get_user_id_by_telegram_token_async_not_found():
@@ -407,7 +395,7 @@ async def test_get_user_id_by_telegram_token_async_not_found():
         user_id = await service.get_user_id_by_telegram_token_async(token)
 
         assert user_id is None
-        mock_telegram_container.read_item.assert_awaited_once_with(item=token, partition_key=token)
+        mock_telegram_container.read_item.assert_awaited_once_with(item=token, partition_key=token, response_hook=ANY)
 
 @pytest.mark.asyncio
 async def test_update_user_async_happy_path():
@@ -445,7 +433,7 @@ async def test_update_user_async_happy_path():
     ) as service:
         await service.update_user_async(user_to_update)
 
-        mock_user_container.upsert_item.assert_awaited_once_with(user_to_update.model_dump(by_alias=True))
+        mock_user_container.upsert_item.assert_awaited_once_with(user_to_update.model_dump(by_alias=True), response_hook=ANY)
 
 @pytest.mark.asyncio
 async def test_delete_telegram_verify_token_async_happy_path():
@@ -476,7 +464,7 @@ async def test_delete_telegram_verify_token_async_happy_path():
     ) as service:
         await service.delete_telegram_verify_token_async(token)
 
-        mock_telegram_container.delete_item.assert_awaited_once_with(item=token, partition_key=token)
+        mock_telegram_container.delete_item.assert_awaited_once_with(item=token, partition_key=token, response_hook=ANY)
 
 @pytest.mark.asyncio
 async def test_delete_telegram_verify_token_async_not_found():
@@ -509,4 +497,349 @@ async def test_delete_telegram_verify_token_async_not_found():
         # This should not raise an exception
         await service.delete_telegram_verify_token_async(token)
 
-        mock_telegram_container.delete_item.assert_awaited_once_with(item=token, partition_key=token)
+        mock_telegram_container.delete_item.assert_awaited_once_with(item=token, partition_key=token, response_hook=ANY)
+
+@pytest.mark.asyncio
+async def test_get_users_async_reads_each_user_once():
+    from azure.cosmos import exceptions
+
+    async def mock_read_item(item, partition_key, response_hook):
+        if item == "3":
+            raise exceptions.CosmosResourceNotFoundError(message="not found")
+        return {"id": item, "userId": partition_key, "name": f"User{item}", "type": "user"}
+
+    mock_container = AsyncMock()
+    mock_container.read_item.side_effect = mock_read_item
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container"
+    ) as service:
+        users = await service.get_users_async([1, 2, 1, 3])
+
+        assert sorted(users) == [1, 2]
+        assert users[2].name == "User2"
+        assert mock_container.read_item.await_count == 3
+
+@pytest.mark.asyncio
+async def test_get_friends_by_ids_async():
+    mock_friend_data = [
+        {"id": "1111263425", "userId": 123, "name": "Friend One", "following": True, "type": "friend"},
+        {"id": "2222263425", "userId": 123, "name": "Friend Two", "following": True, "type": "friend"}
+    ]
+
+    async def mock_query_iterator(*args, **kwargs):
+        for item in mock_friend_data:
+            yield item
+
+    mock_container = MagicMock()
+    mock_container.query_items.side_effect = mock_query_iterator
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container"
+    ) as service:
+        friends = await service.get_friends_by_ids_async(123, [1111263425, 2222263425])
+
+        assert friends[1111263425].name == "Friend One"
+        assert friends[2222263425].name == "Friend Two"
+        mock_container.query_items.assert_called_once()
+        call_kwargs = mock_container.query_items.call_args.kwargs
+        assert call_kwargs["partition_key"] == 123
+        assert {"name": "@friendIds", "value": ["1111263425", "2222263425"]} in call_kwargs["parameters"]
+
+@pytest.mark.asyncio
+async def test_get_friend_async_ignores_user_document():
+    mock_container = AsyncMock()
+    mock_container.read_item.return_value = {"id": "123", "userId": 123, "name": "TestUser", "type": "user"}
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container"
+    ) as service:
+        friend = await service.get_friend_async(account_id=123, followed_player_id=123)
+
+        assert friend is None
+
+@pytest.mark.asyncio
+async def test_request_stats_records_request_charge():
+    async def mock_read_item(item, partition_key, response_hook):
+        response_hook({"x-ms-request-charge": "1.0"}, None)
+        return {"id": item, "userId": partition_key, "name": "TestUser", "type": "user"}
+
+    mock_container = AsyncMock()
+    mock_container.read_item.side_effect = mock_read_item
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container"
+    ) as service:
+        await service.get_user_async(account_id=123)
+        await service.get_user_async(account_id=123)
+
+        stats = service.request_stats()["get_user_async"]
+        assert stats["calls"] == 2
+        assert stats["request_charge"] == 2.0
+        assert stats["avg_request_charge"] == 1.0
+
+@pytest.mark.asyncio
+async def test_get_user_async_served_from_cache():
+    mock_container = AsyncMock()
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    mock_user_cache = MagicMock()
+    mock_user_cache.get = AsyncMock(return_value={"id": "123", "userId": 123, "name": "TestUser", "type": "user", "_etag": "\"1\""})
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container",
+        user_cache=mock_user_cache
+    ) as service:
+        user = await service.get_user_async(account_id=123)
+
+        assert user.name == "TestUser"
+        assert user.etag == "\"1\""
+        mock_container.read_item.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_update_user_async_writes_through_to_cache():
+    updated_doc = {"id": "123", "userId": 123, "name": "TestUser", "type": "user", "_ts": 100, "_etag": "\"2\""}
+    mock_container = AsyncMock()
+    mock_container.upsert_item.return_value = updated_doc
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    mock_user_cache = MagicMock()
+    mock_user_cache.put = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container",
+        user_cache=mock_user_cache
+    ) as service:
+        await service.update_user_async(User(id="123", user_id=123, name="TestUser"))
+
+        mock_user_cache.put.assert_awaited_once_with(updated_doc)
+
+@pytest.mark.asyncio
+async def test_patch_user_async_sets_fields_with_etag_precondition():
+    from azure.core import MatchConditions
+
+    patched_doc = {"id": "123", "userId": 123, "name": "TestUser", "type": "user", "telegramChatId": "42", "_ts": 100, "_etag": "\"2\""}
+    mock_container = AsyncMock()
+    mock_container.patch_item.return_value = patched_doc
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    mock_user_cache = MagicMock()
+    mock_user_cache.put = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container",
+        user_cache=mock_user_cache
+    ) as service:
+        user = await service.patch_user_async(123, {"telegram_chat_id": "42"}, etag="\"1\"")
+
+        assert user.telegram_chat_id == "42"
+        mock_container.patch_item.assert_awaited_once_with(
+            item="123",
+            partition_key=123,
+            patch_operations=[{"op": "set", "path": "/telegramChatId", "value": "42"}],
+            response_hook=ANY,
+            etag="\"1\"",
+            match_condition=MatchConditions.IfNotModified
+        )
+        mock_user_cache.put.assert_awaited_once_with(patched_doc)
+
+@pytest.mark.asyncio
+async def test_patch_friend_async_not_found():
+    from azure.cosmos import exceptions
+
+    mock_container = AsyncMock()
+    mock_container.patch_item.side_effect = exceptions.CosmosResourceNotFoundError(message="Not found")
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container"
+    ) as service:
+        friend = await service.patch_friend_async(123, 456, {"following": True})
+
+        assert friend is None
+        mock_container.patch_item.assert_awaited_once_with(
+            item="456",
+            partition_key=123,
+            patch_operations=[{"op": "set", "path": "/following", "value": True}],
+            response_hook=ANY
+        )
+
+class _FakePager:
+    """Stands in for the SDK's page iterator: yields pages and exposes the continuation after each."""
+
+    def __init__(self, pages):
+        self._pages = list(pages)
+        self.continuation_token = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._pages:
+            raise StopAsyncIteration
+        items, self.continuation_token = self._pages.pop(0)
+
+        async def page():
+            for item in items:
+                yield item
+        return page()
+
+@pytest.mark.asyncio
+async def test_iter_users_async_yields_pages_with_continuation():
+    pager = _FakePager([
+        ([{"id": "1", "following": True}, {"id": "2", "following": False}], "token-1"),
+        ([{"id": "3", "following": True}], None),
+    ])
+    mock_container = MagicMock()
+    mock_container.query_items.return_value.by_page.return_value = pager
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container"
+    ) as service:
+        pages = [page async for page in service.iter_users_async(max_item_count=2, continuation="token-0", fields=["id", "following"])]
+
+        assert [[user.id for user in page.items] for page in pages] == [["1", "2"], ["3"]]
+        assert [page.continuation for page in pages] == ["token-1", None]
+        assert pages[0].items[1].following is False
+        mock_container.query_items.assert_called_once_with(
+            query="SELECT c.id, c.following FROM c WHERE c.type = 'user'",
+            parameters=[],
+            max_item_count=2,
+            response_hook=ANY
+        )
+        mock_container.query_items.return_value.by_page.assert_called_once_with("token-0")
+        assert service.request_stats()["iter_users_async"]["calls"] == 2
+
+@pytest.mark.asyncio
+async def test_iter_friends_async_queries_single_partition():
+    pager = _FakePager([([{"id": "456", "userId": 123, "following": True}], None)])
+    mock_container = MagicMock()
+    mock_container.query_items.return_value.by_page.return_value = pager
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container"
+    ) as service:
+        pages = [page async for page in service.iter_friends_async(123, following=True, fields=["id", "user_id"])]
+
+        assert pages[0].items == [Friend(id="456", user_id=123, following=True)]
+        mock_container.query_items.assert_called_once_with(
+            query="SELECT c.id, c.userId FROM c WHERE c.type = 'friend' AND c.userId = @userId AND c.following = @following",
+            parameters=[{"name": "@userId", "value": 123}, {"name": "@following", "value": True}],
+            max_item_count=CosmosDbUserService.DEFAULT_PAGE_SIZE,
+            response_hook=ANY,
+            partition_key=123
+        )
+
+@pytest.mark.asyncio
+async def test_import_friends_async_batches_per_partition_and_stops_at_budget():
+    def batch_response(batch_operations, partition_key, response_hook):
+        response_hook({"x-ms-request-charge": "600"}, None)
+        return [{"statusCode": 200} for _ in batch_operations]
+
+    async def stored_friends():
+        # Followed before the import got to it
+        yield {"id": "5"}
+
+    mock_container = AsyncMock()
+    mock_container.execute_item_batch.side_effect = batch_response
+    mock_container.query_items = MagicMock(side_effect=lambda **kwargs: stored_friends())
+
+    mock_client_instance = MagicMock()
+    mock_database = mock_client_instance.get_database_client.return_value
+    mock_database.get_container_client.return_value = mock_container
+    mock_client_instance.close = AsyncMock()
+
+    friends = [Friend(id=str(i), user_id=123, name=f"Friend{i}") for i in range(250)]
+
+    async with CosmosDbUserService(
+        cosmosdb_client=mock_client_instance,
+        database_name="test-db",
+        user_container_name="test-container",
+        telegram_verify_token_container_name="test-telegram-container"
+    ) as service:
+        written = await service.import_friends_async(123, friends, max_request_charge=1000)
+
+        # The second batch brings the total to 1200 RU, so the third one is not sent
+        assert written == 199
+        assert mock_container.execute_item_batch.await_count == 2
+        first_call = mock_container.execute_item_batch.await_args_list[0].kwargs
+        assert first_call["partition_key"] == 123
+        assert len(first_call["batch_operations"]) == CosmosDbUserService.MAX_BATCH_OPERATIONS - 1
+        assert first_call["batch_operations"][0] == ("create", (friends[0].model_dump(by_alias=True),))
+        assert ("create", (friends[5].model_dump(by_alias=True),)) not in first_call["batch_operations"]
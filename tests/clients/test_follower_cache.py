@@ -0,0 +1,195 @@
+import asyncio
+import math
+
+import pytest
+import redis.asyncio as redis
+
+from dota2_notify.clients.follower_cache import INVALIDATE_CHANNEL, CachedFollowerIndex
+from dota2_notify.clients.follower_index import FollowerIndex
+from tests.fake_redis import FakeRedis
+
+
+class FakeConnection:
+    """A pool connection of the fake tracking server, replying to commands from a queue."""
+
+    def __init__(self, server, client_id, protocol=None):
+        self._server = server
+        self.protocol = protocol
+        self.client_id = client_id
+        self.responses = asyncio.Queue()
+        self.connected = False
+
+    async def connect(self):
+        self.connected = True
+
+    async def send_command(self, *args):
+        self._server.commands.append(args)
+        if args == ("CLIENT", "ID"):
+            reply = self.client_id
+        elif args[0] == "SUBSCRIBE":
+            self._server.subscriber = self
+            reply = [b"subscribe", args[1].encode(), 1]
+        elif args[:3] == ("CLIENT", "TRACKING", "ON"):
+            self._server.prefix = args[-1]
+            reply = b"OK"
+        else:
+            reply = b"PONG"
+        self.responses.put_nowait(reply)
+
+    async def read_response(self, timeout=None):
+        try:
+            response = await asyncio.wait_for(self.responses.get(), None if timeout == math.inf else timeout)
+        except asyncio.TimeoutError:
+            return None
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def disconnect(self, nowait=False):
+        self.connected = False
+
+
+class FakeTrackingServer:
+    """Connection pool handing out fake connections, which broadcasts invalidations to the subscriber."""
+
+    def __init__(self):
+        self.commands = []
+        self.connections = []
+        self.subscriber = None
+        self.prefix = None
+        self.connection_kwargs = {"protocol": 3}
+
+    def connection_class(self, **kwargs):
+        self.connections.append(FakeConnection(self, len(self.connections) + 1, **kwargs))
+        return self.connections[-1]
+
+    def invalidate(self, *keys):
+        self.subscriber.responses.put_nowait([b"message", INVALIDATE_CHANNEL.encode(), list(keys) if keys else None])
+
+
+async def wait_for(condition, timeout=1.0):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+async def start_tracking(index):
+    # Set by data-sync; reads of an index that is not ready are not cached
+    await index.redis_client.set(index.sentinel_key, "1")
+    task = asyncio.create_task(index.run())
+    await wait_for(lambda: index.tracking)
+    return task
+
+
+def create_index(**kwargs):
+    redis_client = FakeRedis()
+    redis_client.connection_pool = FakeTrackingServer()
+    return CachedFollowerIndex(redis_client, **kwargs), redis_client
+
+
+@pytest.mark.asyncio
+async def test_tracked_followers_are_served_from_memory_until_invalidated():
+    index, redis_client = create_index()
+    await index.load({123: [456], 999: [789]}, [123, 999])
+    task = await start_tracking(index)
+    server = redis_client.connection_pool
+
+    assert ("CLIENT", "TRACKING", "ON", "REDIRECT", 1, "BCAST", "PREFIX", "followers:v3:followers:") in server.commands
+    assert [connection.protocol for connection in server.connections] == [2, 2]
+    assert await index.get_followers_many([456, 789]) == {456: {123}, 789: {999}}
+    await redis_client.sadd(index.followers_key(456), 999)
+    assert await index.get_followers_many([456, 789]) == {456: {123}, 789: {999}}
+
+    server.invalidate(index.followers_key(456).encode())
+    await wait_for(lambda: index.stats()["invalidations"] == 1)
+    assert await index.get_followers_many([456, 789]) == {456: {123, 999}, 789: {999}}
+
+    stats = index.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 3, 2)
+    assert stats["hit_rate"] == 0.5
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_read_overlapping_an_invalidation_is_not_cached(monkeypatch):
+    index, redis_client = create_index()
+    await index.load({123: [456]}, [123])
+    task = await start_tracking(index)
+    read = FollowerIndex.get_followers_many
+
+    async def read_then_write(self, account_ids):
+        followers = await read(self, account_ids)
+        # The followers set changed after Redis answered, the invalidation arrives before the reply is cached
+        await redis_client.sadd(index.followers_key(456), 999)
+        index.invalidate([index.followers_key(456).encode()])
+        return followers
+
+    monkeypatch.setattr(FollowerIndex, "get_followers_many", read_then_write)
+    assert await index.get_followers(456) == {123}
+    monkeypatch.undo()
+
+    assert await index.get_followers(456) == {123, 999}
+    assert index.stats()["misses"] == 2
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_flush_and_eviction_and_expiry_drop_entries():
+    index, redis_client = create_index(max_entries=2, max_age_seconds=0.05)
+    await index.load({123: [1, 2, 3]}, [123])
+    task = await start_tracking(index)
+
+    await index.get_followers_many([1, 2, 3])
+    assert index.stats()["entries"] == 2
+    redis_client.connection_pool.invalidate()
+    await wait_for(lambda: index.stats()["flushes"] == 1)
+    assert index.stats()["entries"] == 0
+
+    await index.get_followers_many([1])
+    await asyncio.sleep(0.06)
+    await index.get_followers_many([1])
+    assert index.stats()["hits"] == 0
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_lost_tracking_clears_and_bypasses_the_cache_until_set_up_again(monkeypatch):
+    monkeypatch.setattr(CachedFollowerIndex, "RETRY_SECONDS", 0.05)
+    index, redis_client = create_index()
+    await index.load({123: [456]}, [123])
+    task = await start_tracking(index)
+    server = redis_client.connection_pool
+
+    await index.get_followers(456)
+    server.subscriber.responses.put_nowait(redis.ConnectionError("Connection closed by server."))
+    await wait_for(lambda: not index.tracking)
+    assert index.stats()["entries"] == 0
+    assert not any(connection.connected for connection in server.connections)
+
+    await redis_client.sadd(index.followers_key(456), 999)
+    assert await index.get_followers(456) == {123, 999}
+    assert index.stats()["entries"] == 0
+
+    await wait_for(lambda: index.tracking)
+    assert index.stats()["resets"] == 1
+    assert len(server.connections) == 4
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_invalidation_against_local_redis(redis_client):
+    index = CachedFollowerIndex(redis_client)
+    writer = FollowerIndex(redis_client)
+    await writer.load({123: [456]}, [123, 999])
+    task = await start_tracking(index)
+
+    try:
+        assert await index.get_followers(456) == {123}
+        assert await index.get_followers(456) == {123}
+        await writer.set_following(999, 456, True, 100)
+        await wait_for(lambda: index.stats()["invalidations"] >= 1)
+
+        assert await index.get_followers(456) == {123, 999}
+        assert index.stats()["hits"] == 1
+    finally:
+        task.cancel()
@@ -0,0 +1,138 @@
+import pytest
+
+from dota2_notify.clients.follower_index import FollowerIndex
+from tests.fake_redis import FakeRedis
+
+
+@pytest.mark.asyncio
+async def test_only_notifiable_users_are_followers(redis_client):
+    index = FollowerIndex(redis_client)
+
+    pipe = redis_client.pipeline()
+    await index.apply(pipe, {"id": "123", "userId": 123, "type": "user", "following": True, "telegramChatId": "42"})
+    await index.apply(pipe, {"id": "456", "userId": 123, "type": "friend", "following": True})
+    await index.apply(pipe, {"id": "456", "userId": 999, "type": "friend", "following": True})
+    await index.apply(pipe, {"id": "789", "userId": 123, "type": "friend", "following": True})
+    await index.apply(pipe, {"id": "789", "userId": 123, "type": "friend", "following": False})
+    await pipe.execute()
+
+    assert await index.get_followers_many([123, 456, 789]) == {123: {123}, 456: {123}, 789: set()}
+    assert await index.get_following(999) == {456}
+    assert await index.get_notifiable() == {123}
+    assert {key.decode() async for key in redis_client.scan_iter(_type="SET")} == {
+        "followers:v3:notifiable", "followers:v3:followers:123", "followers:v3:followers:456",
+        "followers:v3:following:123", "followers:v3:following:999",
+    }
+
+
+@pytest.mark.asyncio
+async def test_older_versions_of_an_edge_are_ignored(redis_client):
+    index = FollowerIndex(redis_client)
+    await index.load({}, [123])
+
+    # The web app wrote the unfollow before data-sync got to the follow
+    assert await index.set_following(123, 456, False, 200) == 0
+    assert await index.set_following(123, 456, True, 100) == -1
+    assert await index.get_followers(456) == set()
+
+    # Same second as the last write: applied, the change feed settles the race
+    assert await index.set_following(123, 456, True, 200) == 1
+    assert await index.get_followers(456) == {123}
+    assert await index.get_following(123) == {456}
+
+
+@pytest.mark.asyncio
+async def test_only_old_versions_of_removed_edges_are_pruned(redis_client):
+    index = FollowerIndex(redis_client)
+    await index.set_following(123, 456, True, 100)
+    await index.set_following(123, 789, False, 100)
+    await index.set_following(123, 555, False, 300)
+    await index.set_following(999, 456, False, 100)
+
+    assert await index.prune_versions(200) == 2
+
+    assert await redis_client.hgetall(index.versions_key(123)) == {b"456": b"100", b"555": b"300"}
+    assert not await redis_client.exists(index.versions_key(999))
+    # The pruned edge is written again by whichever version comes
+    assert await index.set_following(123, 789, True, 50) == 1
+
+
+@pytest.mark.asyncio
+async def test_connecting_telegram_admits_existing_edges_and_disconnecting_removes_them(redis_client):
+    index = FollowerIndex(redis_client)
+    await index.set_following(999, 456, True, 100)
+    await index.set_following(999, 789, True, 100)
+    assert await index.get_followers_many([456, 789]) == {456: set(), 789: set()}
+
+    pipe = redis_client.pipeline()
+    await index.apply(pipe, {"id": "999", "userId": 999, "type": "user", "following": True, "telegramChatId": "42"})
+    await pipe.execute()
+    assert await index.get_followers_many([456, 789, 999]) == {456: {999}, 789: {999}, 999: {999}}
+
+    pipe = redis_client.pipeline()
+    await index.apply(pipe, {"id": "999", "userId": 999, "type": "user", "following": True, "telegramChatId": " "})
+    await pipe.execute()
+    assert await index.get_followers_many([456, 789, 999]) == {456: set(), 789: set(), 999: set()}
+    assert await index.get_following(999) == {456, 789, 999}
+
+
+@pytest.mark.asyncio
+async def test_readers_use_the_previous_layout_until_this_one_is_ready(redis_client):
+    await redis_client.sadd("followers:v2:followers:456", 123, 999)
+    await redis_client.set("followers:v2:ready", "1")
+    index = FollowerIndex(redis_client)
+    # data-sync is still replaying the change feed into the new layout
+    await index.set_following(123, 456, True, 100)
+
+    assert await index.get_followers(456) == {123, 999}
+    assert not index.ready
+
+    await redis_client.set(index.sentinel_key, "1")
+    assert await index.get_followers(456) == set()
+    assert index.ready
+
+
+@pytest.mark.asyncio
+async def test_readers_fall_back_to_the_unversioned_index():
+    redis_client = FakeRedis({"456": [123]})
+    await redis_client.set(FollowerIndex.LEGACY_SENTINEL_KEY, "1")
+
+    assert await FollowerIndex(redis_client).get_followers_many([456, 789]) == {456: {123}, 789: set()}
+
+
+@pytest.mark.asyncio
+async def test_drop_previous_layouts_removes_older_versions_and_legacy_keys():
+    redis_client = FakeRedis({"456": [123, 999], "user:123": [1], "followers:v2:followers:456": [123]})
+    await redis_client.set(FollowerIndex.LEGACY_SENTINEL_KEY, "1")
+    await redis_client.set("followers:v2:ready", "1")
+    index = FollowerIndex(redis_client)
+    await index.load({123: [456]}, [123])
+
+    assert await index.drop_previous_layouts() == 4
+
+    assert set(redis_client.sets) == {
+        "user:123", "followers:v3:notifiable", "followers:v3:following:123", "followers:v3:followers:456",
+    }
+    assert redis_client.strings == {}
+
+
+@pytest.mark.asyncio
+async def test_memory_report_counts_each_edge_once():
+    redis_client = FakeRedis()
+    index = FollowerIndex(redis_client)
+    await index.load({123: [456, 789], 999: [456]}, [123])
+    await redis_client.hset(index.versions_key(123), mapping={456: 100, 789: 100, 555: 90})
+
+    report = await index.memory_report()
+
+    assert report["keys"] == 6
+    assert report["edges"] == 3
+    assert report["notifiable_edges"] == 2
+    assert report["notifiable_users"] == 1
+    assert report["versions"] == 3
+    assert report["encodings"] == {"intset": 5, "listpack": 1}
+    assert report["estimated_bytes"] == 5 * 48 + 6 * 4 + 64 + 3 * 16
+    assert report["bytes_per_million_edges"] == report["estimated_bytes"] * 1_000_000 // 3
+
+    assert await index.drop() == 6
+    assert redis_client.sets == {}
@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+import httpx
+
+from dota2_notify.clients.hedged_requester import HedgedRequester
+
+
+def create_requester(handler, deadline=1.0):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return HedgedRequester(client, {"GetFriendList": deadline}), client
+
+
+def warm_up(requester, endpoint, seconds):
+    requester._endpoint_stats(endpoint)
+    for _ in range(20):
+        requester._latencies[endpoint].record(seconds)
+
+
+@pytest.mark.asyncio
+async def test_get_without_latency_history_sends_single_request():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"ok": True})
+
+    requester, client = create_requester(handler)
+    async with client:
+        response = await requester.get("GetFriendList", "https://api.steampowered.com/ISteamUser/GetFriendList/v1/")
+
+    assert response.json() == {"ok": True}
+    assert len(calls) == 1
+    assert requester.stats()["GetFriendList"]["hedged"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_get_is_hedged_and_hedge_wins():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"attempt": len(calls)})
+
+    requester, client = create_requester(handler)
+    warm_up(requester, "GetFriendList", 0.05)
+    async with client:
+        response = await requester.get("GetFriendList", "https://api.steampowered.com/ISteamUser/GetFriendList/v1/")
+
+    assert response.json() == {"attempt": 2}
+    stats = requester.stats()["GetFriendList"]
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+    assert stats["hedge_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_hedge_is_skipped_when_its_request_is_not_granted():
+    calls = []
+    asked = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"attempt": len(calls)})
+
+    async def acquire_hedge():
+        asked.append(True)
+        return False
+
+    requester, client = create_requester(handler)
+    warm_up(requester, "GetFriendList", 0.05)
+    async with client:
+        response = await requester.get(
+            "GetFriendList", "https://api.steampowered.com/ISteamUser/GetFriendList/v1/", acquire_hedge=acquire_hedge
+        )
+
+    assert response.json() == {"attempt": 1}
+    assert len(calls) == 1
+    assert asked == [True]
+    stats = requester.stats()["GetFriendList"]
+    assert (stats["hedged"], stats["hedges_skipped"]) == (0, 1)
+
+
+@pytest.mark.asyncio
+async def test_post_is_never_hedged():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={})
+
+    requester, client = create_requester(handler)
+    warm_up(requester, "sendMessage", 0.01)
+    async with client:
+        await requester.post("sendMessage", "https://api.telegram.org/botTOKEN/sendMessage")
+
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_deadline_exceeded_raises_timeout():
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={})
+
+    requester, client = create_requester(handler, deadline=0.1)
+    async with client:
+        with pytest.raises(httpx.TimeoutException):
+            await requester.get("GetFriendList", "https://api.steampowered.com/ISteamUser/GetFriendList/v1/")
+
+    assert requester.stats()["GetFriendList"]["deadline_exceeded"] == 1
@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+import httpx
+
+from dota2_notify.clients.http_pools import InstrumentedTransport, UpstreamPools
+
+
+@pytest.mark.asyncio
+async def test_pools_use_separate_clients_per_upstream():
+    limits = {
+        UpstreamPools.STEAM_API: httpx.Limits(max_connections=20),
+        UpstreamPools.TELEGRAM: httpx.Limits(max_connections=5),
+    }
+    async with UpstreamPools(limits) as pools:
+        assert pools[UpstreamPools.STEAM_API] is not pools[UpstreamPools.TELEGRAM]
+        stats = pools.stats()
+
+    assert stats[UpstreamPools.STEAM_API]["max_connections"] == 20
+    assert stats[UpstreamPools.TELEGRAM]["max_connections"] == 5
+
+
+@pytest.mark.asyncio
+async def test_transport_counts_saturated_requests(httpx_mock):
+    async def slow_response(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    httpx_mock.add_callback(slow_response, is_reusable=True)
+    transport = InstrumentedTransport(limits=httpx.Limits(max_connections=1))
+
+    async with httpx.AsyncClient(transport=transport) as client:
+        await asyncio.gather(*(client.get("https://api.steampowered.com/") for _ in range(3)))
+
+    stats = transport.stats()
+    assert stats["requests"] == 3
+    assert stats["peak_in_flight"] == 3
+    assert stats["saturated_requests"] == 2
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_prewarm_ignores_unreachable_upstreams(httpx_mock):
+    httpx_mock.add_exception(httpx.ConnectError("unreachable"))
+
+    async with UpstreamPools({UpstreamPools.STEAM_API: httpx.Limits(max_connections=1)}) as pools:
+        await pools.prewarm()
+
+    assert httpx_mock.get_requests()[0].method == "HEAD"
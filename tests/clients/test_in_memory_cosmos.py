@@ -0,0 +1,157 @@
+import pytest
+import pytest_asyncio
+from azure.cosmos import exceptions
+
+from dota2_notify.clients.cosmosdb_client import CosmosDbUserService
+from dota2_notify.clients.in_memory_cosmos import InMemoryContainer, InMemoryCosmosClient
+from dota2_notify.clients.user_store import PreconditionFailedError
+from dota2_notify.models.user import Friend
+
+
+@pytest_asyncio.fixture
+async def service():
+    client = InMemoryCosmosClient(partition_key_paths={"users": "/userId"})
+    async with CosmosDbUserService(
+        cosmosdb_client=client,
+        database_name="test-db",
+        user_container_name="users",
+        telegram_verify_token_container_name="tokens"
+    ) as service:
+        yield service
+
+
+@pytest.mark.asyncio
+async def test_user_service_round_trip(service):
+    await service.create_user_async(123, "TestUser", "ABCDEF")
+    await service.update_friend_async(Friend(id="456", user_id=123, name="Friend", following=True))
+    await service.update_friend_async(Friend(id="789", user_id=123, name="Other", following=False))
+
+    user = await service.get_user_async(123)
+    assert user.name == "TestUser"
+    assert user.etag
+    assert [friend.id for friend in await service.get_friends_async(123, following=True)] == ["456"]
+    assert set(await service.get_friends_by_ids_async(123, [456, 789, 111])) == {456, 789}
+    assert await service.get_friend_async(123, 123) is None
+    assert [user.id for user in await service.get_all_users_async()] == ["123"]
+    assert service.request_stats()["get_user_async"]["request_charge"] > 0
+
+
+@pytest.mark.asyncio
+async def test_patch_with_stale_etag_fails(service):
+    await service.create_user_async(123, "TestUser", "ABCDEF")
+    user = await service.get_user_async(123)
+
+    patched = await service.patch_user_async(123, {"telegram_chat_id": "42"}, etag=user.etag)
+
+    assert patched.telegram_chat_id == "42"
+    with pytest.raises(PreconditionFailedError):
+        await service.patch_user_async(123, {"telegram_chat_id": ""}, etag=user.etag)
+
+
+@pytest.mark.asyncio
+async def test_iter_users_pages_and_projects(service):
+    for account_id in range(1, 6):
+        await service.create_user_async(account_id, f"User{account_id}", "ABCDEF")
+
+    pages = [page async for page in service.iter_users_async(max_item_count=2, fields=["id", "following"])]
+
+    assert [len(page.items) for page in pages] == [2, 2, 1]
+    assert pages[-1].continuation is None
+    assert pages[0].items[0].name == ""
+
+
+@pytest.mark.asyncio
+async def test_import_friends_is_transactional_per_batch(service):
+    written = await service.import_friends_async(123, [Friend(id=str(i), user_id=123) for i in range(150)])
+
+    assert written == 150
+    assert len(await service.get_friends_async(123)) == 150
+    with pytest.raises(exceptions.CosmosBatchOperationError):
+        # A friend of another user cannot be part of this partition's batch
+        await service.import_friends_async(123, [Friend(id="1000", user_id=123), Friend(id="1001", user_id=999)])
+    assert await service.get_friend_async(123, 1000) is None
+
+
+@pytest.mark.asyncio
+async def test_import_keeps_friends_followed_while_it_runs(service):
+    container = service._user_container
+    execute_item_batch = container.execute_item_batch
+    follows = []
+
+    async def follow_then_execute(**kwargs):
+        # The user followed friend 3 between the import's read and its batch
+        if not follows:
+            follows.append(await service.update_friend_async(Friend(id="3", user_id=123, name="Friend", following=True)))
+        return await execute_item_batch(**kwargs)
+
+    await service.update_friend_async(Friend(id="1", user_id=123, name="Friend", following=True))
+    container.execute_item_batch = follow_then_execute
+
+    written = await service.import_friends_async(123, [Friend(id=str(i), user_id=123) for i in range(5)])
+
+    assert written == 3
+    assert [friend.id for friend in await service.get_friends_async(123, following=True)] == ["1", "3"]
+    assert len(await service.get_friends_async(123)) == 5
+
+
+@pytest.mark.asyncio
+async def test_change_feed_resumes_from_continuation():
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    await container.upsert_item({"id": "1", "userId": 1, "following": True})
+    await container.upsert_item({"id": "2", "userId": 2, "following": True})
+
+    hook_etags = []
+    pages = container.query_items_change_feed(start_time="Beginning", response_hook=lambda headers, body: hook_etags.append((headers["etag"], headers)))
+    docs = [doc async for doc in pages]
+    continuation = container.client_connection.last_response_headers["etag"]
+    assert [doc["id"] for doc in docs] == ["1", "2"]
+    # Like the SDK: the hook gets the raw LSN etag, its headers are updated to the continuation after
+    assert hook_etags[0][0] == '"2"'
+    assert hook_etags[0][1]["etag"] == continuation
+
+    await container.upsert_item({"id": "1", "userId": 1, "following": False})
+    docs = [doc async for doc in container.query_items_change_feed(continuation=continuation)]
+    assert [(doc["id"], doc["following"]) for doc in docs] == [("1", False)]
+
+
+@pytest.mark.asyncio
+async def test_feed_ranges_cover_every_partition_once():
+    container = InMemoryContainer("users", partition_key_path="/userId", feed_range_count=4)
+    for account_id in range(20):
+        await container.upsert_item({"id": str(account_id), "userId": account_id})
+
+    seen = []
+    async for feed_range in container.read_feed_ranges():
+        seen += [doc["id"] async for doc in container.query_items_change_feed(feed_range=feed_range, start_time="Beginning")]
+
+    assert sorted(seen, key=int) == [str(account_id) for account_id in range(20)]
+
+
+@pytest.mark.asyncio
+async def test_group_by_query_aggregates_expressions():
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    for user_id, account_id in [(1, "5"), (257, "7"), (2, "9")]:
+        await container.upsert_item({"id": account_id, "userId": user_id, "following": True})
+    await container.upsert_item({"id": "11", "userId": 1, "following": False})
+
+    query = (
+        "SELECT c.userId % 256 AS bucket, COUNT(1) AS edges, SUM(StringToNumber(c.id) * 2 + 1) AS total "
+        "FROM c WHERE c.following = true GROUP BY c.userId % 256"
+    )
+    rows = [row async for row in container.query_items(query=query)]
+
+    assert sorted(rows, key=lambda row: row["bucket"]) == [{"bucket": 1, "edges": 2, "total": 26}, {"bucket": 2, "edges": 1, "total": 19}]
+    query = "SELECT c.id FROM c WHERE ARRAY_CONTAINS(@buckets, c.userId % 256)"
+    assert [doc async for doc in container.query_items(query=query, parameters=[{"name": "@buckets", "value": [2]}])] == [{"id": "9"}]
+
+
+@pytest.mark.asyncio
+async def test_injected_throttling_raises_429_with_retry_after():
+    container = InMemoryContainer("users", throttle_probability=1.0, retry_after_ms=250)
+
+    with pytest.raises(exceptions.CosmosHttpResponseError) as error:
+        await container.read_item(item="1", partition_key="1")
+
+    assert error.value.status_code == 429
+    assert error.value.headers["x-ms-retry-after-ms"] == "250"
+    assert container.stats["throttled"] == 1
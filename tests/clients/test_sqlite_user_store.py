@@ -0,0 +1,120 @@
+import pytest
+import pytest_asyncio
+
+from dota2_notify.clients.sqlite_user_store import SqliteUserStore
+from dota2_notify.clients.user_store import PreconditionFailedError
+from dota2_notify.models.user import Friend
+
+
+@pytest_asyncio.fixture
+async def store(tmp_path):
+    async with SqliteUserStore(str(tmp_path / "users.db")) as store:
+        yield store
+
+
+@pytest.mark.asyncio
+async def test_create_and_get_user(store):
+    created = await store.create_user_async(123, "TestUser", "ABCDEF")
+
+    user = await store.get_user_async(123)
+
+    assert user.name == "TestUser"
+    assert user.following is True
+    assert user.telegram_verify_token == "ABCDEF"
+    assert user.etag
+    # Creating an existing user returns the stored one
+    assert (await store.create_user_async(123, "Other", "XYZ")).name == created.name
+    assert await store.get_user_async(456) is None
+    assert await store.get_users_async([123, 456]) == {123: user}
+
+
+@pytest.mark.asyncio
+async def test_friends_are_scoped_to_their_user(store):
+    await store.create_user_async(123, "TestUser", "ABCDEF")
+    await store.update_friend_async(Friend(id="456", user_id=123, name="Friend", following=True))
+    await store.update_friend_async(Friend(id="789", user_id=123, name="Other", following=False))
+    await store.update_friend_async(Friend(id="456", user_id=999, name="Friend", following=False))
+
+    assert [friend.id for friend in await store.get_friends_async(123)] == ["456", "789"]
+    assert [friend.id for friend in await store.get_friends_async(123, following=True)] == ["456"]
+    assert (await store.get_friend_async(123, 456)).following is True
+    # The user document shares the partition but is not a friend
+    assert await store.get_friend_async(123, 123) is None
+    assert set(await store.get_friends_by_ids_async(123, [456, 789, 111])) == {456, 789}
+
+
+@pytest.mark.asyncio
+async def test_import_leaves_stored_friends_alone(store):
+    await store.update_friend_async(Friend(id="456", user_id=123, name="Friend", following=True))
+
+    written = await store.import_friends_async(123, [Friend(id="456", user_id=123), Friend(id="789", user_id=123)])
+
+    assert written == 1
+    assert (await store.get_friend_async(123, 456)).following
+
+
+@pytest.mark.asyncio
+async def test_patch_user_checks_etag(store):
+    await store.create_user_async(123, "TestUser", "ABCDEF")
+    user = await store.get_user_async(123)
+
+    patched = await store.patch_user_async(123, {"telegram_chat_id": "42"}, etag=user.etag)
+
+    assert patched.telegram_chat_id == "42"
+    assert patched.name == "TestUser"
+    assert patched.etag != user.etag
+    with pytest.raises(PreconditionFailedError):
+        await store.patch_user_async(123, {"telegram_chat_id": ""}, etag=user.etag)
+    assert await store.patch_user_async(456, {"following": False}) is None
+
+
+@pytest.mark.asyncio
+async def test_iter_users_pages_with_continuation_and_projection(store):
+    for account_id in range(1, 6):
+        await store.create_user_async(account_id, f"User{account_id}", "ABCDEF")
+
+    pages = [page async for page in store.iter_users_async(max_item_count=2, fields=["id", "following"])]
+
+    assert [[user.id for user in page.items] for page in pages] == [["1", "2"], ["3", "4"], ["5"]]
+    assert pages[-1].continuation is None
+    # Fields that are not projected keep their defaults
+    assert pages[0].items[0].name == ""
+
+    resumed = [page async for page in store.iter_users_async(max_item_count=2, continuation=pages[0].continuation)]
+    assert [user.id for page in resumed for user in page.items] == ["3", "4", "5"]
+
+
+@pytest.mark.asyncio
+async def test_change_log_returns_writes_in_order(store):
+    await store.create_user_async(123, "TestUser", "ABCDEF")
+    await store.update_friend_async(Friend(id="456", user_id=123, following=True))
+
+    docs, position = await store.read_change_log_async()
+    assert [(doc["type"], doc["id"]) for doc in docs] == [("user", "123"), ("friend", "456")]
+
+    await store.patch_user_async(123, {"following": False})
+    docs, next_position = await store.read_change_log_async(position)
+    assert [(doc["id"], doc["following"]) for doc in docs] == [("123", False)]
+    assert await store.read_change_log_async(next_position) == ([], next_position)
+
+
+@pytest.mark.asyncio
+async def test_telegram_verify_tokens(store):
+    token = await store.create_telegram_verify_token_async(123)
+
+    assert await store.get_user_id_by_telegram_token_async(token) == 123
+    await store.delete_telegram_verify_token_async(token)
+    assert await store.get_user_id_by_telegram_token_async(token) is None
+
+
+@pytest.mark.asyncio
+async def test_metadata_container(store):
+    with pytest.raises(KeyError):
+        await store.metadata_container.read_item(item="seq", partition_key="seq")
+
+    await store.metadata_container.upsert_item(body={"id": "seq", "value": 42})
+    assert (await store.metadata_container.read_item(item="seq", partition_key="seq"))["value"] == 42
+
+    await store.metadata_container.delete_item(item="seq", partition_key="seq")
+    with pytest.raises(KeyError):
+        await store.metadata_container.read_item(item="seq", partition_key="seq")
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from dota2_notify.clients import steam_cache_warmer
+from dota2_notify.clients.steam_cache_warmer import SteamCacheWarmer
+from dota2_notify.clients.steam_rate_limiter import SteamBudgetExceededError, SteamCallPriority
+
+
+def create_steam_client(ttls):
+    """Steam client whose cache keys have the given TTLs, keys not listed are missing (-2)."""
+    keys = []
+    mock_pipeline = MagicMock()
+    mock_pipeline.ttl = MagicMock(side_effect=keys.append)
+    mock_pipeline.execute = AsyncMock(side_effect=lambda: [ttls.get(key, -2) for key in keys])
+    mock_steam_client = MagicMock()
+    mock_steam_client.redis_client.pipeline = MagicMock(return_value=mock_pipeline)
+    mock_steam_client.get_friend_list = AsyncMock(return_value=["76561198098445678"])
+    mock_steam_client.get_player_summaries = AsyncMock(return_value=[])
+    return mock_steam_client
+
+
+@pytest.mark.asyncio
+async def test_refresh_cycle_refreshes_only_expiring_users():
+    # 76561198012345678: summaries about to expire. 76561198087654321: both entries fresh.
+    mock_steam_client = create_steam_client({
+        "steam:friend_list:76561198012345678": 3000,
+        "steam:player_summaries:76561198012345678": 120,
+        "steam:friend_list:76561198087654321": 3000,
+        "steam:player_summaries:76561198087654321": 3000,
+    })
+    warmer = SteamCacheWarmer(mock_steam_client, refresh_ahead_seconds=300)
+    warmer.touch("76561198012345678")
+    warmer.touch("76561198087654321")
+
+    await warmer.refresh_cycle()
+
+    mock_steam_client.get_friend_list.assert_awaited_once_with(
+        "76561198012345678", refresh=True, priority=SteamCallPriority.BACKGROUND
+    )
+    mock_steam_client.get_player_summaries.assert_awaited_once_with(
+        "76561198012345678", ["76561198098445678"], cache=True, refresh=True, priority=SteamCallPriority.BACKGROUND
+    )
+    assert warmer.stats()["refreshed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_cycle_stops_when_budget_exhausted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(steam_cache_warmer, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    mock_steam_client = create_steam_client({})
+    mock_steam_client.get_friend_list = AsyncMock(side_effect=SteamBudgetExceededError(SteamCallPriority.BACKGROUND))
+    warmer = SteamCacheWarmer(mock_steam_client)
+    warmer.touch("76561198012345678")
+    now[0] += 1
+    warmer.touch("76561198087654321")
+
+    await warmer.refresh_cycle()
+
+    # Only the most recently active user was tried before the budget ran out
+    mock_steam_client.get_friend_list.assert_awaited_once_with(
+        "76561198087654321", refresh=True, priority=SteamCallPriority.BACKGROUND
+    )
+    assert warmer.stats()["budget_exhausted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_cycle_forgets_inactive_users(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(steam_cache_warmer, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    mock_steam_client = create_steam_client({})
+    warmer = SteamCacheWarmer(mock_steam_client, active_window_seconds=60)
+    warmer.touch("76561198012345678")
+    now[0] += 61
+
+    await warmer.refresh_cycle()
+
+    assert warmer.stats()["active_users"] == 0
+    mock_steam_client.get_friend_list.assert_not_awaited()
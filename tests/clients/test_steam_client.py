@@ -1,8 +1,11 @@
+import asyncio
 import json
 import pytest
 import httpx
+from unittest.mock import AsyncMock, MagicMock
 
 from dota2_notify.clients.steam_client import SteamClient
+from dota2_notify.clients.steam_rate_limiter import SteamCallPriority
 
 @pytest.mark.asyncio
 async def test_get_friends(httpx_mock):
@@ -1055,4 +1058,36 @@ async def test_get_match_history_by_sequence_num(httpx_mock):
         assert match2.radiant_win is False
         assert len(match2.players) == 10
         assert match2.players[4].account_id == 0
-        assert match2.players[4].hero_id == 16
\ No newline at end of file
+        assert match2.players[4].hero_id == 16
+
+@pytest.mark.asyncio
+async def test_hedged_call_takes_its_own_token_and_feed_is_never_hedged():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.2)
+        if "Sequence" in request.url.path:
+            return httpx.Response(200, json={"result": {"status": 1, "matches": []}})
+        return httpx.Response(200, json={"friendslist": {"friends": []}})
+
+    rate_limiter = MagicMock()
+    rate_limiter.acquire = AsyncMock(side_effect=[True, False, True])
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        steam_client = SteamClient(api_key="dummy_key", client=client, rate_limiter=rate_limiter)
+        for endpoint in ("GetFriendList", "GetMatchHistoryBySequenceNum"):
+            steam_client.requester._endpoint_stats(endpoint)
+            for _ in range(20):
+                steam_client.requester._latencies[endpoint].record(0.05)
+
+        await steam_client.get_friend_list("76561198882123456")
+        await steam_client.get_match_history_by_sequence_num(1)
+
+    # The hedge of the friend list was refused a token, the feed call did not ask for one
+    assert len(calls) == 2
+    assert [call.args for call in rate_limiter.acquire.await_args_list] == [
+        (SteamCallPriority.INTERACTIVE,), (SteamCallPriority.INTERACTIVE,), (SteamCallPriority.FEED,)
+    ]
+    assert rate_limiter.acquire.await_args_list[1].kwargs == {"wait": False}
+    assert steam_client.request_stats()["GetFriendList"]["hedges_skipped"] == 1
+    assert steam_client.request_stats()["GetMatchHistoryBySequenceNum"]["hedged"] == 0
@@ -0,0 +1,85 @@
+import pytest
+import httpx
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from dota2_notify.clients.steam_client import SteamClient
+from dota2_notify.clients.steam_rate_limiter import SteamBudgetExceededError, SteamCallPriority, SteamRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_lower_priorities_leave_their_reserve_in_the_shared_bucket(redis_client):
+    rate_limiter = SteamRateLimiter(redis_client, capacity=10, refill_per_second=0.01)
+    other_process = SteamRateLimiter(redis_client, capacity=10, refill_per_second=0.01)
+
+    assert [await rate_limiter.acquire(SteamCallPriority.BACKGROUND) for _ in range(6)] == [True] * 5 + [False]
+    assert [await other_process.acquire(SteamCallPriority.INTERACTIVE, wait=False) for _ in range(4)] == [True] * 3 + [False]
+    assert [await rate_limiter.acquire(SteamCallPriority.FEED, wait=False) for _ in range(3)] == [True, True, False]
+
+    assert await rate_limiter.cluster_usage() == {
+        "background:granted": 5, "background:throttled": 1,
+        "interactive:granted": 3, "interactive:throttled": 1,
+        "feed:granted": 2, "feed:throttled": 1,
+    }
+    assert rate_limiter.local_usage()["background"]["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_waiting_call_is_granted_after_the_refill(redis_client):
+    rate_limiter = SteamRateLimiter(redis_client, capacity=1, refill_per_second=50.0)
+
+    assert await rate_limiter.acquire(SteamCallPriority.FEED) is True
+    assert await rate_limiter.acquire(SteamCallPriority.FEED) is True
+
+    usage = rate_limiter.local_usage()["feed"]
+    assert (usage["granted"], usage["throttled"]) == (2, 1)
+    assert 0 < await redis_client.pttl(SteamRateLimiter.BUCKET_KEY) <= 60_020
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_refill():
+    mock_redis = MagicMock()
+    # The script answers with the milliseconds until a token is available
+    mock_redis.register_script = MagicMock(return_value=AsyncMock(side_effect=[250, 0]))
+    rate_limiter = SteamRateLimiter(mock_redis, capacity=10, refill_per_second=2.0)
+
+    with patch("dota2_notify.clients.steam_rate_limiter.asyncio.sleep", new=AsyncMock()) as mock_sleep:
+        assert await rate_limiter.acquire(SteamCallPriority.INTERACTIVE) is True
+
+    mock_sleep.assert_awaited_once_with(0.25)
+    usage = rate_limiter.local_usage()["interactive"]
+    assert usage["throttled"] == 1
+    assert usage["granted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_acquire_background_does_not_wait():
+    mock_redis = MagicMock()
+    mock_redis.register_script = MagicMock(return_value=AsyncMock(return_value=500))
+    rate_limiter = SteamRateLimiter(mock_redis, capacity=10, refill_per_second=2.0)
+
+    assert await rate_limiter.acquire(SteamCallPriority.BACKGROUND) is False
+    assert rate_limiter.local_usage()["background"]["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_acquire_fails_open_when_redis_unavailable():
+    mock_redis = MagicMock()
+    mock_redis.register_script = MagicMock(return_value=AsyncMock(side_effect=ConnectionError("redis down")))
+    rate_limiter = SteamRateLimiter(mock_redis, capacity=10, refill_per_second=2.0)
+
+    assert await rate_limiter.acquire(SteamCallPriority.INTERACTIVE) is True
+    assert rate_limiter.local_usage()["interactive"]["failed_open"] == 1
+
+
+@pytest.mark.asyncio
+async def test_steam_client_raises_when_budget_exhausted(httpx_mock):
+    mock_rate_limiter = MagicMock()
+    mock_rate_limiter.acquire = AsyncMock(return_value=False)
+
+    async with httpx.AsyncClient() as client:
+        steam_client = SteamClient(api_key="dummy_key", client=client, rate_limiter=mock_rate_limiter)
+        with pytest.raises(SteamBudgetExceededError):
+            await steam_client.get_friend_list(steam_id="76561198882123456", priority=SteamCallPriority.BACKGROUND)
+
+    mock_rate_limiter.acquire.assert_awaited_once_with(SteamCallPriority.BACKGROUND)
+    assert httpx_mock.get_requests() == []
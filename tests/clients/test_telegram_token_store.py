@@ -0,0 +1,70 @@
+import pytest
+
+from dota2_notify.clients.telegram_token_store import RedisTelegramTokenStore
+
+
+@pytest.mark.asyncio
+async def test_new_token_replaces_the_previous_one_and_is_consumed_once(redis_client):
+    token_store = RedisTelegramTokenStore(redis_client, ttl_seconds=60)
+
+    first = await token_store.get_or_create(123)
+    assert await token_store.get_or_create(123) == first
+    second = await token_store.create(123)
+
+    assert len(second) == RedisTelegramTokenStore.TOKEN_LENGTH
+    assert await token_store.get_account_id(first) is None
+    assert await token_store.get_account_id(second) == 123
+    assert 0 < await redis_client.ttl(RedisTelegramTokenStore.TOKEN_KEY_PREFIX + second) <= 60
+
+    assert await token_store.consume(second) == 123
+    assert await token_store.consume(second) is None
+    assert await token_store.get_token(123) is None
+
+
+@pytest.mark.asyncio
+async def test_create_retries_on_collision(redis_client, monkeypatch):
+    token_store = RedisTelegramTokenStore(redis_client, ttl_seconds=60)
+    taken = "A" * RedisTelegramTokenStore.TOKEN_LENGTH
+    await redis_client.set(RedisTelegramTokenStore.TOKEN_KEY_PREFIX + taken, 456)
+    candidates = iter([taken, "B" * RedisTelegramTokenStore.TOKEN_LENGTH])
+    monkeypatch.setattr("dota2_notify.clients.telegram_token_store.random.choices", lambda letters, k: next(candidates))
+
+    assert await token_store.create(123) == "B" * RedisTelegramTokenStore.TOKEN_LENGTH
+    assert await token_store.get_account_id(taken) == 456
+
+    monkeypatch.setattr("dota2_notify.clients.telegram_token_store.random.choices", lambda letters, k: taken)
+    with pytest.raises(RuntimeError):
+        await token_store.create(789)
+    assert await token_store.get_token(789) is None
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_issues_a_new_token_once_the_current_one_is_used(redis_client):
+    token_store = RedisTelegramTokenStore(redis_client, ttl_seconds=60)
+
+    token = await token_store.get_or_create(123)
+    assert await token_store.get_or_create(123) == token
+
+    await token_store.consume(token)
+    new_token = await token_store.get_or_create(123)
+    assert new_token != token
+    assert await token_store.get_account_id(new_token) == 123
+
+
+@pytest.mark.asyncio
+async def test_create_retries_when_the_previous_token_changed_meanwhile(redis_client, monkeypatch):
+    token_store = RedisTelegramTokenStore(redis_client, ttl_seconds=60)
+    previous = await token_store.create(123)
+    get_token = token_store.get_token
+    stale_reads = [None]
+
+    async def get_stale_token(account_id):
+        return stale_reads.pop() if stale_reads else await get_token(account_id)
+
+    monkeypatch.setattr(token_store, "get_token", get_stale_token)
+
+    token = await token_store.create(123)
+
+    # The stale read did not leave the previous token usable
+    assert await token_store.get_account_id(previous) is None
+    assert await get_token(123) == token
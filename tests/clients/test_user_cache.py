@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from dota2_notify.clients.user_cache import RedisUserCache
+
+
+@pytest.mark.asyncio
+async def test_get_many_returns_only_cached_users(redis_client):
+    user_cache = RedisUserCache(redis_client, ttl_seconds=60)
+    doc = {"id": "123", "userId": 123, "name": "TestUser", "_ts": 100, "_etag": "\"1\""}
+    await user_cache.put(doc)
+
+    cached = await user_cache.get_many([123, 456])
+
+    assert cached == {123: doc}
+    assert user_cache.stats() == {"hits": 1, "misses": 1, "errors": 0}
+
+
+@pytest.mark.asyncio
+async def test_get_many_treats_redis_errors_as_misses():
+    mock_pipeline = MagicMock()
+    mock_pipeline.execute = AsyncMock(side_effect=ConnectionError("redis down"))
+    mock_redis = MagicMock()
+    mock_redis.pipeline = MagicMock(return_value=mock_pipeline)
+    user_cache = RedisUserCache(mock_redis, ttl_seconds=60)
+
+    assert await user_cache.get_many([123]) == {}
+    assert user_cache.stats()["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_put_and_invalidate_keep_the_newest_version(redis_client):
+    user_cache = RedisUserCache(redis_client, ttl_seconds=60)
+    doc = {"id": "123", "userId": 123, "name": "TestUser", "_ts": 100, "_etag": "\"1\""}
+
+    await user_cache.put(doc)
+    await user_cache.put({**doc, "name": "OldName", "_ts": 99, "_etag": "\"0\""})
+    assert await user_cache.get(123) == doc
+    assert 0 < await redis_client.ttl(RedisUserCache.key(123)) <= 60
+
+    # Same second, another etag: the versions cannot be ordered, so neither is kept
+    await user_cache.put({**doc, "name": "NewName", "_etag": "\"2\""})
+    assert await user_cache.get(123) is None
+
+    await user_cache.put(doc)
+    await user_cache.invalidate(doc)
+    assert await user_cache.get(123) == doc
+    await user_cache.invalidate({**doc, "_ts": 101, "_etag": "\"3\""})
+    assert await user_cache.get(123) is None
+
+
+@pytest.mark.asyncio
+async def test_put_skips_documents_without_version(redis_client):
+    user_cache = RedisUserCache(redis_client, ttl_seconds=60)
+
+    await user_cache.put({"id": "123", "userId": 123})
+
+    assert await user_cache.get(123) is None
+    assert await redis_client.exists(RedisUserCache.key(123)) == 0
+
+
+@pytest.mark.asyncio
+async def test_invalidate_raises_redis_errors():
+    mock_redis = MagicMock()
+    mock_redis.register_script = MagicMock(return_value=AsyncMock(side_effect=ConnectionError("redis down")))
+    user_cache = RedisUserCache(mock_redis, ttl_seconds=60)
+
+    with pytest.raises(ConnectionError):
+        await user_cache.invalidate({"id": "123", "_ts": 100, "_etag": "\"1\""})
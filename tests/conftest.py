@@ -0,0 +1,23 @@
+import pytest
+import pytest_asyncio
+import redis.asyncio as redis
+
+# Lua scripts are only tested against a real server; the database is flushed before and after every test
+REDIS_TEST_DB = 15
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    """Client of the local Redis on localhost:6379, skipping the test if there is none."""
+    client = redis.Redis(host="localhost", port=6379, db=REDIS_TEST_DB, retry=None)
+    try:
+        await client.ping()
+    except redis.ConnectionError:
+        await client.aclose()
+        pytest.skip("No Redis on localhost:6379")
+    await client.flushdb()
+    try:
+        yield client
+    finally:
+        await client.flushdb()
+        await client.aclose()
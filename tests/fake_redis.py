@@ -0,0 +1,112 @@
+import fnmatch
+
+
+def _key(key):
+    return key.decode() if isinstance(key, bytes) else key
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self._redis_client = redis_client
+        self._commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        results = [await getattr(self._redis_client, name)(*args, **kwargs) for name, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+class FakeRedis:
+    """
+    Just the key and set commands the follower index uses, with members stored
+    as bytes like Redis returns them. Lua scripts are not emulated, tests of
+    the writes going through them use the redis_client fixture.
+    """
+
+    def __init__(self, sets=None):
+        self.sets = {key: {str(member).encode() for member in members} for key, members in (sets or {}).items()}
+        self.strings = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        # Registered by FollowerIndex up front, but never run against the fake
+        return None
+
+    async def scan_iter(self, match="*", count=None, _type=None):
+        keys = {"SET": list(self.sets), "HASH": list(self.hashes)}.get(_type, list(self.sets) + list(self.strings) + list(self.hashes))
+        for key in keys:
+            if fnmatch.fnmatchcase(key, match):
+                yield key.encode()
+
+    async def smembers(self, key):
+        return set(self.sets.get(_key(key), set()))
+
+    async def scard(self, key):
+        return len(self.sets.get(_key(key), set()))
+
+    async def sadd(self, key, *members):
+        members = {str(member).encode() for member in members}
+        current = self.sets.setdefault(key, set())
+        added = len(members - current)
+        current.update(members)
+        return added
+
+    async def srem(self, key, *members):
+        current = self.sets.get(key, set())
+        removed = len({str(member).encode() for member in members} & current)
+        current.difference_update(str(member).encode() for member in members)
+        # Redis deletes a set with its last member
+        if key in self.sets and not current:
+            del self.sets[key]
+        return removed
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in map(_key, keys):
+            for values in (self.sets, self.strings, self.hashes):
+                deleted += values.pop(key, None) is not None
+        return deleted
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        values = self.hashes.setdefault(key, {})
+        values.update(mapping or {field: value})
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(_key(key), {}))
+
+    async def hlen(self, key):
+        return len(self.hashes.get(_key(key), {}))
+
+    async def rename(self, key, new_key):
+        for values in (self.sets, self.strings, self.hashes):
+            if key in values:
+                values[new_key] = values.pop(key)
+
+    async def exists(self, key):
+        return int(key in self.sets or key in self.strings or key in self.hashes)
+
+    async def set(self, key, value):
+        self.strings[key] = value
+
+    async def memory_usage(self, key):
+        if _key(key) in self.hashes:
+            return 64 + 16 * len(self.hashes[_key(key)])
+        return 48 + 4 * len(self.sets[_key(key)])
+
+    async def object(self, infotype, key):
+        return b"listpack" if _key(key) in self.hashes else b"intset"
@@ -0,0 +1,66 @@
+import pytest
+
+from dota2_notify.app.config import Settings as AppSettings
+from dota2_notify.clients.cosmosdb_client import CosmosDbUserService
+from dota2_notify.local import main as local_main
+from dota2_notify.local.config import Settings
+from dota2_notify.notify import main as notify_main
+from dota2_notify.notify.config import Settings as NotifySettings
+from dota2_notify.sync import main as sync_main
+from dota2_notify.sync.config import Settings as SyncSettings
+
+
+def memory_settings(settings_class, **values):
+    return settings_class(
+        _env_file=None,
+        STORAGE__BACKEND="memory",
+        TELEGRAM__BOTTOKEN="fake",
+        STEAM__APIKEY="fake",
+        REDIS__HOST="localhost",
+        REDIS__PORT=6379,
+        **values
+    )
+
+
+@pytest.mark.asyncio
+async def test_services_share_the_containers_of_one_client():
+    cosmos_client = await local_main.create_shared_client(
+        Settings(_env_file=None, LOCAL__STARTMATCHSEQNUM=6_500_000_000, LOCAL__COSMOSDB__FEEDRANGECOUNT=2)
+    )
+    app_settings = memory_settings(
+        AppSettings, MATCHCHECK__INTERVALMINUTES=1, MATCHCHECK__ENABLED=False, JWT__COOKIES__SECRET="fake"
+    )
+    notify_settings = memory_settings(NotifySettings)
+    sync_settings = memory_settings(SyncSettings)
+
+    # A user signing up in the web app reaches data-sync through the change feed
+    user_service = CosmosDbUserService(
+        cosmosdb_client=cosmos_client,
+        database_name=app_settings.cosmosdb_database_name,
+        user_container_name=app_settings.cosmosdb_container_name,
+        telegram_verify_token_container_name=app_settings.cosmosdb_token_container_name
+    )
+    await user_service.connect()
+    await user_service.create_user_async(123, "TestUser", "ABCDEF")
+    database = cosmos_client.get_database_client(sync_settings.cosmosdb_database_name)
+    container = database.get_container_client(sync_settings.cosmosdb_container_name)
+    changes = [
+        doc
+        async for feed_range in container.read_feed_ranges()
+        async for doc in container.query_items_change_feed(feed_range=feed_range, start_time="Beginning")
+    ]
+    assert [doc["id"] for doc in changes] == ["123"]
+
+    # match-notify starts at the seeded sequence number instead of returning right away
+    metadata_container = cosmos_client.get_database_client(notify_settings.cosmosdb_database_name).get_container_client(
+        notify_settings.cosmosdb_metadata_container_name
+    )
+    assert await notify_main.get_match_sequence_num(metadata_container) == 6_500_000_000
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_needs_the_shared_client(monkeypatch):
+    monkeypatch.setattr(sync_main, "get_settings", lambda: memory_settings(SyncSettings))
+
+    with pytest.raises(RuntimeError, match="local-stack"):
+        await sync_main.main()
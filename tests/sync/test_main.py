@@ -0,0 +1,299 @@
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import AsyncMock
+
+import redis.asyncio as redis
+
+from dota2_notify.clients import in_memory_cosmos
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.clients.in_memory_cosmos import InMemoryContainer
+from dota2_notify.clients.sqlite_user_store import SqliteUserStore
+from dota2_notify.models.user import Friend
+from dota2_notify.sync import main as sync_main
+from dota2_notify.sync import metrics
+
+
+def record_applied(monkeypatch):
+    """Account IDs of the documents of every batch applied to Redis."""
+    batches = []
+    apply_changes = sync_main.apply_changes
+
+    async def record(docs, *args, **kwargs):
+        await apply_changes(docs, *args, **kwargs)
+        batches.append([int(doc["id"]) for doc in docs])
+
+    monkeypatch.setattr(sync_main, "apply_changes", record)
+    return batches
+
+
+def stop_after_polls(monkeypatch, polls):
+    remaining = [polls]
+
+    async def sleep(seconds):
+        remaining[0] -= 1
+        if remaining[0] <= 0:
+            monkeypatch.setattr(sync_main, "keep_running", False)
+
+    monkeypatch.setattr(sync_main, "keep_running", True)
+    monkeypatch.setattr(sync_main.asyncio, "sleep", sleep)
+
+
+@pytest.mark.asyncio
+async def test_apply_changes_keeps_the_feed_order(redis_client):
+    docs = [
+        {"id": "123", "userId": 123, "type": "user", "following": True, "telegramChatId": "42"},
+        {"id": "456", "userId": 123, "type": "friend", "following": True, "_ts": 100},
+        {"id": "456", "userId": 123, "type": "friend", "following": False, "_ts": 101},
+    ]
+
+    index = FollowerIndex(redis_client)
+    await sync_main.apply_changes(docs, index)
+
+    # The unfollow came last in the feed, so it wins
+    assert await index.get_following(123) == {123}
+    assert await index.get_followers_many([123, 456]) == {123: {123}, 456: set()}
+    assert await index.get_notifiable() == {123}
+
+
+@pytest.mark.asyncio
+async def test_consume_change_feed_saves_continuation_on_shutdown(monkeypatch, redis_client):
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    for account_id in range(5):
+        await container.upsert_item({"id": str(account_id), "userId": account_id, "following": True})
+    metadata_container = InMemoryContainer("meta")
+    metadata_container.upsert_item = AsyncMock(wraps=metadata_container.upsert_item)
+    applied = record_applied(monkeypatch)
+    index = FollowerIndex(redis_client)
+    stop_after_polls(monkeypatch, 1)
+
+    await sync_main.consume_change_feed(container, metadata_container, index, batch_size=2)
+
+    assert applied == [[0, 1], [2, 3], [4]]
+    # Three pages, but the continuation is only written once, when the loop stops
+    metadata_container.upsert_item.assert_awaited_once()
+    feed_range = {"inMemoryFeedRange": 0, "count": 1}
+    continuation = await sync_main.get_continuation_token(metadata_container, sync_main.feed_range_doc_id(feed_range))
+    assert continuation == container.client_connection.last_response_headers["etag"]
+    assert await redis_client.exists(index.sentinel_key)
+
+
+@pytest.mark.asyncio
+async def test_consume_change_feed_rereads_batch_that_failed(monkeypatch, redis_client):
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    for account_id in range(4):
+        await container.upsert_item({"id": str(account_id), "userId": account_id, "following": True})
+    metadata_container = InMemoryContainer("meta")
+    # The second batch fails once, then succeeds on the next poll
+    results = iter([None, redis.ConnectionError("redis down")])
+    execute = redis.client.Pipeline.execute
+
+    async def execute_or_fail(self, *args, **kwargs):
+        error = next(results, None)
+        if error:
+            await self.reset()
+            raise error
+        return await execute(self, *args, **kwargs)
+
+    monkeypatch.setattr(redis.client.Pipeline, "execute", execute_or_fail)
+    applied = record_applied(monkeypatch)
+    index = FollowerIndex(redis_client)
+    stop_after_polls(monkeypatch, 2)
+
+    await sync_main.consume_change_feed(container, metadata_container, index, batch_size=2)
+
+    assert applied == [[0, 1], [2, 3]]
+    assert [await index.get_following(user_id) for user_id in range(4)] == [{0}, {1}, {2}, {3}]
+
+
+@pytest.mark.asyncio
+async def test_consume_change_feed_keeps_a_continuation_per_feed_range(monkeypatch, redis_client):
+    container = InMemoryContainer("users", partition_key_path="/userId", feed_range_count=4)
+    for account_id in range(20):
+        await container.upsert_item({"id": str(account_id), "userId": account_id, "following": True})
+    metadata_container = InMemoryContainer("meta")
+    index = FollowerIndex(redis_client)
+    stop_after_polls(monkeypatch, 1)
+
+    await sync_main.consume_change_feed(container, metadata_container, index, batch_size=100)
+
+    assert await index.get_notifiable() == set()
+    assert sorted([entry async for entry in index.iter_following()]) == [(user_id, [user_id]) for user_id in range(20)]
+    assert len([doc async for doc in metadata_container.query_items("SELECT * FROM c")]) == 4
+
+    # Only the range holding the changed partition has something to apply on the next poll
+    await container.upsert_item({"id": "3", "userId": 3, "following": False})
+    applied = record_applied(monkeypatch)
+    stop_after_polls(monkeypatch, 1)
+    await sync_main.consume_change_feed(container, metadata_container, index, batch_size=100)
+
+    assert applied == [[3]]
+    assert await index.get_following(3) == set()
+
+
+@pytest.mark.asyncio
+async def test_feed_ranges_start_from_the_single_continuation_token_after_upgrade(monkeypatch, redis_client):
+    container = InMemoryContainer("users", partition_key_path="/userId", feed_range_count=4)
+    # Applied by an older release, long before it last saved its continuation
+    monkeypatch.setattr(in_memory_cosmos.time, "time", lambda: 1000.0)
+    await container.upsert_item({"id": "1", "userId": 1, "following": True})
+    monkeypatch.undo()
+    metadata_container = InMemoryContainer("meta")
+    await sync_main.save_continuation_token(metadata_container, '"1"')
+    await container.upsert_item({"id": "2", "userId": 2, "following": True})
+    index = FollowerIndex(redis_client)
+    await redis_client.set(index.sentinel_key, "1")
+    applied = record_applied(monkeypatch)
+    stop_after_polls(monkeypatch, 1)
+
+    await sync_main.consume_change_feed(container, metadata_container, index)
+
+    assert applied == [[2]]
+    feed_ranges = [feed_range async for feed_range in container.read_feed_ranges()]
+    assert all([
+        await sync_main.get_continuation_token(metadata_container, sync_main.feed_range_doc_id(feed_range))
+        for feed_range in feed_ranges
+    ])
+
+
+@pytest.mark.asyncio
+async def test_missing_sentinel_restores_snapshot_and_replays_tail(monkeypatch, redis_client):
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    await container.upsert_item({"id": "1", "userId": 1, "following": True})
+    feed_range = {"inMemoryFeedRange": 0, "count": 1}
+    [doc async for doc in container.query_items_change_feed(feed_range=feed_range, start_time="Beginning")]
+    snapshot_continuation = container.client_connection.last_response_headers["etag"]
+    await container.upsert_item({"id": "2", "userId": 2, "following": True})
+
+    async def restore(metadata_container, redis_client):
+        return {sync_main.feed_range_doc_id(feed_range): snapshot_continuation}
+
+    monkeypatch.setattr(sync_main, "try_restore_snapshot", restore)
+    index = FollowerIndex(redis_client)
+    stop_after_polls(monkeypatch, 1)
+
+    await sync_main.consume_change_feed(container, InMemoryContainer("meta"), index)
+
+    # The restore is stubbed, so only the change after the snapshot is in the index
+    assert (await index.get_following(1), await index.get_following(2)) == (set(), {2})
+    assert await redis_client.exists(index.sentinel_key)
+
+
+@pytest.mark.asyncio
+async def test_checkpointer_saves_after_interval_or_doc_count(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sync_main, "time", SimpleNamespace(monotonic=lambda: now[0], perf_counter=time.perf_counter))
+    metadata_container = InMemoryContainer("meta")
+    checkpointer = sync_main.Checkpointer(metadata_container, interval_seconds=30, max_docs=100)
+
+    await checkpointer.update("range-a", "token-1", 10)
+    now[0] += 10
+    await checkpointer.update("range-a", "token-2", 10)
+    assert await sync_main.get_continuation_token(metadata_container, "range-a") is None
+
+    # Enough changes since the last save
+    await checkpointer.update("range-a", "token-3", 80)
+    assert await sync_main.get_continuation_token(metadata_container, "range-a") == "token-3"
+
+    # Enough time since the last save
+    await checkpointer.update("range-a", "token-4", 1)
+    now[0] += 30
+    await checkpointer.update("range-a", "token-5", 1)
+    assert await sync_main.get_continuation_token(metadata_container, "range-a") == "token-5"
+
+    await checkpointer.update("range-a", "token-6", 1)
+    # Nothing saved for range-b since startup, more than the interval ago
+    await checkpointer.update("range-b", "token-b", 1)
+    assert checkpointer.stats() == {"saved": 3, "skipped": 4, "pending": 1}
+    await checkpointer.flush()
+    assert await sync_main.get_continuation_token(metadata_container, "range-a") == "token-6"
+    assert await sync_main.get_continuation_token(metadata_container, "range-b") == "token-b"
+
+
+@pytest.mark.asyncio
+async def test_poll_records_lag_and_redis_latency(monkeypatch, redis_client):
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    for account_id in range(3):
+        await container.upsert_item({"id": str(account_id), "userId": account_id, "following": True})
+    stats = sync_main.SyncStats()
+    checkpointer = sync_main.Checkpointer(InMemoryContainer("meta"))
+    feed_range = {"inMemoryFeedRange": 0, "count": 1}
+    last_change_ts = (await container.read_item("2", partition_key=2))["_ts"]
+    monkeypatch.setattr(metrics, "time", SimpleNamespace(time=lambda: last_change_ts + 4))
+
+    await sync_main.poll_feed_range(container, checkpointer, FollowerIndex(redis_client), feed_range, None, batch_size=2, stats=stats)
+
+    report = stats.report()
+    assert report["docs_applied"] == 3
+    assert report["batches"] == 2
+    assert report["failed_batches"] == 0
+    assert report["lag_seconds"] == 4.0
+    assert report["seconds_since_last_change"] == 4.0
+
+
+@pytest.mark.asyncio
+async def test_poll_saves_the_composite_continuation_not_the_raw_etag(monkeypatch, redis_client):
+    container = InMemoryContainer("users", partition_key_path="/userId", feed_range_count=2)
+    for account_id in range(4):
+        await container.upsert_item({"id": str(account_id), "userId": account_id, "following": True})
+    metadata_container = InMemoryContainer("meta")
+    checkpointer = sync_main.Checkpointer(metadata_container, interval_seconds=0)
+    index = FollowerIndex(redis_client)
+    feed_ranges = [feed_range async for feed_range in container.read_feed_ranges()]
+
+    for feed_range in feed_ranges:
+        await sync_main.poll_feed_range(container, checkpointer, index, feed_range, None, batch_size=1)
+    await container.upsert_item({"id": "9", "userId": 3, "following": True})
+    applied = record_applied(monkeypatch)
+
+    for feed_range in feed_ranges:
+        continuation = await sync_main.get_continuation_token(metadata_container, sync_main.feed_range_doc_id(feed_range))
+        assert not continuation.strip('"').isdigit()
+        await sync_main.poll_feed_range(container, checkpointer, index, feed_range, continuation)
+    assert applied == [[9]]
+    assert await index.get_following(3) == {3, 9}
+
+
+@pytest.mark.asyncio
+async def test_consume_change_log_retries_after_sqlite_errors(monkeypatch, redis_client, tmp_path):
+    async with SqliteUserStore(str(tmp_path / "users.db")) as store:
+        await store.update_friend_async(Friend(id="456", user_id=123, name="Friend", following=True))
+        read_change_log = store.read_change_log_async
+        # The first read finds the database locked, the next poll reads it
+        results = iter([sqlite3.OperationalError("database is locked")])
+
+        async def read_or_fail(*args, **kwargs):
+            error = next(results, None)
+            if error:
+                raise error
+            return await read_change_log(*args, **kwargs)
+
+        monkeypatch.setattr(store, "read_change_log_async", read_or_fail)
+        index = FollowerIndex(redis_client)
+        stop_after_polls(monkeypatch, 2)
+
+        await sync_main.consume_change_log(store, index)
+
+        assert await index.get_following(123) == {456}
+        assert await sync_main.get_continuation_token(store.metadata_container) == 1
+
+
+
+@pytest.mark.asyncio
+async def test_throttled_feed_range_is_read_again_on_the_next_poll(redis_client):
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    await container.upsert_item({"id": "1", "userId": 1, "following": True})
+    checkpointer = sync_main.Checkpointer(InMemoryContainer("meta"))
+    index = FollowerIndex(redis_client)
+    feed_range = {"inMemoryFeedRange": 0, "count": 1}
+
+    container.throttle_probability = 1.0
+    continuation, applied, _, completed = await sync_main.poll_feed_range(container, checkpointer, index, feed_range, None)
+    assert (continuation, applied, completed) == (None, 0, False)
+
+    container.throttle_probability = 0.0
+    _, applied, _, completed = await sync_main.poll_feed_range(container, checkpointer, index, feed_range, continuation)
+    assert (applied, completed) == (1, True)
+    assert await index.get_following(1) == {1}
@@ -0,0 +1,60 @@
+import pytest
+
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.clients.in_memory_cosmos import InMemoryContainer
+from dota2_notify.sync import main as sync_main
+from dota2_notify.sync import rebuild
+from tests.fake_redis import FakeRedis
+
+
+async def create_container():
+    container = InMemoryContainer("users", partition_key_path="/userId", feed_range_count=4)
+    await container.upsert_item({"id": "123", "userId": 123, "type": "user", "following": True, "telegramChatId": "42"})
+    await container.upsert_item({"id": "999", "userId": 999, "type": "user", "following": False, "telegramChatId": ""})
+    await container.upsert_item({"id": "456", "userId": 123, "type": "friend", "following": True})
+    await container.upsert_item({"id": "789", "userId": 123, "type": "friend", "following": False})
+    await container.upsert_item({"id": "456", "userId": 999, "type": "friend", "following": True})
+    return container
+
+
+@pytest.mark.asyncio
+async def test_rebuild_swaps_in_the_queried_index(redis_client):
+    container = await create_container()
+    index = FollowerIndex(redis_client)
+    await index.load({555: [111]}, [555])
+
+    await rebuild.rebuild_index(container, index, max_concurrency=2)
+
+    assert await index.get_followers_many([123, 456, 111]) == {123: {123}, 456: {123}, 111: set()}
+    assert await index.get_following(999) == {456}
+    assert await index.get_notifiable() == {123}
+    assert await redis_client.exists(index.sentinel_key)
+    assert not [key async for key in redis_client.scan_iter(match=f"{rebuild.SHADOW_NAMESPACE}:*")]
+    # Edges carry the version of their document, so older writes cannot undo them
+    doc = await container.read_item("456", partition_key=123)
+    assert await index.set_following(123, 456, False, doc["_ts"] - 1) == -1
+
+
+@pytest.mark.asyncio
+async def test_change_feed_resumes_from_before_the_rebuild(monkeypatch):
+    container = await create_container()
+    metadata_container = InMemoryContainer("meta")
+    index = FollowerIndex(FakeRedis())
+    query_feed_ranges = rebuild.query_feed_ranges
+    writes = []
+
+    async def write_then_query(container, query, *args):
+        # Lands after the continuations were captured, whether or not the queries see it
+        if not writes:
+            writes.append(await container.upsert_item({"id": "321", "userId": 999, "type": "friend", "following": True}))
+        return await query_feed_ranges(container, query, *args)
+
+    monkeypatch.setattr(rebuild, "query_feed_ranges", write_then_query)
+    await sync_main.rebuild(container, metadata_container, index)
+
+    feed_docs = []
+    for feed_range in [feed_range async for feed_range in container.read_feed_ranges()]:
+        continuation = await sync_main.get_continuation_token(metadata_container, sync_main.feed_range_doc_id(feed_range))
+        assert continuation and not continuation.strip('"').isdigit()
+        feed_docs += [doc async for doc in container.query_items_change_feed(continuation=continuation)]
+    assert [(doc["userId"], doc["id"]) for doc in feed_docs] == [(999, "321")]
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.clients.in_memory_cosmos import InMemoryContainer
+from dota2_notify.sync import reconcile
+
+
+async def create_container():
+    container = InMemoryContainer("users", partition_key_path="/userId")
+    await container.upsert_item({"id": "123", "userId": 123, "type": "user", "following": True, "telegramChatId": "42"})
+    await container.upsert_item({"id": "999", "userId": 999, "type": "user", "following": False, "telegramChatId": ""})
+    await container.upsert_item({"id": "456", "userId": 123, "type": "friend", "following": True})
+    await container.upsert_item({"id": "789", "userId": 123, "type": "friend", "following": False})
+    await container.upsert_item({"id": "456", "userId": 999, "type": "friend", "following": True})
+    return container
+
+
+@pytest.mark.asyncio
+async def test_matching_index_has_no_drift(redis_client):
+    container = await create_container()
+    index = FollowerIndex(redis_client)
+    await index.load({123: [123, 456], 999: [456]}, [123])
+    # Removed long ago, and just now
+    await index.set_following(999, 111, False, 100)
+    await index.set_following(999, 222, False, int(time.time()))
+
+    report = await reconcile.reconcile(container, index)
+
+    assert report["drifted_buckets"] == 0
+    assert report["repaired_users"] == 0
+    assert report["edges"] == 3
+    assert report["pruned_versions"] == 1
+    assert await redis_client.hkeys(index.versions_key(999)) == [b"222"]
+
+
+@pytest.mark.asyncio
+async def test_only_drifted_buckets_are_repaired(redis_client):
+    container = await create_container()
+    index = FollowerIndex(redis_client)
+    # 123 lost an edge and its Telegram connection, 999 has a stale edge and followers entry
+    await index.load({123: [123], 999: [456, 789]}, [])
+    await redis_client.sadd(index.followers_key(111), 999)
+
+    report = await reconcile.reconcile(container, index)
+
+    assert report["drifted_buckets"] == 2
+    assert report["repaired_users"] == 2
+    assert await index.get_followers_many([123, 456, 789, 111]) == {123: {123}, 456: {123}, 789: set(), 111: set()}
+    assert await index.get_following(999) == {456}
+    assert await index.get_notifiable() == {123}
+    assert (await reconcile.reconcile(container, index))["drifted_buckets"] == 0
+
+
+@pytest.mark.asyncio
+async def test_edges_written_after_the_cosmos_read_are_kept(redis_client):
+    container = await create_container()
+    index = FollowerIndex(redis_client)
+    await index.load({123: [123, 456], 999: [456]}, [123])
+    # The web app wrote a follow that is not in the Cosmos DB state read by the reconciler
+    await index.set_following(123, 555, True, int(time.time()) + 60)
+
+    report = await reconcile.reconcile(container, index)
+
+    assert report["drifted_buckets"] == 1
+    assert await index.get_followers(555) == {123}
+
+
+@pytest.mark.asyncio
+async def test_edges_are_only_queried_for_the_users_of_drifted_buckets(redis_client, monkeypatch):
+    container = await create_container()
+    index = FollowerIndex(redis_client)
+    await index.load({123: [123, 456], 999: [456, 789]}, [123])
+    queries = []
+    query_items = container.query_items
+
+    def record_query(query, parameters=None, **kwargs):
+        queries.append((query, parameters))
+        return query_items(query, parameters=parameters, **kwargs)
+
+    monkeypatch.setattr(container, "query_items", record_query)
+    report = await reconcile.reconcile(container, index)
+
+    assert (report["drifted_buckets"], report["queried_users"], report["repaired_users"]) == (1, 1, 1)
+    assert [parameters for query, parameters in queries if query == reconcile.USER_EDGES_QUERY] == [[{"name": "@userIds", "value": [999]}]]
+    assert reconcile.EDGES_QUERY not in [query for query, _ in queries]
+    assert await index.get_following(999) == {456}
+
+
+@pytest.mark.asyncio
+async def test_followers_entries_drifting_on_their_own_are_repaired(redis_client):
+    container = await create_container()
+    index = FollowerIndex(redis_client)
+    await index.load({123: [123, 456], 999: [456]}, [123])
+    # 999 cannot be notified, the entry has no edge on either side
+    await redis_client.sadd(index.followers_key(111), 999)
+
+    report = await reconcile.reconcile(container, index)
+
+    assert (report["drifted_buckets"], report["repaired_users"]) == (1, 1)
+    assert await index.get_followers_many([111, 456]) == {111: set(), 456: {123}}
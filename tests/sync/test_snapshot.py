@@ -0,0 +1,62 @@
+import pytest
+
+from dota2_notify.clients.follower_index import FollowerIndex
+from dota2_notify.clients.in_memory_cosmos import InMemoryContainer
+from dota2_notify.sync import snapshot
+from tests.fake_redis import FakeRedis
+
+
+@pytest.mark.asyncio
+async def test_snapshot_round_trip_restores_sets_and_continuations():
+    metadata_container = InMemoryContainer("meta")
+    source = FollowerIndex(FakeRedis())
+    await source.load({123: [456, 789], 999: [456]}, [123, 555])
+
+    manifest = await snapshot.write_snapshot(metadata_container, source, {"range-a": "token-a"})
+
+    assert manifest["keys"] == 2
+    assert manifest["members"] == 3
+    assert manifest["notifiable"] == 2
+
+    target = FollowerIndex(FakeRedis())
+    await target.load({123: [111]}, [])
+    continuations = await snapshot.restore_snapshot(metadata_container, target)
+
+    assert continuations == {"range-a": "token-a"}
+    assert await target.get_followers_many([456, 789]) == {456: {123}, 789: {123}}
+    assert await target.get_following(123) == {456, 789}
+    assert await target.get_following(999) == {456}
+    assert await target.get_notifiable() == {123, 555}
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_split_into_chunks_and_replaces_previous(monkeypatch):
+    monkeypatch.setattr(snapshot, "MAX_CHUNK_BYTES", 64)
+    metadata_container = InMemoryContainer("meta")
+    source = FollowerIndex(FakeRedis())
+    await source.load({user_id: [1, 2, 3] for user_id in range(100, 120)}, range(100, 120, 2))
+
+    first = await snapshot.write_snapshot(metadata_container, source, {})
+    second = await snapshot.write_snapshot(metadata_container, source, {})
+
+    assert second["chunks"] > 1
+    doc_ids = [doc["id"] async for doc in metadata_container.query_items("SELECT * FROM c")]
+    assert not [doc_id for doc_id in doc_ids if doc_id.startswith(f"follower_snapshot:{first['generation']}:")]
+    assert len(doc_ids) == second["chunks"] + 1
+
+    target = FollowerIndex(FakeRedis())
+    await snapshot.restore_snapshot(metadata_container, target)
+    assert target.redis_client.sets == source.redis_client.sets
+
+
+@pytest.mark.asyncio
+async def test_restore_without_snapshot_returns_none():
+    assert await snapshot.try_restore_snapshot(InMemoryContainer("meta"), FollowerIndex(FakeRedis())) is None
+
+
+@pytest.mark.asyncio
+async def test_snapshot_of_another_format_is_not_restored():
+    metadata_container = InMemoryContainer("meta")
+    await metadata_container.upsert_item({"id": "follower_snapshot", "generation": 1, "chunks": 0, "continuations": {"range-a": "token-a"}})
+
+    assert await snapshot.restore_snapshot(metadata_container, FollowerIndex(FakeRedis())) is None
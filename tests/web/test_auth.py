@@ -5,7 +5,7 @@ from fastapi import FastAPI, Request
 from fastapi.testclient import TestClient
 from dota2_notify.models.user import User
 from dota2_notify.app.config import Settings, get_settings
-from dota2_notify.web.auth import router, cookie_name, get_current_user, create_access_token
+from dota2_notify.web.auth import router, cookie_name, get_current_user, create_access_token, import_friend_graph
 from dota2_notify.web.dependencies import get_user_service
 from urllib.parse import parse_qs, urlparse
 from jose import jwt
@@ -183,8 +183,7 @@ async def test_steam_callback_creates_new_user():
     # Mock get_user_with_steam_id_async to return None, simulating a new user
     mock_user_service.get_user_with_steam_id_async = AsyncMock(return_value=None)
     
-    # Mock create_telegram_verify_token_async to return a dummy token
-    mock_user_service.create_telegram_verify_token_async = AsyncMock(return_value="ABCDEF")
+    mock_user_service.create_telegram_verify_token_async = AsyncMock()
     
     # Mock create_user_async to verify it's called correctly
     mock_user_service.create_user_async = AsyncMock()
@@ -236,16 +235,16 @@ async def test_steam_callback_creates_new_user():
     mock_user_service.get_user_with_steam_id_async.assert_called_once_with(int(test_steam_id))
     mock_steam_client.get_player_summaries.assert_called_once_with(test_steam_id, [test_steam_id])
     
-    # Verify that a telegram token was created for the new user
+    # Verify that no telegram token is created until the notifications page is opened
     from dota2_notify.models.user import steam_id_to_account_id
     expected_account_id = steam_id_to_account_id(int(test_steam_id))
-    mock_user_service.create_telegram_verify_token_async.assert_called_once_with(expected_account_id)
+    mock_user_service.create_telegram_verify_token_async.assert_not_called()
     
-    # Verify that the user was created with the correct name and token
+    # Verify that the user was created with the correct name and no token
     mock_user_service.create_user_async.assert_called_once_with(
         expected_account_id,
         "NewTestUser",
-        "ABCDEF"
+        ""
     )
 
 
@@ -309,3 +308,52 @@ async def test_get_current_user_with_valid_token():
     
     # Verify the cookie was retrieved
     mock_request.cookies.get.assert_called_once_with(cookie_name)
+
+
+@pytest.mark.asyncio
+async def test_import_friend_graph_writes_all_friends_unfollowed():
+    """Test that the first-login import stores every Steam friend as a not followed Friend"""
+    from dota2_notify.clients.steam_rate_limiter import SteamCallPriority
+    from dota2_notify.models.steam_player_summary import SteamPlayerSummary
+    from dota2_notify.models.user import Friend, steam_id_to_account_id
+
+    test_steam_id = "76561198098765432"
+    friend_steam_ids = ["76561198111111111", "76561198222222222"]
+
+    mock_steam_client = MagicMock()
+    mock_steam_client.get_friend_list = AsyncMock(return_value=friend_steam_ids)
+    mock_steam_client.get_player_summaries = AsyncMock(return_value=[
+        SteamPlayerSummary(steamid=steam_id, personaname=f"Friend{i}", avatar="", avatarmedium="", avatarfull="")
+        for i, steam_id in enumerate(friend_steam_ids)
+    ])
+    mock_user_service = MagicMock()
+    mock_user_service.import_friends_async = AsyncMock(return_value=2)
+
+    await import_friend_graph(mock_steam_client, mock_user_service, test_steam_id, max_request_charge=500.0)
+
+    account_id = steam_id_to_account_id(int(test_steam_id))
+    mock_steam_client.get_friend_list.assert_awaited_once_with(test_steam_id, priority=SteamCallPriority.BACKGROUND)
+    mock_steam_client.get_player_summaries.assert_awaited_once_with(
+        test_steam_id, friend_steam_ids, cache=True, priority=SteamCallPriority.BACKGROUND
+    )
+    mock_user_service.import_friends_async.assert_awaited_once_with(
+        account_id,
+        [
+            Friend(id=str(steam_id_to_account_id(int(friend_steam_ids[0]))), user_id=account_id, name="Friend0", following=False),
+            Friend(id=str(steam_id_to_account_id(int(friend_steam_ids[1]))), user_id=account_id, name="Friend1", following=False),
+        ],
+        max_request_charge=500.0
+    )
+
+
+@pytest.mark.asyncio
+async def test_import_friend_graph_swallows_errors():
+    """Test that a failing import does not surface to the login flow"""
+    mock_steam_client = MagicMock()
+    mock_steam_client.get_friend_list = AsyncMock(side_effect=Exception("Steam down"))
+    mock_user_service = MagicMock()
+    mock_user_service.import_friends_async = AsyncMock()
+
+    await import_friend_graph(mock_steam_client, mock_user_service, "76561198098765432", max_request_charge=500.0)
+
+    mock_user_service.import_friends_async.assert_not_awaited()
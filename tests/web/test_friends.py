@@ -1,14 +1,25 @@
-import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from dota2_notify.web import friends
 from unittest.mock import AsyncMock, MagicMock
+from dota2_notify.clients.steam_rate_limiter import SteamBudgetExceededError, SteamCallPriority
 from dota2_notify.models.steam_player_summary import SteamPlayerSummary
 from dota2_notify.models.user import Friend, User, steam_id_to_account_id
-from dota2_notify.web.dependencies import get_user_service, get_steam_client
+from dota2_notify.web.dependencies import get_follower_index, get_user_service, get_steam_client
 from dota2_notify.web import static
 
 
+def override_follower_index(app, set_following=None):
+    mock_follower_index = MagicMock()
+    mock_follower_index.set_following = set_following or AsyncMock(return_value=1)
+
+    async def mock_get_follower_index():
+        return mock_follower_index
+
+    app.dependency_overrides[get_follower_index] = mock_get_follower_index
+    return mock_follower_index
+
+
 def test_get_friends_with_authenticated_user():
     """Test that / endpoint returns friends list for authenticated user"""
     app = FastAPI()
@@ -112,6 +123,50 @@ def test_get_friends_with_authenticated_user():
     assert "Unfollow" in response.text
 
 
+
+def test_get_friends_renders_without_steam_data_when_the_budget_is_exhausted():
+    """Test that / still renders, with a message, when the Steam API budget is exhausted"""
+    app = FastAPI()
+    app.include_router(friends.router)
+    app.include_router(static.router)
+    app.mount("/static", static.static_files, name="static")
+
+    test_steam_id = "76561198012345678"
+
+    async def mock_get_current_user():
+        return test_steam_id
+
+    mock_user_service = MagicMock()
+    mock_user_service.get_user_with_steam_id_async = AsyncMock(
+        return_value=User(
+            id=str(steam_id_to_account_id(int(test_steam_id))),
+            user_id=steam_id_to_account_id(int(test_steam_id)),
+            name="TestUser",
+            following=True
+        )
+    )
+    mock_user_service.get_friends_async = AsyncMock(return_value=[])
+
+    async def mock_get_user_service():
+        return mock_user_service
+
+    mock_steam_client = MagicMock()
+    mock_steam_client.get_friend_list = AsyncMock(side_effect=SteamBudgetExceededError(SteamCallPriority.INTERACTIVE))
+    mock_steam_client.get_player_summaries = AsyncMock(return_value=[])
+
+    async def mock_get_steam_client():
+        return mock_steam_client
+
+    app.dependency_overrides[friends.get_current_user] = mock_get_current_user
+    app.dependency_overrides[get_user_service] = mock_get_user_service
+    app.dependency_overrides[get_steam_client] = mock_get_steam_client
+
+    client = TestClient(app)
+    response = client.get("/")
+
+    assert response.status_code == 200
+    assert friends.STEAM_BUSY_MESSAGE in response.text
+
 def test_follow_friend_happy_path_new_friend():
     """Test following a friend that is not yet in the database (happy path)"""
     app = FastAPI()
@@ -126,9 +181,9 @@ def test_follow_friend_happy_path_new_friend():
 
     # Mock user_service
     mock_user_service = MagicMock()
-    # Mock finding friend in DB returns None (create new friend path)
-    mock_user_service.get_friend_by_steam_id_async = AsyncMock(return_value=None)
-    mock_user_service.update_friend_async = AsyncMock()
+    # Patching a friend that is not in the DB returns None (create new friend path)
+    mock_user_service.patch_friend_async = AsyncMock(return_value=None)
+    mock_user_service.update_friend_async = AsyncMock(side_effect=lambda friend: friend.model_copy(update={"ts": 1700000000}))
 
     async def mock_get_user_service():
         return mock_user_service
@@ -160,6 +215,7 @@ def test_follow_friend_happy_path_new_friend():
     app.dependency_overrides[friends.get_current_user] = mock_get_current_user
     app.dependency_overrides[get_user_service] = mock_get_user_service
     app.dependency_overrides[get_steam_client] = mock_get_steam_client
+    mock_follower_index = override_follower_index(app)
 
     client = TestClient(app)
     
@@ -170,6 +226,12 @@ def test_follow_friend_happy_path_new_friend():
     assert response.status_code == 303
     assert response.headers["location"] == "/" # check redirection
 
+    mock_user_service.patch_friend_async.assert_awaited_once_with(
+        steam_id_to_account_id(int(test_steam_id)),
+        steam_id_to_account_id(int(friend_steam_id)),
+        {"following": True, "name": "New Friend"}
+    )
+
     # Check update_friend_async was called with correct data
     mock_user_service.update_friend_async.assert_awaited_once()
     saved_friend = mock_user_service.update_friend_async.call_args[0][0]
@@ -179,6 +241,11 @@ def test_follow_friend_happy_path_new_friend():
     assert saved_friend.name == "New Friend"
     assert saved_friend.following is True
 
+    # The stored friend is written through to the follower index with its version
+    mock_follower_index.set_following.assert_awaited_once_with(
+        steam_id_to_account_id(int(test_steam_id)), steam_id_to_account_id(int(friend_steam_id)), True, 1700000000
+    )
+
 
 def test_unfollow_friend_happy_path():
     """Test unfollowing a friend (happy path)"""
@@ -204,7 +271,7 @@ def test_unfollow_friend_happy_path():
         type="friend"
     )
     
-    mock_user_service.get_friend_by_steam_id_async = AsyncMock(return_value=existing_friend)
+    mock_user_service.patch_friend_async = AsyncMock(return_value=existing_friend.model_copy(update={"following": False, "ts": 1700000000}))
     mock_user_service.update_friend_async = AsyncMock()
 
     async def mock_get_user_service():
@@ -213,6 +280,7 @@ def test_unfollow_friend_happy_path():
     app.state.steam_client = MagicMock()
     app.dependency_overrides[friends.get_current_user] = mock_get_current_user
     app.dependency_overrides[get_user_service] = mock_get_user_service
+    mock_follower_index = override_follower_index(app)
 
     client = TestClient(app)
     
@@ -223,12 +291,45 @@ def test_unfollow_friend_happy_path():
     assert response.status_code == 303
     assert response.headers["location"] == "/"
 
-    # Check update_friend_async was called
-    mock_user_service.update_friend_async.assert_awaited_once()
-    updated_friend = mock_user_service.update_friend_async.call_args[0][0]
-    
-    assert updated_friend.id == str(friend_account_id)
-    assert updated_friend.following is False
+    # Only the following flag is patched, the document is not rewritten
+    mock_user_service.patch_friend_async.assert_awaited_once_with(
+        steam_id_to_account_id(int(test_steam_id)), friend_account_id, {"following": False}
+    )
+    mock_user_service.update_friend_async.assert_not_awaited()
+    mock_follower_index.set_following.assert_awaited_once_with(
+        steam_id_to_account_id(int(test_steam_id)), friend_account_id, False, 1700000000
+    )
+
+
+def test_unfollow_friend_succeeds_when_follower_index_fails():
+    """The unfollow is stored, so a Redis failure is left for data-sync to apply"""
+    app = FastAPI()
+    app.include_router(friends.router)
+
+    test_steam_id = "76561198012345678"
+    friend_account_id = steam_id_to_account_id(76561198111111111)
+
+    async def mock_get_current_user():
+        return test_steam_id
+
+    mock_user_service = MagicMock()
+    mock_user_service.patch_friend_async = AsyncMock(
+        return_value=Friend(id=str(friend_account_id), user_id=steam_id_to_account_id(int(test_steam_id)), following=False)
+    )
+
+    async def mock_get_user_service():
+        return mock_user_service
+
+    app.dependency_overrides[friends.get_current_user] = mock_get_current_user
+    app.dependency_overrides[get_user_service] = mock_get_user_service
+    mock_follower_index = override_follower_index(app, AsyncMock(side_effect=ConnectionError("redis down")))
+
+    client = TestClient(app)
+
+    response = client.post("/unfollow/76561198111111111", follow_redirects=False)
+
+    assert response.status_code == 303
+    mock_follower_index.set_following.assert_awaited_once()
 
 
 def test_follow_self():
@@ -249,7 +350,7 @@ def test_follow_self():
         name="TestUser",
         following=False
     )
-    mock_user_service.get_user_with_steam_id_async = AsyncMock(return_value=existing_user)
+    mock_user_service.patch_user_async = AsyncMock(return_value=existing_user.model_copy(update={"following": True, "ts": 1700000000}))
     mock_user_service.update_user_async = AsyncMock()
 
     async def mock_get_user_service():
@@ -258,6 +359,7 @@ def test_follow_self():
     app.dependency_overrides[friends.get_current_user] = mock_get_current_user
     app.dependency_overrides[get_user_service] = mock_get_user_service
     app.dependency_overrides[get_steam_client] = lambda: MagicMock()
+    mock_follower_index = override_follower_index(app)
 
     client = TestClient(app)
 
@@ -266,10 +368,9 @@ def test_follow_self():
     assert response.status_code == 303
     assert response.headers["location"] == "/"
 
-    mock_user_service.update_user_async.assert_awaited_once()
-    updated_user = mock_user_service.update_user_async.call_args[0][0]
-    assert updated_user.user_id == test_account_id
-    assert updated_user.following is True
+    mock_user_service.patch_user_async.assert_awaited_once_with(test_account_id, {"following": True})
+    mock_user_service.update_user_async.assert_not_awaited()
+    mock_follower_index.set_following.assert_awaited_once_with(test_account_id, test_account_id, True, 1700000000)
 
 
 def test_unfollow_self():
@@ -290,7 +391,7 @@ def test_unfollow_self():
         name="TestUser",
         following=True
     )
-    mock_user_service.get_user_with_steam_id_async = AsyncMock(return_value=existing_user)
+    mock_user_service.patch_user_async = AsyncMock(return_value=existing_user.model_copy(update={"following": False, "ts": 1700000000}))
     mock_user_service.update_user_async = AsyncMock()
 
     async def mock_get_user_service():
@@ -298,6 +399,7 @@ def test_unfollow_self():
 
     app.dependency_overrides[friends.get_current_user] = mock_get_current_user
     app.dependency_overrides[get_user_service] = mock_get_user_service
+    mock_follower_index = override_follower_index(app)
 
     client = TestClient(app)
 
@@ -306,7 +408,43 @@ def test_unfollow_self():
     assert response.status_code == 303
     assert response.headers["location"] == "/"
 
-    mock_user_service.update_user_async.assert_awaited_once()
-    updated_user = mock_user_service.update_user_async.call_args[0][0]
-    assert updated_user.user_id == test_account_id
-    assert updated_user.following is False
+    mock_user_service.patch_user_async.assert_awaited_once_with(test_account_id, {"following": False})
+    mock_user_service.update_user_async.assert_not_awaited()
+    mock_follower_index.set_following.assert_awaited_once_with(test_account_id, test_account_id, False, 1700000000)
+
+
+def test_follow_friend_asks_to_retry_when_the_budget_is_exhausted():
+    """Test that following a friend redirects with a message, and stores nothing, when the Steam API budget is exhausted"""
+    app = FastAPI()
+    app.include_router(friends.router)
+
+    test_steam_id = "76561198012345678"
+    friend_steam_id = "76561198111111111"
+
+    async def mock_get_current_user():
+        return test_steam_id
+
+    mock_user_service = MagicMock()
+    mock_user_service.patch_friend_async = AsyncMock()
+
+    async def mock_get_user_service():
+        return mock_user_service
+
+    mock_steam_client = MagicMock()
+    mock_steam_client.get_player_summaries = AsyncMock(side_effect=SteamBudgetExceededError(SteamCallPriority.INTERACTIVE))
+
+    async def mock_get_steam_client():
+        return mock_steam_client
+
+    app.dependency_overrides[friends.get_current_user] = mock_get_current_user
+    app.dependency_overrides[get_user_service] = mock_get_user_service
+    app.dependency_overrides[get_steam_client] = mock_get_steam_client
+    override_follower_index(app)
+
+    client = TestClient(app)
+    response = client.post(f"/follow/{friend_steam_id}", follow_redirects=False)
+
+    assert response.status_code == 303
+    assert response.headers["location"] == "/"
+    assert friends.STEAM_BUSY_MESSAGE in response.headers["set-cookie"]
+    mock_user_service.patch_friend_async.assert_not_awaited()
@@ -2,11 +2,12 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
+from dota2_notify.clients.steam_rate_limiter import SteamBudgetExceededError, SteamCallPriority
 from dota2_notify.models.user import User
 from dota2_notify.app.config import Settings
 from dota2_notify.web.notifications import router
 from dota2_notify.web import static
-from dota2_notify.web.dependencies import get_user_service
+from dota2_notify.web.dependencies import get_token_store, get_user_service
 from dota2_notify.app.config import get_settings
 from dota2_notify.web.auth import get_current_user
 
@@ -32,12 +33,20 @@ def client_with_mocks():
     mock_user_service.get_user_id_by_telegram_token_async = AsyncMock()
     mock_user_service.create_telegram_verify_token_async = AsyncMock()
     mock_user_service.update_user_async = AsyncMock()
+    mock_user_service.patch_user_async = AsyncMock()
 
     async def mock_get_user_service():
         return mock_user_service
         
     app.dependency_overrides[get_user_service] = mock_get_user_service
 
+    # Mock the Telegram token store and attach to app state
+    mock_token_store = MagicMock()
+    mock_token_store.get_or_create = AsyncMock()
+    mock_token_store.create = AsyncMock()
+    mock_token_store.consume = AsyncMock(return_value=None)
+    app.state.telegram_token_store = mock_token_store
+
     # Mock settings
     def get_test_settings():
         return Settings(
@@ -83,7 +92,7 @@ async def test_get_notifications_unverified_user_shows_token(client_with_mocks):
     })
     
     mock_user_service.get_user_async.return_value = unverified_user
-    mock_user_service.get_user_id_by_telegram_token_async.return_value = test_account_id
+    client.app.state.telegram_token_store.get_or_create.return_value = test_token
     
     # Make request to the endpoint
     response = client.get("/notifications")
@@ -103,9 +112,28 @@ async def test_get_notifications_unverified_user_shows_token(client_with_mocks):
     assert "Your Telegram account is not connected." in response_text
 
 
+
+@pytest.mark.asyncio
+async def test_get_notifications_renders_without_the_player_summary_when_the_budget_is_exhausted(client_with_mocks):
+    """Test that get_notifications still renders when the Steam API budget is exhausted."""
+    client, mock_user_service, _ = client_with_mocks
+
+    mock_user_service.get_user_async.return_value = User.model_validate({
+        "user_id": 52079950,
+        "id": "52079950",
+        "name": "TestUser",
+        "telegram_chat_id": "12345"
+    })
+    client.app.state.steam_client.get_player_summaries.side_effect = SteamBudgetExceededError(SteamCallPriority.INTERACTIVE)
+
+    response = client.get("/notifications")
+
+    assert response.status_code == 200
+    assert "Your account is verified!" in response.text
+
 @pytest.mark.asyncio
 async def test_get_notifications_unverified_user_regenerates_token(client_with_mocks):
-    """Test that get_notifications regenerates a token if the existing one is invalid."""
+    """Test that get_notifications shows the token from the token store, not the one stored on the user."""
     client, mock_user_service, _ = client_with_mocks
     
     test_account_id = 52079950
@@ -121,9 +149,8 @@ async def test_get_notifications_unverified_user_regenerates_token(client_with_m
     })
     
     mock_user_service.get_user_async.return_value = unverified_user
-    # Simulate that the old token is invalid
-    mock_user_service.get_user_id_by_telegram_token_async.return_value = None
-    mock_user_service.create_telegram_verify_token_async.return_value = new_token
+    mock_token_store = client.app.state.telegram_token_store
+    mock_token_store.get_or_create.return_value = new_token
 
     # Make request to the endpoint
     response = client.get("/notifications")
@@ -136,10 +163,10 @@ async def test_get_notifications_unverified_user_regenerates_token(client_with_m
     assert new_token in response_text
     assert old_token not in response_text
     
-    # Verify that the token was regenerated and the user updated
-    mock_user_service.get_user_id_by_telegram_token_async.assert_called_once_with(old_token)
-    mock_user_service.create_telegram_verify_token_async.assert_called_once_with(test_account_id)
-    mock_user_service.update_user_async.assert_called_once()
+    # Verify that the token came from the token store and the user was not updated
+    mock_token_store.get_or_create.assert_called_once_with(test_account_id)
+    mock_user_service.create_telegram_verify_token_async.assert_not_called()
+    mock_user_service.patch_user_async.assert_not_called()
     
     # Check that instructions are present
     assert "Open Telegram and search for the bot" in response_text
@@ -149,7 +176,7 @@ async def test_get_notifications_unverified_user_regenerates_token(client_with_m
 
 @pytest.mark.asyncio
 async def test_reset_telegram_connection_happy_path(client_with_mocks):
-    """Test that reset clears the chat id, generates a new token, updates the user and redirects."""
+    """Test that reset clears the chat id, issues a new token and redirects."""
     client, mock_user_service, _ = client_with_mocks
 
     test_account_id = 52079950
@@ -163,19 +190,18 @@ async def test_reset_telegram_connection_happy_path(client_with_mocks):
         "telegram_verify_token": "OLD_TOKEN"
     })
 
-    mock_user_service.get_user_async.return_value = existing_user
-    mock_user_service.create_telegram_verify_token_async.return_value = new_token
+    mock_user_service.patch_user_async.return_value = existing_user
+    mock_token_store = client.app.state.telegram_token_store
+    mock_token_store.create.return_value = new_token
 
     response = client.post("/notifications/reset", follow_redirects=False)
 
     assert response.status_code == 303
     assert response.headers["location"] == "/notifications"
 
-    assert existing_user.telegram_chat_id == ""
-    assert existing_user.telegram_verify_token == new_token
-
-    mock_user_service.create_telegram_verify_token_async.assert_called_once_with(test_account_id)
-    mock_user_service.update_user_async.assert_called_once_with(existing_user)
+    mock_token_store.create.assert_called_once_with(test_account_id)
+    mock_user_service.patch_user_async.assert_called_once_with(test_account_id, {"telegram_chat_id": ""})
+    mock_user_service.update_user_async.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -245,8 +271,12 @@ def test_telegram_webhook_invalid_secret_returns_401():
     async def mock_get_user_service():
         return MagicMock()
 
+    async def mock_get_token_store():
+        return MagicMock()
+
     app.dependency_overrides[get_settings] = get_test_settings
     app.dependency_overrides[get_user_service] = mock_get_user_service
+    app.dependency_overrides[get_token_store] = mock_get_token_store
 
     client = TestClient(app)
     payload = {"update_id": 1}
@@ -274,8 +304,9 @@ async def test_telegram_webhook_happy_path_updates_user(client_with_mocks):
         "telegram_verify_token": verify_token
     })
 
-    mock_user_service.get_user_id_by_telegram_token_async.return_value = test_account_id
-    mock_user_service.get_user_async.return_value = user
+    mock_token_store = client.app.state.telegram_token_store
+    mock_token_store.consume.return_value = test_account_id
+    mock_user_service.patch_user_async.return_value = user
     mock_user_service.delete_telegram_verify_token_async = AsyncMock()
 
     payload = {
@@ -294,13 +325,43 @@ async def test_telegram_webhook_happy_path_updates_user(client_with_mocks):
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
-    assert user.telegram_chat_id == str(chat_id)
-    assert user.telegram_username == username
-    assert user.telegram_verify_token == ""
+    mock_token_store.consume.assert_called_once_with(verify_token)
+    mock_user_service.get_user_id_by_telegram_token_async.assert_not_called()
+    mock_user_service.patch_user_async.assert_called_once_with(test_account_id, {
+        "telegram_chat_id": str(chat_id),
+        "telegram_username": username,
+        "telegram_verify_token": ""
+    })
+    mock_user_service.delete_telegram_verify_token_async.assert_not_called()
+
 
+@pytest.mark.asyncio
+async def test_telegram_webhook_accepts_legacy_database_token(client_with_mocks):
+    """Test that a token issued before the move to Redis is still accepted and then deleted."""
+    client, mock_user_service, _ = client_with_mocks
+
+    test_account_id = 52079950
+    verify_token = "LEGACY_TOKEN"
+
+    mock_user_service.get_user_id_by_telegram_token_async.return_value = test_account_id
+    mock_user_service.patch_user_async.return_value = MagicMock()
+    mock_user_service.delete_telegram_verify_token_async = AsyncMock()
+
+    payload = {
+        "update_id": 42,
+        "message": {
+            "message_id": 1,
+            "chat": {"id": 111222333, "type": "private"},
+            "date": 1700000000,
+            "text": f"/start {verify_token}"
+        }
+    }
+
+    response = client.post("/notifications/telegram-webhook/74ad1s_fake", json=payload)
+
+    assert response.status_code == 200
+    client.app.state.telegram_token_store.consume.assert_called_once_with(verify_token)
     mock_user_service.get_user_id_by_telegram_token_async.assert_called_once_with(verify_token)
-    mock_user_service.get_user_async.assert_called_once_with(test_account_id)
-    mock_user_service.update_user_async.assert_called_once_with(user)
     mock_user_service.delete_telegram_verify_token_async.assert_called_once_with(verify_token)
 
 
@@ -315,8 +376,12 @@ def test_get_notifications_unauthenticated_redirects_to_home():
     async def mock_get_user_service():
         return MagicMock()
 
+    async def mock_get_token_store():
+        return MagicMock()
+
     app.dependency_overrides[get_current_user] = mock_get_current_user
     app.dependency_overrides[get_user_service] = mock_get_user_service
+    app.dependency_overrides[get_token_store] = mock_get_token_store
 
     client = TestClient(app)
     response = client.get("/notifications/", follow_redirects=False)